@@ -1,5 +1,3 @@
-
-
 const blobToArrayBuffer = async (blob: Blob): Promise<ArrayBuffer> => {
     return new Promise((resolve, reject) => {
         const reader = new FileReader();
@@ -9,4 +7,24 @@ const blobToArrayBuffer = async (blob: Blob): Promise<ArrayBuffer> => {
     });
 }
 
-export { blobToArrayBuffer }
\ No newline at end of file
+const float16ToFloat32Array = (buffer: ArrayBuffer): Float32Array => {
+    // 小端 float16 -> float32
+    const view = new DataView(buffer);
+    const result = new Float32Array(buffer.byteLength / 2);
+    for (let i = 0; i < result.length; i++) {
+        const half = view.getUint16(i * 2, true);
+        const sign = half & 0x8000 ? -1 : 1;
+        const exponent = (half >> 10) & 0x1f;
+        const fraction = half & 0x03ff;
+        if (exponent === 0) {
+            result[i] = sign * Math.pow(2, -14) * (fraction / 1024);
+        } else if (exponent === 0x1f) {
+            result[i] = fraction ? NaN : sign * Infinity;
+        } else {
+            result[i] = sign * Math.pow(2, exponent - 15) * (1 + fraction / 1024);
+        }
+    }
+    return result;
+}
+
+export { blobToArrayBuffer, float16ToFloat32Array }
@@ -0,0 +1,229 @@
+import asyncio
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Hashable, NamedTuple, Optional, Tuple
+
+# 不影响问题含义的客套话、语气词和虚词；否定词 (不、没有、不是、不用...) 和疑问词 (为什么、怎么...) 会改变含义，不在其中
+_FILLERS = frozenset(
+    "老师 请问 请 问 问一下 想 想问 我 我们 一下 那 那么 这个 那个 的 地 得 了 是 有 和 与 能 可以 会 什么 呢 嘛 啊 呀 吧 么 "
+    "a an the is are what please".split()
+)
+
+# 疑问词，两个问题的疑问词必须相同
+_QUESTION_WORDS = frozenset("为什么 为何 怎么 怎样 怎么样 如何 哪 哪些 哪个 哪里 哪儿 多少 几 谁 何时 why how which where when who".split())
+# 是非问: "吗"、"是否" 和 "能不能"、"有没有" 等正反问视为同一种问法
+_YES_NO_WORDS = frozenset("吗 是否 能否 可否 是不是 能不能 会不会 要不要 有没有 可不可以".split())
+_YES_NO = "是否"
+# 正反问 "A不A"、"A没A"，分词前替换为 "是否"，否则会被分为 "能" 和 "不能"
+_A_NOT_A_PATTERN = re.compile(r"可不可以|(\w)[不没]\1")
+# 否定词，两个问题的否定词必须相同
+_NEGATION_PATTERN = re.compile(r"^(不|没|未|无|别|勿|非$)|^(not|no|don't|doesn't|isn't|can't)$")
+
+_WORD_PATTERN = re.compile(r"\w")
+
+
+class QuestionKey(NamedTuple):
+    """问题的键: 有实际含义的词，以及必须相同的否定词和疑问词"""
+
+    tokens: Tuple[str, ...]  # 按出现顺序排列，不含客套话、语气词和标点
+    guards: FrozenSet[str]  # 否定词和疑问词
+    words: FrozenSet[str]  # 内容词 (不含 guards)，用于近似匹配调换了顺序的问题
+    bigrams: FrozenSet[str]  # 内容词连接后的相邻两字，用于近似匹配换了说法的问题
+
+
+def question_key(
+    question: str,
+) -> QuestionKey:
+    """
+    计算问题的键，在线程中调用 (jieba 分词)。
+
+    统一全角半角和大小写，去掉标点、客套话和语气词，例如 "老师，什么是快速开发呢？" 和 "快速开发是什么"
+    的 tokens 都为 ("快速", "开发")；"为什么要用" 和 "为什么不用" 的否定词不同。
+    """
+    # jieba 导入时会加载分词模型 (~1s)，推迟到第一次使用
+    import jieba
+
+    text = _A_NOT_A_PATTERN.sub(f" {_YES_NO} ", unicodedata.normalize("NFKC", question).lower())
+    tokens, guards, content = [], set(), []
+    for token in jieba.lcut(text):
+        token = token.strip()
+        if not _WORD_PATTERN.search(token):
+            continue
+        if token in _YES_NO_WORDS:
+            guards.add(_YES_NO)
+            continue
+        if token in _FILLERS:
+            continue
+        tokens.append(token)
+        if token in _QUESTION_WORDS or _NEGATION_PATTERN.match(token):
+            guards.add(token)
+        else:
+            content.append(token)
+    text = "".join(content)
+    bigrams = frozenset(text[i : i + 2] for i in range(len(text) - 1)) or frozenset([text])
+    return QuestionKey(tuple(tokens), frozenset(guards), frozenset(content), bigrams)
+
+
+def question_similarity(
+    a: QuestionKey,
+    b: QuestionKey,
+) -> float:
+    """两个问题的相似度: 否定词和疑问词不同时为 0，否则为内容词集合与内容词相邻两字集合的 Jaccard 相似度中较大的一个"""
+    if a.guards != b.guards:
+        return 0.0
+    if a.tokens == b.tokens:
+        return 1.0
+    return max(
+        len(a.words & b.words) / len(a.words | b.words) if a.words | b.words else 0.0,
+        len(a.bigrams & b.bigrams) / len(a.bigrams | b.bigrams),
+    )
+
+
+class _Entry:
+    __slots__ = ("key", "value", "expires")
+
+    def __init__(
+        self,
+        key: QuestionKey,
+        value: Any,
+        expires: float,
+    ):
+        self.key = key
+        self.value = value
+        self.expires = expires
+
+
+class AnswerCache:
+    """一份课件的问题回答缓存，保存已经合成好的回答，重复的问题不再请求LLM和TTS
+
+    先按 (页码, 问题的词) 精确查找；未命中时与同一页的问题比较，相似度不低于 threshold 的视为同一个问题
+    (换了说法、调换了顺序或多一个词)。否定词和疑问词不同的问题不会匹配，没有实际含义的词的问题 (例如 "？？") 不缓存。
+    条目在 ttl 秒后过期，超过 max_entries 条时淘汰最久未使用的条目。
+    同一个问题并发请求时只生成一次。分词在线程中进行，每次调用只分词一次。
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600.0,
+        max_entries: int = 256,
+        threshold: float = 0.65,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        # {(页码, 问题的词): 条目}，按使用顺序排列
+        self._entries: "OrderedDict[Tuple[Hashable, Tuple[str, ...]], _Entry]" = OrderedDict()
+        # 正在生成的回答 {(页码, 问题的词): (问题的键, Future)}
+        self._inflight: Dict[Tuple[Hashable, Tuple[str, ...]], Tuple[QuestionKey, asyncio.Future]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _similar(
+        self,
+        slide: Hashable,
+        key: QuestionKey,
+        candidates: Dict[Tuple[Hashable, Tuple[str, ...]], QuestionKey],
+    ) -> Optional[Tuple[Hashable, Tuple[str, ...]]]:
+        """在 candidates 中找到同一页中与问题最相似的一个，精确匹配优先"""
+        if (slide, key.tokens) in candidates:
+            return slide, key.tokens
+        best, best_similarity = None, self.threshold
+        for (candidate_slide, tokens), candidate in candidates.items():
+            if candidate_slide != slide:
+                continue
+            similarity = question_similarity(key, candidate)
+            if similarity >= best_similarity:
+                best, best_similarity = (candidate_slide, tokens), similarity
+        return best
+
+    def _lookup(
+        self,
+        slide: Hashable,
+        key: QuestionKey,
+    ) -> Optional[Any]:
+        if not key.tokens:
+            return None
+        now = time.monotonic()
+        for expired in [k for k, entry in self._entries.items() if entry.expires <= now]:
+            del self._entries[expired]
+        found = self._similar(slide, key, {k: entry.key for k, entry in self._entries.items()})
+        if found is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(found)
+        self.hits += 1
+        return self._entries[found].value
+
+    def _store(
+        self,
+        slide: Hashable,
+        key: QuestionKey,
+        value: Any,
+        ttl: Optional[float] = None,
+    ):
+        if not key.tokens:
+            return
+        entry_key = (slide, key.tokens)
+        self._entries[entry_key] = _Entry(key, value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._entries.move_to_end(entry_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(
+        self,
+        slide: Hashable,
+        question: str,
+    ) -> Optional[Any]:
+        """查找同一页中相同或相似的问题的回答，没有时返回 None"""
+        return self._lookup(slide, await asyncio.to_thread(question_key, question))
+
+    async def put(
+        self,
+        slide: Hashable,
+        question: str,
+        value: Any,
+        ttl: Optional[float] = None,
+    ):
+        """ttl 为 None 时使用默认的过期时间"""
+        self._store(slide, await asyncio.to_thread(question_key, question), value, ttl)
+
+    async def get_or_create(
+        self,
+        slide: Hashable,
+        question: str,
+        create: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        返回缓存的回答；没有时调用 create 生成并缓存。
+
+        相同或相似的问题正在生成时等待同一个结果；单个等待者取消不会取消生成，生成失败时不缓存。
+        """
+        key = await asyncio.to_thread(question_key, question)
+        if not key.tokens:
+            return await create()
+
+        value = self._lookup(slide, key)
+        if value is not None:
+            return value
+
+        found = self._similar(slide, key, {k: inflight_key for k, (inflight_key, _) in self._inflight.items()})
+        if found is not None:
+            future = self._inflight[found][1]
+        else:
+            inflight = (slide, key.tokens)
+
+            async def produce():
+                try:
+                    value = await create()
+                    self._store(slide, key, value)
+                    return value
+                finally:
+                    del self._inflight[inflight]
+
+            future = asyncio.ensure_future(produce())
+            self._inflight[inflight] = (key, future)
+            # 取出异常，所有等待者都已取消时也不会警告 "exception was never retrieved"
+            future.add_done_callback(lambda future: future.cancelled() or future.exception())
+        return await asyncio.shield(future)
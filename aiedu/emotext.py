@@ -1,22 +1,33 @@
 import os
 
 
+import bisect
 import csv
+import hashlib
+import mmap
+import multiprocessing
 import os.path
-import pickle
 import itertools
-from collections import namedtuple, OrderedDict
+import struct
+import threading
+from array import array
+from collections import deque, namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
 import sys
-from typing import Dict, Iterable, List, IO, Optional
+from typing import Dict, Iterable, Iterator, List, IO, Literal, Optional, Protocol, Sequence, Tuple
 
-import jieba
-import jieba.analyse
+import numpy as np
+
+from aiedu.utils.ssml import SENTENCE_PATTERN
 
 
 DICT_FILE_NAME = "dict.csv"
-PKL_FILE_NAME = "words.pkl"
+LEXICON_FILE_NAME = "words.bin"
+
+# 情感分析的方式: jieba 关键词 / 全文扫描
+EmotionMode = Literal["keywords", "scan"]
 
 
 # 情感分类: 7 大类, 21 小类
@@ -112,6 +123,246 @@ class _Word:
         return _Word(word, emotion, intensity, _PolarityEnum(polarity))
 
 
+def _file_sha256(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+class _Lexicon:
+    """紧凑的情感词典，由 dict.csv 编译而来，可以直接 mmap 读取。
+
+    文件格式 (小端):
+
+        header:   magic(8s) version(I) dict_sha256(32s) n_words(I) n_entries(I) words_size(I)，补齐到 64 字节
+        offsets:  uint32 * (n_words + 1)    第 i 个词的 Word 为 entries[offsets[i]:offsets[i + 1]]
+        emotions: uint8 * n_entries         _emotions 中的下标
+        intensity: uint8 * n_entries
+        polarity: uint8 * n_entries
+        words:    utf-8, 以 "\\n" 分隔的词表，每个词只存一次
+
+    每个词的 Word 与逐个情感列表线性查找的结果一致: 按情感顺序，
+    每个情感列表中只取该词第一次出现的 Word。
+    """
+
+    MAGIC = b"EMOTEXT\0"
+    VERSION = 1
+    HEADER = struct.Struct("<8sI32sIII")
+    HEADER_SIZE = 64
+
+    def __init__(
+        self,
+        words: List[str],
+        offsets: Iterable[int],
+        emotions: Iterable[int],
+        intensities: Iterable[int],
+        polarities: Iterable[int],
+        dict_hash: Optional[bytes] = None,
+    ):
+        self.words = words
+        self.word_ids = {word: i for i, word in enumerate(words)}
+        self.offsets = offsets
+        self.emotions = emotions
+        self.intensities = intensities
+        self.polarities = polarities
+        self.dict_hash = dict_hash or bytes(32)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.words)
+
+    @staticmethod
+    def from_words(
+        words_of_emotions: Dict[str, List[_Word]],
+        dict_hash: Optional[bytes] = None,
+    ) -> "_Lexicon":
+        """由 {"emotion": [words...]} 构建"""
+        entries: Dict[str, List[_Word]] = {}
+        for emotion, words_of_emotion in words_of_emotions.items():
+            seen = set()
+            for word in words_of_emotion:
+                if word.word in seen:
+                    continue
+                seen.add(word.word)
+                entries.setdefault(word.word, []).append(word)
+
+        words = list(entries)
+        offsets, emotions, intensities, polarities = array("I", [0]), array("B"), array("B"), array("B")
+        for word in words:
+            for w in entries[word]:
+                emotions.append(_emotions.index(w.emotion))
+                intensities.append(w.intensity)
+                polarities.append(w.polarity.value)
+            offsets.append(len(emotions))
+
+        return _Lexicon(words, offsets, emotions, intensities, polarities, dict_hash=dict_hash)
+
+    @staticmethod
+    def load(
+        path: str,
+        dict_hash: Optional[bytes] = None,
+    ) -> Optional["_Lexicon"]:
+        """mmap 读取词典文件
+
+        :param dict_hash: dict.csv 的 sha256，与文件中的不一致时视为过期
+        :return: 词典，文件不存在、格式不对或过期时返回 None
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            magic, version, file_hash, n_words, n_entries, words_size = _Lexicon.HEADER.unpack_from(buffer)
+        except Exception as e:
+            print(f"Failed to read lexicon file: {e}")
+            return None
+        if magic != _Lexicon.MAGIC or version != _Lexicon.VERSION:
+            return None
+        if dict_hash is not None and file_hash != dict_hash:
+            return None
+
+        start = _Lexicon.HEADER_SIZE
+        offsets = buffer[start : start + 4 * (n_words + 1)].cast("I")
+        start += 4 * (n_words + 1)
+        emotions = buffer[start : start + n_entries]
+        start += n_entries
+        intensities = buffer[start : start + n_entries]
+        start += n_entries
+        polarities = buffer[start : start + n_entries]
+        start += n_entries
+        words = str(buffer[start : start + words_size], encoding="utf-8").split("\n")
+
+        return _Lexicon(words, offsets, emotions, intensities, polarities, dict_hash=file_hash)
+
+    def save(
+        self,
+        path: str,
+    ):
+        """写入词典文件"""
+        words = "\n".join(self.words).encode("utf-8")
+        header = _Lexicon.HEADER.pack(
+            _Lexicon.MAGIC,
+            _Lexicon.VERSION,
+            self.dict_hash,
+            len(self.words),
+            len(self.emotions),
+            len(words),
+        )
+        with open(path, "wb") as f:
+            f.write(header.ljust(_Lexicon.HEADER_SIZE, b"\0"))
+            f.write(array("I", self.offsets).tobytes())
+            f.write(bytes(self.emotions))
+            f.write(bytes(self.intensities))
+            f.write(bytes(self.polarities))
+            f.write(words)
+
+    def find(
+        self,
+        w: str,
+    ) -> List[_Word]:
+        """找词 w 对应的 Word 们，找不到返回 []"""
+        i = self.word_ids.get(w)
+        if i is None:
+            return []
+        return [
+            _Word(w, _emotions[self.emotions[j]], self.intensities[j], _PolarityEnum(self.polarities[j]))
+            for j in range(self.offsets[i], self.offsets[i + 1])
+        ]
+
+
+class _Automaton:
+    """由词典构建的 Aho–Corasick 自动机，单遍扫描全文，找出所有情感词。
+
+    匹配采用最左最长、互不重叠的方式，避免 "高兴" 同时被计为 "高兴" 和 "兴"。
+    """
+
+    def __init__(
+        self,
+        lexicon: _Lexicon,
+    ):
+        self.words = lexicon.words
+        # 状态 0 为根
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # 到达该状态时正好读完的词: (词下标, 词长)，没有为 None
+        self.word: List[Optional[tuple]] = [None]
+        # 沿失败指针找到的下一个正好是词的状态 (字典后缀链接)，没有为 0
+        self.output: List[int] = [0]
+
+        for i, word in enumerate(self.words):
+            if not word:
+                continue
+            state = 0
+            for ch in word:
+                next_state = self.goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][ch] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.word.append(None)
+                    self.output.append(0)
+                state = next_state
+            self.word[state] = (i, len(word))
+
+        # 广度优先建立失败指针
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and ch not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.fail[next_state] = self.goto[fail].get(ch, 0)
+                self.output[next_state] = fail if self.word[fail] is not None else self.output[fail]
+
+    def matches(
+        self,
+        text: str,
+    ) -> List[tuple]:
+        """扫描 text
+
+        :return: 最左最长、互不重叠的匹配: [(起始下标, 词下标)]
+        """
+        goto, fail, word, output = self.goto, self.fail, self.word, self.output
+
+        # 所有的匹配: 每个结束位置上，当前状态的词和沿字典后缀链接找到的所有更短的词
+        candidates = []
+        state = 0
+        for end, ch in enumerate(text, 1):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            match_state = state if word[state] is not None else output[state]
+            while match_state:
+                i, length = word[match_state]
+                candidates.append((end - length, -length, i))
+                match_state = output[match_state]
+        # 按起始位置、再按长度从长到短，依次取不与已选的重叠的
+        candidates.sort()
+
+        result = []
+        last_end = 0
+        for start, length, i in candidates:
+            if start >= last_end:
+                result.append((start, i))
+                last_end = start - length
+        return result
+
+    def count(
+        self,
+        text: str,
+    ) -> Dict[str, int]:
+        """扫描 text，返回 {词: 出现次数}"""
+        counts: Dict[str, int] = {}
+        for _, i in self.matches(text):
+            word = self.words[i]
+            counts[word] = counts.get(word, 0) + 1
+        return counts
+
+
 class _EmotionCountResult:
     """一个情感分析的结果
 
@@ -225,6 +476,34 @@ def va_component_sum(values: Iterable[float], weights: Optional[Iterable[float]]
     return sum_v
 
 
+def emotions_va_batch(emotions: np.ndarray) -> np.ndarray:
+    """_EmotionCountResult.emotions_va 的向量化版本，一次计算多段文本的 valence-arousal 值。
+
+    :param emotions: shape (n, 21)，每行是按 _emotions 顺序排列的 出现次数*情感强度
+    :return: shape (n, 2)，每行是 [valence, arousal]
+    """
+    emotions = np.asarray(emotions, dtype=np.float64).reshape(-1, len(_emotions))
+    va_space = np.array([_va_space[emo] for emo in _emotions], dtype=np.float64)
+
+    # sort by intensity，与 list.sort 一样保持稳定
+    order = np.argsort(emotions, axis=1, kind="stable")
+    intensities = np.take_along_axis(emotions, order, axis=1)
+    # 逐个累加，与标量版本的求和顺序一致
+    sum_intensity = np.cumsum(intensities, axis=1)[:, -1:]
+    empty = sum_intensity[:, 0] == 0
+
+    # 取出强度贡献前 50% 的情感: 累加到它之前的占比还没超过 50%
+    percents = intensities / np.where(empty, 1, sum_intensity[:, 0])[:, None]
+    sum_percents = np.cumsum(percents, axis=1) - percents
+    selected = (intensities != 0) & (sum_percents <= 0.5)
+
+    # 矢量和，见 va_component_sum
+    components = np.where(selected[:, :, None], va_space[order] - 0.5, 0)
+    va = np.clip(np.cumsum(components, axis=1)[:, -1] + 0.5, 0.0, 1.0)
+    va[empty] = 0.5
+    return va
+
+
 class _EmoText:
     """该类使用大连理工大学七大类情绪词典作为情绪分析的情绪词库，对文本进行细粒度情感分析。
 
@@ -280,24 +559,32 @@ class _EmoText:
     """
 
     def __init__(self):
-        self.pkl_path = os.path.join(os.path.dirname(__file__), "resources", "emotext", PKL_FILE_NAME)
         self.dict_path = os.path.join(os.path.dirname(__file__), "resources", "emotext", DICT_FILE_NAME)
-        # self.pkl_path = pathlib.Path(__file__).parent.joinpath(PKL_FILE_NAME)
-        # self.dict_path = pathlib.Path(__file__).parent.joinpath(DICT_FILE_NAME)
-
-        self.words = {}  # {"emotion": [words...]}
-        if not self._words_from_pkl():
-            print(f"[emotext] pkl file unavailable, loading words from {self.dict_path}...", file=sys.stderr)
-            self._words_from_dict()
-            self._save_words_pkl()
-            print(f"[emotext] words loaded from {self.dict_path} -> {self.pkl_path}", file=sys.stderr)
-
-    def _words_from_dict(self):
-        self.words = {emo: [] for emo in _emotions}
+        self.lexicon_path = os.path.join(os.path.dirname(__file__), "resources", "emotext", LEXICON_FILE_NAME)
+
+        dict_hash = _file_sha256(self.dict_path) if os.path.exists(self.dict_path) else None
+
+        self.lexicon = _Lexicon.load(self.lexicon_path, dict_hash=dict_hash)
+        if self.lexicon is None:
+            print(f"[emotext] lexicon file unavailable or stale, loading words from {self.dict_path}...", file=sys.stderr)
+            self.lexicon = _Lexicon.from_words(self._words_from_dict(), dict_hash=dict_hash)
+            self.lexicon.save(self.lexicon_path)
+            print(f"[emotext] words loaded from {self.dict_path} -> {self.lexicon_path}", file=sys.stderr)
+
+        self.automaton: Optional[_Automaton] = None
+        self._automaton_lock = threading.Lock()
+
+    def _words_from_dict(self) -> Dict[str, List[_Word]]:
+        """读 dict.csv
+
+        :return: {"emotion": [words...]}
+        """
         with open(self.dict_path, "r", encoding="utf-8") as f:
-            self._read_dict(f)
+            return self._read_dict(f)
+
+    def _read_dict(self, csvfile: IO) -> Dict[str, List[_Word]]:
+        words = {emo: [] for emo in _emotions}
 
-    def _read_dict(self, csvfile: IO):
         reader = csv.reader(csvfile)
         reader.__next__()  # skip header
 
@@ -306,61 +593,56 @@ class _EmoText:
                 r = map(lambda x: x.strip(), row)
                 r = _Word.DictRow(*r)
                 if r.emotion in _emotions:
-                    self.words[r.emotion].append(_Word.from_strs(r.word, r.emotion, r.intensity, r.polarity))
+                    words[r.emotion].append(_Word.from_strs(r.word, r.emotion, r.intensity, r.polarity))
                 if r.emotion2 and r.emotion2 in _emotions:
-                    self.words[r.emotion].append(_Word.from_strs(r.word, r.emotion2, r.intensity2, r.polarity2))
+                    words[r.emotion].append(_Word.from_strs(r.word, r.emotion2, r.intensity2, r.polarity2))
             except Exception as e:
                 print(f"Failed to parse word from dict: {row=}")
                 raise e
 
-    def _words_from_pkl(self) -> bool:
-        """Fill self.words from the pkl file by self._save_words_pkl()
-
-        XXX: pickle 不安全，但快一些: 读 dict.csv 0.9s, 读 words.pkl 0.7s
-
-        :return: True for read, or False if the pkl file does not exist.
-        """
-        if not os.path.exists(self.pkl_path):
-            return False
-        with open(self.pkl_path, "rb") as f:
-            try:
-                self._read_pkl(f)
-            except Exception as e:
-                print(f"Failed to read pkl file: {e}")
-                return False
-        return True
-
-    def _read_pkl(self, pkl_file: IO):
-        self.words = pickle.load(pkl_file)
-
-    def _save_words_pkl(self):
-        with open(self.pkl_path, "wb") as f:
-            pickle.dump(self.words, f)
+        return words
 
     def _find_word(self, w: str) -> List[_Word]:
-        """在 Emotions.words 中找 w
+        """在词典中找 w
 
         :param w: 要找的词
         :return: 找到返回对应的 Word 对象们，找不到返回 []
         """
-        result = []
-        for emotion, words_of_emotion in self.words.items():
-            ws = list(map(lambda x: x.word, words_of_emotion))
-            if w in ws:
-                result.append(words_of_emotion[ws.index(w)])
-        return result
-
-    def emotion_count(self, text) -> _EmotionCountResult:
+        return self.lexicon.find(w)
+
+    def _get_automaton(self) -> _Automaton:
+        """第一次全文扫描时才构建自动机"""
+        if self.automaton is None:
+            with self._automaton_lock:
+                if self.automaton is None:
+                    self.automaton = _Automaton(self.lexicon)
+        return self.automaton
+
+    def emotion_count(
+        self,
+        text,
+        mode: EmotionMode = "keywords",
+    ) -> _EmotionCountResult:
         """简单情感分析。计算各个情绪词 出现次数 * 强度
 
         :param text:  中文文本字符串
+        :param mode: "keywords": 取 jieba 的 TF-IDF 关键词，按权重计数;
+                     "scan": 用自动机扫描全文，按出现次数计数
         :return: 返回文本情感统计信息 EmotionCountResult
 
         """
         result = _EmotionCountResult()
 
-        # words = jieba.cut(text)
-        keywords = jieba.analyse.extract_tags(text, withWeight=True)
+        if mode == "keywords":
+            # jieba.analyse 导入时会加载分词模型 (~1s)，推迟到第一次使用
+            import jieba.analyse
+
+            # words = jieba.cut(text)
+            keywords = jieba.analyse.extract_tags(text, withWeight=True)
+        elif mode == "scan":
+            keywords = self._get_automaton().count(text).items()
+        else:
+            raise ValueError(f"Unknown emotion mode: {mode}")
 
         for word, weight in keywords:
             for w in self._find_word(word):
@@ -370,19 +652,158 @@ class _EmoText:
         return result
 
 
-_emotext = _EmoText()
+_emotext: Optional[_EmoText] = None
+_emotext_lock = threading.Lock()
 
 
-def emotion(
+def _get_emotext() -> _EmoText:
+    """第一次调用 emotion() 时才加载词典"""
+    global _emotext
+    if _emotext is None:
+        with _emotext_lock:
+            if _emotext is None:
+                _emotext = _EmoText()
+    return _emotext
+
+
+def _emotion_values(
     text: str,
+    mode: EmotionMode = "keywords",
+) -> Tuple[List[float], List[float]]:
+    """在 worker 进程中计算一段文本，只返回 emotions 和 polarity 的数值以减少进程间传输"""
+    result = _get_emotext().emotion_count(text, mode=mode)
+    return list(result.emotions.values()), list(result.polarity.values())
+
+
+def _emotion_prepare(
+    mode: EmotionMode = "keywords",
+):
+    """加载词典和 jieba (或自动机)。
+
+    作为 worker 的 initializer，每个 worker 只加载一次，词典文件通过 mmap 共享页缓存。
+    """
+    emotext = _get_emotext()
+    if mode == "scan":
+        emotext._get_automaton()
+    else:
+        import jieba.analyse
+
+        jieba.initialize()
+
+
+def _emotion_result(
+    emotions: Sequence[float],
+    polarity: Sequence[float],
+    va: Sequence[float],
 ) -> Dict:
-    result = _emotext.emotion_count(text)
-    result_emotions = {key: value for key, value in result.emotions.items() if value != 0}
-    result_polarity = {key.name: value for key, value in result.polarity.items() if value != 0}
-    va = result.emotions_va() or [0.5, 0.5]
+    result_emotions = {key: value for key, value in zip(_emotions, emotions) if value != 0}
+    result_polarity = {key.name: value for key, value in zip(_PolarityEnum, polarity) if value != 0}
     result_va = {"valence": va[0], "arousal": va[1]}
     return {
         "emotions": result_emotions,
         "polarity": result_polarity,
         "va": result_va,
     }
+
+
+def emotion(
+    text: str,
+    mode: EmotionMode = "keywords",
+) -> Dict:
+    result = _get_emotext().emotion_count(text, mode=mode)
+    va = result.emotions_va() or [0.5, 0.5]
+    return _emotion_result(result.emotions.values(), result.polarity.values(), va)
+
+
+def emotion_batch(
+    texts: Iterable[str],
+    workers: Optional[int] = None,
+    mode: EmotionMode = "keywords",
+) -> List[Dict]:
+    """批量情感分析，结果与逐个调用 emotion() 一致。
+
+    :param texts: 多段文本，例如整个课件每页的讲稿
+    :param workers: 进程数，默认为 CPU 核数，为 1 时在当前进程中计算
+    :param mode: 同 emotion()
+    :return: 与 texts 顺序一致的结果列表
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+
+    workers = min(workers or os.cpu_count() or 1, len(texts))
+
+    if workers == 1:
+        values = [_emotion_values(text, mode) for text in texts]
+    else:
+        # 服务中调用时进程里有事件循环和线程池的线程，fork 可能复制其他线程持有的锁而死锁，使用 spawn
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_emotion_prepare,
+            initargs=(mode,),
+        ) as executor:
+            chunksize = max(1, len(texts) // (workers * 4))
+            values = list(executor.map(_emotion_values, texts, itertools.repeat(mode), chunksize=chunksize))
+
+    emotions = np.array([emotions for emotions, _ in values], dtype=np.float64)
+    vas = emotions_va_batch(emotions).tolist()
+    return [_emotion_result(emotions, polarity, va) for (emotions, polarity), va in zip(values, vas)]
+
+
+class WordBoundary(Protocol):
+    """词边界，时间单位为毫秒，例如 TTS 返回的 TTSBoundary"""
+
+    offset: float
+    duration: float
+    text: str
+
+
+def emotion_timeline(
+    text: str,
+    boundaries: Iterable[WordBoundary],
+    mode: EmotionMode = "scan",
+) -> List[list]:
+    """按句计算情感，并与 TTS 的词边界对齐成时间线
+
+    :param text: 送入 TTS 的原始文本
+    :param boundaries: TTS 返回的词边界，词的文本按顺序出现在 text 中
+    :param mode: 同 emotion()，单句很短，默认全文扫描
+    :return: [[start_ms, end_ms, valence, arousal, 主要情感 或 None], ...]
+    """
+    sentences = [(m.start(), m.end()) for m in SENTENCE_PATTERN.finditer(text) if m.group().strip()]
+    starts = [start for start, _ in sentences]
+
+    # 每句的 [start_ms, end_ms]
+    spans: Dict[int, list] = {}
+    cursor = 0
+    for boundary in boundaries:
+        position = text.find(boundary.text, cursor)
+        if position < 0:
+            continue
+        cursor = position + len(boundary.text)
+        i = bisect.bisect_right(starts, position) - 1
+        if i < 0:
+            continue
+        span = spans.setdefault(i, [boundary.offset, boundary.offset + boundary.duration])
+        span[1] = boundary.offset + boundary.duration
+
+    indices = sorted(spans)
+    results = emotion_batch([text[slice(*sentences[i])] for i in indices], workers=1, mode=mode)
+
+    timeline = []
+    for i, result in zip(indices, results):
+        start, end = spans[i]
+        emotions = result["emotions"]
+        dominant = max(emotions, key=emotions.get) if emotions else None
+        timeline.append(
+            [
+                round(start),
+                round(end),
+                round(result["va"]["valence"], 3),
+                round(result["va"]["arousal"], 3),
+                dominant,
+            ]
+        )
+    return timeline
@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class LectureCache:
+    """按页缓存生成的讲稿 SSML
+
+    每页的键为 hash(模型, 提示词, 文本, 图片, 表格, 注释)，修改某一页只需重新生成这一页，
+    修改提示词或模型时所有页都会重新生成。总结和问题回答的键由模型和请求的消息决定。
+    也用于保存预先生成的各页可能的问题 (每行一个) 和回答。
+
+    文件为带版本号的 JSON，先写入临时文件再 rename；版本不符或文件损坏时视为空缓存。
+    生成期间每生成一页就可以保存一次 (async_save)，中途退出时已生成的页不会丢失。
+    """
+
+    VERSION = 1
+
+    def __init__(
+        self,
+        path: str,
+    ):
+        self.path = path
+        # {键: SSML}
+        self.entries: Dict[str, str] = {}
+        # 本次运行中用到的键，保存时可以只保留这些
+        self._used: Set[str] = set()
+        # 条目的修改次数和已写入文件的修改次数，没有新的修改时不再写入
+        self._version = 0
+        self._saved_version = 0
+        self._save_lock = asyncio.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (ValueError, UnicodeDecodeError):
+            print(f"[lecture cache] ignoring unreadable cache: {self.path}", file=sys.stderr)
+            return
+        if not isinstance(data, dict) or data.get("version") != LectureCache.VERSION:
+            print(f"[lecture cache] ignoring cache with unsupported version: {self.path}", file=sys.stderr)
+            return
+        self.entries = dict(data["entries"])
+
+    @staticmethod
+    def _hash(
+        data,
+    ) -> str:
+        return hashlib.sha256(json.dumps(data, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def slide_key(
+        content: Tuple,
+        model: str,
+        prompt: str,
+    ) -> str:
+        """content 为 pptx_content_generator 产出的一页内容 (文本, 图片, 表格, 注释)"""
+        texts, images, tables, note = content
+        return LectureCache._hash(["slide", model, prompt, texts, images, tables, note])
+
+    @staticmethod
+    def conclusion_key(
+        messages: List[Dict],
+        model: str,
+    ) -> str:
+        """messages 为请求总结的完整消息列表"""
+        return LectureCache._hash(["conclusion", model, messages])
+
+    @staticmethod
+    def questions_key(
+        ssml_lecture: str,
+        model: str,
+        prompt: str,
+    ) -> str:
+        """ssml_lecture 为一页的讲稿，prompt 为包含问题数的提示词"""
+        return LectureCache._hash(["questions", model, prompt, ssml_lecture])
+
+    @staticmethod
+    def answer_key(
+        messages: List[Dict],
+        model: str,
+    ) -> str:
+        """messages 为请求回答的完整消息列表，包含检索的上下文和问题"""
+        return LectureCache._hash(["answer", model, messages])
+
+    def get(
+        self,
+        key: str,
+    ) -> Optional[str]:
+        self._used.add(key)
+        return self.entries.get(key)
+
+    def put(
+        self,
+        key: str,
+        ssml: str,
+    ):
+        self._used.add(key)
+        self.entries[key] = ssml
+        self._version += 1
+
+    def _prune(self):
+        self.entries = {key: ssml for key, ssml in self.entries.items() if key in self._used}
+        self._version += 1
+
+    def save(
+        self,
+        prune: bool = False,
+    ):
+        """写入文件；prune 为 True 时丢弃本次运行中没有用到的条目 (例如已删除或修改过的页)"""
+        if prune:
+            self._prune()
+        self._saved_version = self._version
+        self._write(self.entries)
+
+    async def async_save(
+        self,
+        prune: bool = False,
+    ):
+        """在线程中写入文件，不阻塞事件循环
+
+        写入的是调用时的条目的副本，生成期间可以随时调用；并发调用依次写入，
+        等待期间已被之后的调用写入的修改不再重复写入。
+        """
+        if prune:
+            self._prune()
+        version = self._version
+        async with self._save_lock:
+            if self._saved_version >= version:
+                return
+            version = self._version
+            entries = dict(self.entries)
+            await asyncio.to_thread(self._write, entries)
+            self._saved_version = version
+
+    def _write(
+        self,
+        entries: Dict[str, str],
+    ):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": LectureCache.VERSION, "entries": entries}, f, ensure_ascii=False, indent=1)
+            # mkstemp 创建的文件只有所有者可读写
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
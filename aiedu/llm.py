@@ -1,11 +1,18 @@
+import asyncio
+import contextlib
 import re
-from typing import Dict, List, Tuple, Union
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, Callable, Dict, Generator, List, Optional, Tuple, Union
 
 import aisuite
 
-from aiedu.utils.decorator import retry
-from aiedu.utils.pptx import pptx_content_generator
-from aiedu.resources.prompts import PROMPT_PPTX_TO_SSMLS, PROMPT_QUESTION_TO_SSMLS
+from aiedu.lecture_cache import LectureCache
+from aiedu.utils.decorator import async_generator_retry, async_retry, retry
+from aiedu.utils.limiter import AsyncRateLimiter
+from aiedu.utils.ssml import SSMLFragmenter, ssml_to_raw_texts
+from aiedu.utils.pptx import pptx_content_generator, pptx_slides
+from aiedu.resources.prompts import PROMPT_LECTURE_TO_QUESTIONS, PROMPT_PPTX_TO_SSMLS, PROMPT_QUESTION_TO_SSMLS
 
 
 class LLMMessage:
@@ -49,11 +56,143 @@ class LLMMessage:
         }
 
 
+class LLMLectureContext:
+    """逐页生成讲稿时发送给LLM的上下文
+
+    window 为 None 时保留全部历史 (包括图片)，每页的请求随页数线性增长；
+    否则只保留最近 window 页的对话 (去掉图片)，更早的页压缩进一段滚动的纯文本摘要，
+    每页的请求大小不再随页数增长。
+    """
+
+    # 一张图片的估计 token 数
+    IMAGE_TOKENS = 765
+
+    def __init__(
+        self,
+        system: str,
+        window: Optional[int] = None,
+        summary_chars: int = 2000,
+        summary_chars_per_slide: int = 100,
+    ):
+        self.system = LLMMessage(role="system").text(system).unwrap()
+        self.window = window
+        self.summary_chars = summary_chars
+        self.summary_chars_per_slide = summary_chars_per_slide
+        # [(用户消息, 助手消息)]
+        self.history: List[Tuple[Dict, Dict]] = []
+        # 已移出窗口的页的摘要，每页一行
+        self.summary: List[str] = []
+        self.slides = 0
+        # 每页请求的估计 token 数
+        self.tokens: List[int] = []
+
+    def messages(
+        self,
+        message: Optional[Dict] = None,
+    ) -> List[Dict]:
+        """当前的上下文，message 为新一页的用户消息"""
+        messages = [self.system]
+        if self.summary:
+            summary = "### 以下是之前各页讲解的摘要 ###\n\n{}\n\n".format("\n".join(self.summary))
+            messages.append(LLMMessage(role="user").text(summary).unwrap())
+        for user, assistant in self.history:
+            messages.extend((user, assistant))
+        if message is not None:
+            messages.append(message)
+        return messages
+
+    def request(
+        self,
+        message: Dict,
+    ) -> List[Dict]:
+        """新一页的请求，并记录其估计 token 数"""
+        messages = self.messages(message)
+        self.tokens.append(llm_estimate_tokens(messages))
+        print(f"[llm] slide {self.slides + 1}: ~{self.tokens[-1]} tokens")
+        return messages
+
+    def reply(
+        self,
+        message: Dict,
+        ssml: str,
+    ):
+        """记录一页的用户消息和生成的SSML"""
+        self.slides += 1
+        assistant = LLMMessage(role="assistant").text(ssml).unwrap()
+        if self.window is None:
+            self.history.append((message, assistant))
+            return
+
+        # 历史中不保留图片
+        message = {**message, "content": [c for c in message["content"] if c["type"] != "image_url"]}
+        self.history.append((message, assistant))
+        while len(self.history) > self.window:
+            _, assistant = self.history.pop(0)
+            self._summarize(self.slides - len(self.history), assistant)
+
+    def _summarize(
+        self,
+        slide: int,
+        assistant: Dict,
+    ):
+        """把移出窗口的一页讲稿截取为一行摘要，总长度超出时丢弃最早的行"""
+        text = "".join(ssml_to_raw_texts(assistant["content"][0]["text"]))
+        self.summary.append(f"第{slide}页: {text[: self.summary_chars_per_slide]}")
+        while len(self.summary) > 1 and sum(map(len, self.summary)) > self.summary_chars:
+            self.summary.pop(0)
+
+
+def llm_estimate_tokens(
+    messages: List[Dict],
+) -> int:
+    """粗略估计消息的 token 数: 中日韩字符每字 1 个，其他字符每 4 个 1 个，图片按固定值"""
+    tokens = 0
+    for message in messages:
+        for content in message["content"]:
+            if content["type"] == "image_url":
+                tokens += LLMLectureContext.IMAGE_TOKENS
+                continue
+            text = content["text"]
+            cjk = len(re.findall(r"[\u3000-\u9fff\uff00-\uffef]", text))
+            tokens += cjk + (len(text) - cjk + 3) // 4
+    return tokens
+
+
+# 默认使用的模型
+LLM_MODEL = "openai:gpt-4o"
+# 同时进行的LLM请求数
+LLM_MAX_WORKERS = 8
+
+_client: Optional[aisuite.Client] = None
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def llm_client() -> aisuite.Client:
+    """所有请求共用的AI客户端"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = aisuite.Client()
+    return _client
+
+
+def llm_executor() -> ThreadPoolExecutor:
+    """异步接口用来执行同步请求的线程池，限制同时进行的请求数"""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix="llm")
+    return _executor
+
+
 @retry(max_retry=3)
 def llm_response(
     client: aisuite.Client,
     messages: List[Dict[str, str]],
-    model: str = "openai:gpt-4o",
+    model: str = LLM_MODEL,
     temperature: float = 0.5,
 ) -> str:
     response = client.chat.completions.create(
@@ -64,22 +203,219 @@ def llm_response(
     return response.choices[0].message.content
 
 
+def _ssml_from_response(
+    response: str,
+) -> str:
+    return re.search(r"```ssml([\s\S]+)```", response, re.DOTALL).group(1)
+
+
 @retry(max_retry=2)
 def llm_ssml(
     client: aisuite.Client,
     messages: List[Dict[str, str]],
 ) -> str:
-    return re.search(r"```ssml([\s\S]+)```", llm_response(client=client, messages=messages), re.DOTALL).group(1)
+    return _ssml_from_response(llm_response(client=client, messages=messages))
+
+
+@async_retry(max_retry=3)
+async def async_llm_response(
+    messages: List[Dict[str, str]],
+    model: str = LLM_MODEL,
+    temperature: float = 0.5,
+    client: Optional[aisuite.Client] = None,
+    limiter: Optional[AsyncRateLimiter] = None,
+) -> str:
+    """llm_response 的异步版本，在线程池中执行请求，不阻塞事件循环。
+
+    取消时立即返回，线程中的请求结果会被丢弃。
+    limiter 不为 None 时每次实际发出请求 (包括重试) 都占用一个额度。
+    """
+    # 线程池中不再重试，由本函数重试
+    async with limiter or contextlib.nullcontext():
+        return await asyncio.get_running_loop().run_in_executor(
+            llm_executor(),
+            lambda: llm_response.__wrapped__(
+                client=client or llm_client(),
+                messages=messages,
+                model=model,
+                temperature=temperature,
+            ),
+        )
+
+
+@async_retry(max_retry=2)
+async def async_llm_ssml(
+    messages: List[Dict[str, str]],
+    client: Optional[aisuite.Client] = None,
+    limiter: Optional[AsyncRateLimiter] = None,
+) -> str:
+    return _ssml_from_response(await async_llm_response(messages=messages, client=client, limiter=limiter))
+
+
+async def async_llm_stream(
+    messages: List[Dict[str, str]],
+    model: str = LLM_MODEL,
+    temperature: float = 0.5,
+    client: Optional[aisuite.Client] = None,
+    limiter: Optional[AsyncRateLimiter] = None,
+) -> AsyncGenerator[str, None]:
+    """流式请求LLM，逐段产出生成的文本。
+
+    同步的流在线程池中读取，通过队列交给事件循环；取消或提前关闭时通知线程停止读取。
+    limiter 不为 None 时整个流式请求期间占用一个额度。
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            response = (client or llm_client()).chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                stream=True,
+            )
+            for chunk in response:
+                if stopped.is_set():
+                    break
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    loop.call_soon_threadsafe(queue.put_nowait, delta)
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+
+    async with limiter or contextlib.nullcontext():
+        loop.run_in_executor(llm_executor(), produce)
+        try:
+            while (item := await queue.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+
+
+@async_generator_retry(max_retry=2)
+async def async_llm_ssml_stream(
+    messages: List[Dict[str, str]],
+    client: Optional[aisuite.Client] = None,
+    limiter: Optional[AsyncRateLimiter] = None,
+) -> AsyncGenerator[str, None]:
+    """流式生成SSML，每生成一个完整的句子或 <break> 就产出一个SSML片段，可以立即交给TTS"""
+    fragmenter = SSMLFragmenter()
+    async for delta in async_llm_stream(messages=messages, client=client, limiter=limiter):
+        for fragment in fragmenter.feed(delta):
+            yield fragment
+    for fragment in fragmenter.close():
+        yield fragment
+
+
+def _lecture_message(
+    texts: List[str],
+    images: List[str],
+    tables: List[str],
+    note: Optional[str],
+) -> Dict:
+    """由一页PPT的内容生成用户消息"""
+    # 初始化LLM消息内容
+    message = LLMMessage(role="user")
+    # 添加PPT内容
+    message.text("### 以下是PPT内容 ###\n\n")
+    if texts:
+        # 添加PPT文本内容
+        message.text("### 以下是PPT的文本内容 ###\n\n{}\n\n".format("\n\n".join(texts)))
+    if tables:
+        # 添加PPT表格内容
+        message.text("### 以下是PPT的表格内容(json形式) ###\n\n{}\n\n".format("\n\n".join(tables)))
+    if note:
+        # 添加PPT注释内容
+        message.text("### 以下是PPT的注解 ###\n\n{}\n\n".format(note))
+    for image in images:
+        # 添加PPT图片内容
+        message.image(image)
+    return message.unwrap()
+
+
+def _lecture_cache_key(
+    content: Tuple,
+) -> str:
+    """一页PPT内容在讲稿缓存中的键"""
+    return LectureCache.slide_key(content, model=LLM_MODEL, prompt=PROMPT_PPTX_TO_SSMLS)
+
+
+def _deck_outline(
+    contents: List[Tuple],
+    chars_per_slide: int = 80,
+) -> str:
+    """由整个PPT的内容生成简短的大纲，每页一行"""
+    lines = []
+    for i, (texts, images, tables, note) in enumerate(contents, start=1):
+        text = " ".join(" ".join(texts).split())[:chars_per_slide]
+        extras = []
+        if images:
+            extras.append(f"{len(images)}张图片")
+        if tables:
+            extras.append(f"{len(tables)}个表格")
+        lines.append(f"第{i}页: {text}" + (" ({})".format("，".join(extras)) if extras else ""))
+    return "\n".join(lines)
+
+
+def _outline_lecture_message(
+    outline: str,
+    index: int,
+    content: Tuple,
+) -> Dict:
+    """在一页PPT的用户消息前加上整个PPT的大纲和当前页码"""
+    message = _lecture_message(*content)
+    header = LLMMessage(role="user").text(
+        "### 以下是整个PPT的大纲 ###\n\n{}\n\n### 请只讲解第{}页，与前后页的讲解自然衔接 ###\n\n".format(outline, index + 1)
+    )
+    message["content"] = header.contents + message["content"]
+    return message
+
+
+def _conclusion_messages(
+    messages: List[Dict],
+) -> List[Dict]:
+    messages = messages.copy()
+    # 生成PPT内容结束的提示
+    messages.append(LLMMessage(role="user").text("### 内容结束，生成一份SSML的总结来结束这个课堂 ###").unwrap())
+    return messages
+
+
+def _answer_messages(
+    contexts: Union[str, List[str]],
+    question: str,
+) -> List[Dict]:
+    # 如果上下文是字符串，则转换为列表
+    if isinstance(contexts, str):
+        contexts = [contexts]
+    # 系统提示，定义生成SSML的规则
+    return [
+        LLMMessage(role="system").text(PROMPT_QUESTION_TO_SSMLS).unwrap(),
+        (
+            LLMMessage(role="user")
+            .text("### 以下是之前教学的上下文 ###\n\n{}\n\n".format("\n\n".join(contexts)))
+            .text("### 以下是学生提出的问题 ###\n\n{}\n\n".format(question))
+            .unwrap()
+        ),
+    ]
 
 
 def llm_ssml_lectures_from_pptx(
     pptx_path: str,
+    window: Optional[int] = None,
+    cache: Optional[LectureCache] = None,
 ) -> Tuple[List[str], List[Dict]]:
     """
     从PPTX文件生成SSML内容并保存到指定路径。
 
     参数:
         pptx_path (str): 输入的PPTX文件路径。
+        window (Optional[int]): 上下文中保留的最近页数，更早的页只保留摘要；为 None 时保留全部历史。
+        cache (Optional[LectureCache]): 按页的讲稿缓存，命中的页不再请求LLM。
 
     返回:
         List[str]: 生成的SSML内容列表。
@@ -90,70 +426,63 @@ def llm_ssml_lectures_from_pptx(
     ssmls = []
 
     # 初始化AI客户端
-    client = aisuite.Client()
+    client = llm_client()
 
     # 系统提示，定义生成SSML的规则
-    messages = [
-        LLMMessage(role="system").text(PROMPT_PPTX_TO_SSMLS).unwrap(),
-    ]
+    context = LLMLectureContext(PROMPT_PPTX_TO_SSMLS, window=window)
 
     # 遍历PPTX内容，包括文本、图片、表格和注释
-    for texts, images, tables, note in pptx_content_generator(pptx_path):
-
-        # 初始化LLM消息内容
-        message = LLMMessage(role="user")
-        # 添加PPT内容
-        message.text("### 以下是PPT内容 ###\n\n")
-        if texts:
-            # 添加PPT文本内容
-            message.text("### 以下是PPT的文本内容 ###\n\n{}\n\n".format("\n\n".join(texts)))
-        if tables:
-            # 添加PPT表格内容
-            message.text("### 以下是PPT的表格内容(json形式) ###\n\n{}\n\n".format("\n\n".join(tables)))
-        if note:
-            # 添加PPT注释内容
-            message.text("### 以下是PPT的注解 ###\n\n{}\n\n".format(note))
-        for image in images:
-            # 添加PPT图片内容
-            message.image(image)
-        # 将用户消息添加到消息列表
-        messages.append(message.unwrap())
-
-        # 调用LLM生成SSML内容
-        ssml = llm_ssml(client=client, messages=messages)
+    for content in pptx_content_generator(pptx_path):
+
+        # 用户消息
+        message = _lecture_message(*content)
+
+        # 先查缓存，未命中时调用LLM生成SSML内容
+        key = _lecture_cache_key(content)
+        ssml = cache.get(key) if cache is not None else None
+        if ssml is None:
+            ssml = llm_ssml(client=client, messages=context.request(message))
+            if cache is not None:
+                cache.put(key, ssml)
+                cache.save()
         # 将生成的SSML添加到SSML列表
         ssmls.append(ssml)
 
-        # 将生成的SSML作为助手的响应添加到消息列表
-        messages.append(LLMMessage(role="assistant").text(ssml).unwrap())
+        # 将生成的SSML作为助手的响应添加到上下文
+        context.reply(message, ssml)
 
-    return ssmls, messages
+    return ssmls, context.messages()
 
 
 def llm_ssml_conclusion(
     messages: List[Dict],
+    cache: Optional[LectureCache] = None,
 ) -> Tuple[str, List[Dict]]:
     """
     从消息列表中提取SSML总结。
 
     参数:
         messages (List[Dict]): 消息列表。
+        cache (Optional[LectureCache]): 讲稿缓存，消息不变时直接返回缓存的总结。
 
     返回:
         str: 生成的SSML总结。
         List[Dict]: 生成的消息列表。
     """
-    # 初始化AI客户端
-    client = aisuite.Client()
     # 调用LLM生成SSML总结
-    messages = messages.copy()
-    # 生成PPT内容结束的提示
-    messages.append(LLMMessage(role="user").text("### 内容结束，生成一份SSML的总结来结束这个课堂 ###").unwrap())
+    messages = _conclusion_messages(messages)
+    key = LectureCache.conclusion_key(messages, model=LLM_MODEL)
+    if cache is not None and (ssml := cache.get(key)) is not None:
+        return ssml, messages
+    # 初始化AI客户端
+    client = llm_client()
     # 生成PPT内容的总结
     ssml = llm_ssml(
         client=client,
         messages=messages,
     )
+    if cache is not None:
+        cache.put(key, ssml)
     return ssml, messages
 
 
@@ -172,23 +501,11 @@ def llm_ssml_answer(
         str: 生成的SSML内容。
         List[Dict]: 生成的消息列表。
     """
-    # 如果上下文是字符串，则转换为列表
-    if isinstance(contexts, str):
-        contexts = [contexts]
-
     # 初始化AI客户端
-    client = aisuite.Client()
+    client = llm_client()
 
-    # 系统提示，定义生成SSML的规则
-    messages = [
-        LLMMessage(role="system").text(PROMPT_QUESTION_TO_SSMLS).unwrap(),
-        (
-            LLMMessage(role="user")
-            .text("### 以下是之前教学的上下文 ###\n\n{}\n\n".format("\n\n".join(contexts)))
-            .text("### 以下是学生提出的问题 ###\n\n{}\n\n".format(question))
-            .unwrap()
-        ),
-    ]
+    # 系统提示和问题
+    messages = _answer_messages(contexts, question)
 
     # 调用LLM生成SSML内容
     answer = llm_ssml(
@@ -201,3 +518,280 @@ def llm_ssml_answer(
 
     # 调用LLM生成SSML内容
     return answer, messages
+
+
+class _ThreadedGenerator:
+    """在专用线程中逐个读取同步生成器，不阻塞事件循环
+
+    close() 排在正在进行的读取之后，在同一线程中关闭生成器，取消时也能释放生成器持有的资源 (文件和线程池)。
+    """
+
+    def __init__(
+        self,
+        generator: Generator,
+    ):
+        self._generator = generator
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="generator")
+
+    async def next(self):
+        """返回下一个元素，结束时返回 None"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, next, self._generator, None)
+
+    def close(self):
+        self._executor.submit(self._generator.close)
+        self._executor.shutdown(wait=False)
+
+
+async def async_llm_ssml_lectures_from_pptx(
+    pptx_path: str,
+    window: Optional[int] = None,
+    cache: Optional[LectureCache] = None,
+    on_slide: Optional[Callable[[int, str], None]] = None,
+    limiter: Optional[AsyncRateLimiter] = None,
+) -> Tuple[List[str], List[Dict]]:
+    """
+    llm_ssml_lectures_from_pptx 的异步版本，不阻塞事件循环，可以被取消。
+
+    参数:
+        pptx_path (str): 输入的PPTX文件路径。
+        window (Optional[int]): 上下文中保留的最近页数，更早的页只保留摘要；为 None 时保留全部历史。
+        cache (Optional[LectureCache]): 按页的讲稿缓存，命中的页不再请求LLM。
+        on_slide (Optional[Callable[[int, str], None]]): 每生成一页时的回调，参数为页码和SSML。
+        limiter (Optional[AsyncRateLimiter]): 与其他请求共用的限流器，每次请求占用一个额度。
+
+    返回:
+        List[str]: 生成的SSML内容列表。
+        List[Dict]: 生成的消息列表。
+    """
+
+    # 返回列表
+    ssmls = []
+
+    # 系统提示，定义生成SSML的规则
+    context = LLMLectureContext(PROMPT_PPTX_TO_SSMLS, window=window)
+
+    # 读取PPTX涉及图片处理，放到线程中逐页读取
+    contents = _ThreadedGenerator(pptx_content_generator(pptx_path))
+    try:
+        while (content := await contents.next()) is not None:
+
+            # 用户消息
+            message = _lecture_message(*content)
+
+            # 先查缓存，未命中时调用LLM生成SSML内容
+            key = _lecture_cache_key(content)
+            ssml = cache.get(key) if cache is not None else None
+            if ssml is None:
+                ssml = await async_llm_ssml(messages=context.request(message), limiter=limiter)
+                if cache is not None:
+                    cache.put(key, ssml)
+                    # 每生成一页就保存，中途退出时已生成的页不必重新生成
+                    await cache.async_save()
+            if on_slide is not None:
+                on_slide(len(ssmls), ssml)
+            # 将生成的SSML添加到SSML列表
+            ssmls.append(ssml)
+
+            # 将生成的SSML作为助手的响应添加到上下文
+            context.reply(message, ssml)
+    finally:
+        contents.close()
+
+    return ssmls, context.messages()
+
+
+async def async_llm_ssml_lectures_from_pptx_parallel(
+    pptx_path: str,
+    max_in_flight: int = LLM_MAX_WORKERS,
+    requests_per_minute: Optional[int] = None,
+    window: Optional[int] = None,
+    cache: Optional[LectureCache] = None,
+    on_slide: Optional[Callable[[int, str], None]] = None,
+    limiter: Optional[AsyncRateLimiter] = None,
+) -> Tuple[List[str], List[Dict]]:
+    """
+    并行地逐页生成SSML内容。
+
+    每页不再依赖之前各页的回复，而是以整个PPT的大纲作为共同的上下文，
+    因此各页可以同时请求LLM，总耗时不再是页数乘以单次请求的耗时。
+
+    参数:
+        pptx_path (str): 输入的PPTX文件路径。
+        max_in_flight (int): 同时进行的LLM请求数上限。
+        requests_per_minute (Optional[int]): 每分钟的LLM请求数上限，为 None 时不限制。
+        window (Optional[int]): 返回的消息列表中保留的最近页数，与 async_llm_ssml_lectures_from_pptx 相同。
+        cache (Optional[LectureCache]): 按页的讲稿缓存，命中的页不再请求LLM。
+        on_slide (Optional[Callable[[int, str], None]]): 每生成一页时的回调，参数为页码和SSML，调用顺序不定。
+        limiter (Optional[AsyncRateLimiter]): 与其他请求共用的限流器，不为 None 时代替 max_in_flight 和 requests_per_minute。
+
+    返回:
+        List[str]: 按页顺序排列的SSML内容列表。
+        List[Dict]: 生成的消息列表，用于生成总结。
+    """
+
+    # 大纲只需要各页的文本，不处理图片
+    outline = await asyncio.to_thread(lambda: _deck_outline(pptx_slides(pptx_path)))
+
+    system = LLMMessage(role="system").text(PROMPT_PPTX_TO_SSMLS).unwrap()
+    if limiter is None:
+        limiter = AsyncRateLimiter(max_in_flight=max_in_flight, max_per_period=requests_per_minute, period=60)
+
+    async def lecture(
+        index: int,
+        content: Tuple,
+    ) -> str:
+        key = _lecture_cache_key(content)
+        ssml = cache.get(key) if cache is not None else None
+        if ssml is None:
+            messages = [system, _outline_lecture_message(outline, index, content)]
+            print(f"[llm] slide {index + 1}: ~{llm_estimate_tokens(messages)} tokens")
+            ssml = await async_llm_ssml(messages=messages, limiter=limiter)
+            if cache is not None:
+                cache.put(key, ssml)
+                await cache.async_save()
+        if on_slide is not None:
+            on_slide(index, ssml)
+        return ssml
+
+    # 读取PPTX涉及图片处理，放到线程中逐页读取，每读完一页就开始生成这一页
+    contents, tasks = [], []
+    reader = _ThreadedGenerator(pptx_content_generator(pptx_path))
+    try:
+        while (content := await reader.next()) is not None:
+            contents.append(content)
+            tasks.append(asyncio.create_task(lecture(len(tasks), content)))
+        ssmls = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    finally:
+        reader.close()
+
+    # 按页顺序组成对话，供生成总结使用
+    context = LLMLectureContext(PROMPT_PPTX_TO_SSMLS, window=window)
+    for content, ssml in zip(contents, ssmls):
+        context.reply(_lecture_message(*content), ssml)
+
+    return list(ssmls), context.messages()
+
+
+async def async_llm_ssml_conclusion(
+    messages: List[Dict],
+    cache: Optional[LectureCache] = None,
+    limiter: Optional[AsyncRateLimiter] = None,
+) -> Tuple[str, List[Dict]]:
+    """
+    llm_ssml_conclusion 的异步版本。
+
+    参数:
+        messages (List[Dict]): 消息列表。
+        cache (Optional[LectureCache]): 讲稿缓存，消息不变时直接返回缓存的总结。
+        limiter (Optional[AsyncRateLimiter]): 与其他请求共用的限流器，每次请求占用一个额度。
+
+    返回:
+        str: 生成的SSML总结。
+        List[Dict]: 生成的消息列表。
+    """
+    messages = _conclusion_messages(messages)
+    key = LectureCache.conclusion_key(messages, model=LLM_MODEL)
+    if cache is not None and (ssml := cache.get(key)) is not None:
+        return ssml, messages
+    ssml = await async_llm_ssml(messages=messages, limiter=limiter)
+    if cache is not None:
+        cache.put(key, ssml)
+    return ssml, messages
+
+
+async def async_llm_ssml_answer(
+    contexts: Union[str, List[str]],
+    question: str,
+    cache: Optional[LectureCache] = None,
+    limiter: Optional[AsyncRateLimiter] = None,
+) -> Tuple[str, List[Dict]]:
+    """
+    llm_ssml_answer 的异步版本。
+
+    参数:
+        contexts (Union[str, List[str]]): 教学上下文，可以是字符串或字符串列表。
+        question (str): 学生提出的问题。
+        cache (Optional[LectureCache]): 回答的缓存，上下文和问题不变时直接返回缓存的回答。
+        limiter (Optional[AsyncRateLimiter]): 与其他请求共用的限流器，每次请求占用一个额度。
+
+    返回:
+        str: 生成的SSML内容。
+        List[Dict]: 生成的消息列表。
+    """
+    messages = _answer_messages(contexts, question)
+    key = LectureCache.answer_key(messages, model=LLM_MODEL)
+    answer = cache.get(key) if cache is not None else None
+    if answer is None:
+        answer = await async_llm_ssml(messages=messages, limiter=limiter)
+        if cache is not None:
+            cache.put(key, answer)
+    messages.append(LLMMessage(role="assistant").text(answer).unwrap())
+    return answer, messages
+
+
+async def async_llm_ssml_answer_stream(
+    contexts: Union[str, List[str]],
+    question: str,
+    client: Optional[aisuite.Client] = None,
+    limiter: Optional[AsyncRateLimiter] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    流式生成问题的SSML回答。
+
+    参数:
+        contexts (Union[str, List[str]]): 教学上下文，可以是字符串或字符串列表。
+        question (str): 学生提出的问题。
+        limiter (Optional[AsyncRateLimiter]): 与其他请求共用的限流器，每次请求占用一个额度。
+
+    返回:
+        AsyncGenerator[str, None]: SSML片段。
+    """
+    async for fragment in async_llm_ssml_stream(messages=_answer_messages(contexts, question), client=client, limiter=limiter):
+        yield fragment
+
+
+def _questions_from_response(
+    response: str,
+) -> List[str]:
+    match = re.search(r"```questions([\s\S]+?)```", response)
+    lines = (match.group(1) if match else response).splitlines()
+    # 去掉可能的编号和列表符号
+    questions = [re.sub(r"^\s*(\d+[.、)]|[-*•])\s*", "", line).strip() for line in lines]
+    return [question for question in questions if question]
+
+
+async def async_llm_likely_questions(
+    ssml_lecture: str,
+    count: int = 3,
+    cache: Optional[LectureCache] = None,
+    limiter: Optional[AsyncRateLimiter] = None,
+) -> List[str]:
+    """
+    预测学生听完一页讲解后可能提出的问题。
+
+    参数:
+        ssml_lecture (str): 这一页讲稿的SSML。
+        count (int): 问题数。
+        cache (Optional[LectureCache]): 缓存，讲稿不变时直接返回缓存的问题。
+        limiter (Optional[AsyncRateLimiter]): 与其他请求共用的限流器，每次请求占用一个额度。
+
+    返回:
+        List[str]: 问题列表。
+    """
+    prompt = PROMPT_LECTURE_TO_QUESTIONS.format(count=count)
+    key = LectureCache.questions_key(ssml_lecture, model=LLM_MODEL, prompt=prompt)
+    if cache is not None and (questions := cache.get(key)) is not None:
+        return questions.splitlines()
+    messages = [
+        LLMMessage(role="system").text(prompt).unwrap(),
+        LLMMessage(role="user").text("\n".join(ssml_to_raw_texts(ssml_lecture))).unwrap(),
+    ]
+    questions = _questions_from_response(await async_llm_response(messages=messages, limiter=limiter))[:count]
+    if cache is not None:
+        cache.put(key, "\n".join(questions))
+    return questions
+
@@ -1,115 +1,519 @@
 import asyncio
+import collections
+import contextlib
+import functools
+import itertools
+import math
 import os
 import argparse
+from concurrent.futures import Future
+from typing import AsyncGenerator, AsyncIterable, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
 
 from dotenv import find_dotenv, load_dotenv
+from aiedu.lecture_cache import LectureCache
+from aiedu.preparation import IndexFunction, LecturePreparation, LecturePreparations
+from aiedu.retrieval import LectureIndex
+from aiedu.tts.base import TTSAudio
+from aiedu.tts.cache import CachedTTS, TTSCache
 from aiedu.tts.edge_tts import EdgeTTS
 from aiedu.utils.ssml import ssml_to_raw_texts
-from aiedu.llm import llm_ssml_answer, llm_ssml_lectures_from_pptx, llm_ssml_conclusion
-from aiedu.utils.file import pickle_dump, pickle_load
-from aiedu.emotext import emotion
-from aiedu.utils.audio import NonBlockingAudioQueuePlayer
-from aiedu.utils.websocket import WebSocketServer, websocket_send
+from aiedu.llm import (
+    LLM_MAX_WORKERS,
+    async_llm_ssml_answer,
+    async_llm_ssml_answer_stream,
+    async_llm_likely_questions,
+    async_llm_ssml_lectures_from_pptx,
+    async_llm_ssml_lectures_from_pptx_parallel,
+    async_llm_ssml_conclusion,
+)
+from aiedu.emotext import emotion, emotion_timeline
+from aiedu.utils.pptx import pptx_slides
+from aiedu.utils.audio import NonBlockingAudioQueuePlayer, audio_envelope
+from aiedu.utils.limiter import AsyncRateLimiter, PriorityGate
+from aiedu.utils.prefetch import BufferedStream, async_prefetch
+from aiedu.utils.websocket import FramedWebSocket, WebSocketServer
 from rich import print
 
 _ = load_dotenv(find_dotenv())
 
 
-async def demo_remote(
-    pptx_path: str,
-    cache_path: str,
-    allow_questions: bool = False,
-):
+def llm_limiter(
+    parallel: int,
+    requests_per_minute: Optional[int],
+) -> AsyncRateLimiter:
+    """所有LLM请求 (生成讲稿、实时回答和预先生成的回答) 共用的限流器"""
+    return AsyncRateLimiter(
+        max_in_flight=parallel if parallel > 0 else LLM_MAX_WORKERS,
+        max_per_period=requests_per_minute,
+        period=60,
+    )
 
-    async def handler(
-        websocket,
-    ):
-        print("websocket connection opened")
 
-        if not os.path.exists(cache_path):
-            ssml_lectures, messages_lecture = llm_ssml_lectures_from_pptx(
+async def prepare_lectures(
+    pptx_path: str,
+    cache_path: str,
+    context_window: Optional[int],
+    parallel: int,
+    gate: PriorityGate,
+    limiter: AsyncRateLimiter,
+    on_slide: Optional[Callable[[int, str], None]] = None,
+) -> Tuple[List[str], str]:
+    """生成各页讲稿和总结，只有内容变化的页会请求LLM
+
+    parallel 大于 0 时并行生成各页讲稿，否则逐页生成；每生成一页调用 on_slide(页码, SSML)。
+    生成期间作为前台任务，后台的预先生成暂停。
+    """
+    async with gate.foreground():
+        cache = await asyncio.to_thread(LectureCache, cache_path)
+        if parallel > 0:
+            ssml_lectures, messages_lecture = await async_llm_ssml_lectures_from_pptx_parallel(
                 pptx_path=pptx_path,
-            )
-            ssml_conclusion, messages_conclusion = llm_ssml_conclusion(
-                messages=messages_lecture,
-            )
-            ssml_lectures, ssml_conclusion = pickle_dump(
-                data=(ssml_lectures, ssml_conclusion),
-                path=cache_path,
+                window=context_window,
+                cache=cache,
+                on_slide=on_slide,
+                limiter=limiter,
             )
         else:
-            ssml_lectures, ssml_conclusion = pickle_load(
-                path=cache_path,
+            ssml_lectures, messages_lecture = await async_llm_ssml_lectures_from_pptx(
+                pptx_path=pptx_path,
+                window=context_window,
+                cache=cache,
+                on_slide=on_slide,
+                limiter=limiter,
             )
+        ssml_conclusion, messages_conclusion = await async_llm_ssml_conclusion(
+            messages=messages_lecture,
+            cache=cache,
+            limiter=limiter,
+        )
+        await cache.async_save(prune=True)
+    return ssml_lectures, ssml_conclusion
+
+
+class Speech(NamedTuple):
+    """提前准备好的一段讲解: 文本、情感，以及音频和口型数据或正在合成的音频流"""
+
+    # 第几页，总结为 None
+    index: Optional[int]
+    ssml: str
+    text: str
+    emotion: Dict
+    audio: Optional[TTSAudio] = None
+    timeline: Optional[List] = None
+    envelope: Optional[bytes] = None
+    stream: Optional[BufferedStream] = None
+
+
+async def prepare_speech(
+    tts: CachedTTS,
+    ssml: str,
+    index: Optional[int] = None,
+    stream_audio: bool = False,
+) -> Speech:
+    """合成一段讲解的音频并计算情感、情感时间线和口型包络；stream_audio 时只开始流式合成"""
+    text = "\n".join(ssml_to_raw_texts(ssml))
+    emotion_speech = await asyncio.to_thread(emotion, text)
+    if stream_audio:
+        return Speech(index=index, ssml=ssml, text=text, emotion=emotion_speech, stream=BufferedStream(tts.stream(ssml)))
+
+    audio = await tts.audio(ssml)
+    # 解码音频和计算时间线放到线程中，解码结果缓存在 audio 上，播放时不必再解码
+    timeline, envelope = await asyncio.to_thread(
+        lambda: (emotion_timeline(text, audio.boundaries), audio_envelope(audio.segment, rate=60).tobytes())
+    )
+    return Speech(index=index, ssml=ssml, text=text, emotion=emotion_speech, audio=audio, timeline=timeline, envelope=envelope)
 
-        text_lectures_questions = [[], ["什么是快速开发？"], []]
 
-        tts = EdgeTTS()
+class Answer(NamedTuple):
+    """缓存的问题回答: SSML 片段，以及合成好的音频 (流式合成时为 None，各片段的音频在TTS缓存中)"""
 
-        for ssml_lecture, text_lecture_questions in zip(ssml_lectures, text_lectures_questions):
+    fragments: List[str]
+    speech: Optional[Speech] = None
 
-            # 课件主体内容
-            text_lecture = "\n".join(ssml_to_raw_texts(ssml_lecture))
 
-            print(f"lecture: \n{text_lecture}\n")
-            print(f"emotion: \n{str(emotion(text_lecture))}\n")
+def ssml_answer_text(
+    answer: Answer,
+) -> str:
+    return "\n".join(ssml_to_raw_texts("".join(answer.fragments)))
 
-            audio_lecture = await tts.audio(ssml_lecture)
 
-            # 发送音频
-            await websocket_send(
-                websocket,
-                header={
-                    "type": "audio",
-                },
-                data=audio_lecture.export(format="mp3").read(),
-            )
-            await websocket.recv()
+async def prepare_answer(
+    tts: CachedTTS,
+    preparation: LecturePreparation,
+    question: str,
+    index: Optional[int],
+    gate: PriorityGate,
+    limiter: AsyncRateLimiter,
+    stream_audio: bool = False,
+) -> Answer:
+    """从整份课件中检索与问题相关的段落作为上下文生成回答；stream_audio 时不合成，播放时再流式合成
 
-            # 问题中断
-            if allow_questions:
+    作为前台任务，生成期间后台的预先生成暂停。
+    """
+    async with gate.foreground():
+        lecture_index = await preparation.index()
+        ssml_answer, _ = await async_llm_ssml_answer(
+            contexts=lecture_index.contexts(question, slide=index),
+            question=question,
+            limiter=limiter,
+        )
+        if stream_audio:
+            return Answer([ssml_answer])
+        return Answer([ssml_answer], await prepare_speech(tts, ssml_answer))
 
-                for text_question in text_lecture_questions:
-                    # 问题内容
-                    ssml_answer, _ = llm_ssml_answer(
-                        contexts=text_lecture,
-                        question=text_question,
-                    )
 
-                    text_answer = "\n".join(ssml_to_raw_texts(ssml_answer))
+async def precompute_answers(
+    tts: CachedTTS,
+    preparation: LecturePreparation,
+    cache_path: str,
+    questions_per_slide: int,
+    gate: PriorityGate,
+    limiter: AsyncRateLimiter,
+):
+    """讲稿生成后在后台为每页预测几个学生可能提出的问题，生成回答并合成音频
+
+    问题和回答保存在与讲稿缓存同名的 .answers.json 中，音频在TTS缓存中，下次运行时直接从磁盘读取；
+    生成的回答加入问题回答的缓存，学生提出相同或近似的问题时立即回答。
+    逐个请求，请求计入共用的限流器；有前台任务 (生成讲稿、回答实时问题) 时暂停，不与其争抢LLM和TTS。
+    """
+    cache = LectureCache(os.path.splitext(cache_path)[0] + ".answers.json")
+    ssml_lectures, _ = await preparation.result()
+    lecture_index = await preparation.index()
+
+    count = 0
+    for index, ssml_lecture in enumerate(ssml_lectures):
+        await gate.idle()
+        questions = await async_llm_likely_questions(ssml_lecture, count=questions_per_slide, cache=cache, limiter=limiter)
+        for question in questions:
+            await gate.idle()
+            ssml_answer, _ = await async_llm_ssml_answer(
+                contexts=lecture_index.contexts(question, slide=index),
+                question=question,
+                cache=cache,
+                limiter=limiter,
+            )
+            await gate.idle()
+            await tts.audio(ssml_answer)
+            # 预先生成的回答在本次运行中不过期
+            await preparation.answers.put(index, question, Answer([ssml_answer]), ttl=math.inf)
+            count += 1
+        # 每页完成后保存，中途退出时已完成的页下次不必重新生成
+        await cache.async_save()
+    await cache.async_save(prune=True)
+    print(f"precomputed answers: {count} questions for {len(ssml_lectures)} slides")
+
+
+def answers_precomputer(
+    tts: CachedTTS,
+    cache_path: str,
+    questions_per_slide: int,
+    gate: PriorityGate,
+    limiter: AsyncRateLimiter,
+) -> Optional[Callable[[LecturePreparation], Awaitable[None]]]:
+    """questions_per_slide 为 0 时不预先生成问题和回答"""
+    if questions_per_slide <= 0:
+        return None
+    return lambda preparation: precompute_answers(tts, preparation, cache_path, questions_per_slide, gate, limiter)
 
-                    print(f"question: {text_question}\n")
-                    print(f"answer: {text_answer}\n")
-                    print(f"emotion: {str(emotion(text_answer))}\n")
 
-                    audio_answer = await tts.audio(ssml_answer)
+def lecture_index_builder(
+    pptx_path: str,
+) -> IndexFunction:
+    """建立回答问题用的检索索引，除讲稿外还包含各页的文字、表格和注释；PPTX 只在第一次建立索引时读取"""
+    slides = functools.lru_cache(maxsize=1)(lambda: pptx_slides(pptx_path))
+    return lambda ssml_lectures, ssml_conclusion: LectureIndex.from_lectures(
+        ssml_lectures,
+        ssml_conclusion,
+        slides=slides(),
+    )
 
-                    # 发送音频
-                    await websocket_send(
-                        websocket,
-                        header={
-                            "type": "audio",
-                        },
-                        data=audio_answer.export(format="mp3").read(),
-                    )
-                    await websocket.recv()
 
-        # 课件总结
-        text_conclusion = "\n".join(ssml_to_raw_texts(ssml_conclusion))
+def prefetch_speeches(
+    tts: CachedTTS,
+    preparation: LecturePreparation,
+    lookahead: int,
+    stream_audio: bool = False,
+) -> AsyncGenerator[Speech, None]:
+    """按顺序产出各页讲解和总结，讲解当前页时提前准备之后 lookahead 段的音频"""
+
+    async def ssmls():
+        index = 0
+        async for ssml_lecture in preparation.lectures():
+            yield index, ssml_lecture
+            index += 1
+        _, ssml_conclusion = await preparation.result()
+        yield None, ssml_conclusion
+
+    return async_prefetch(
+        ssmls(),
+        lambda item: prepare_speech(tts, item[1], index=item[0], stream_audio=stream_audio),
+        lookahead=lookahead,
+        discard=lambda speech: speech.stream is not None and speech.stream.cancel(),
+    )
 
-        print(f"conclusion: \n{text_conclusion}\n")
-        print(f"emotion: \n{str(emotion(text_conclusion))}\n")
 
-        audio_conclusion = await tts.audio(ssml_conclusion)
+async def demo_remote(
+    pptx_path: str,
+    cache_path: str,
+    tts_cache_path: str,
+    allow_questions: bool = False,
+    stream_audio: bool = False,
+    context_window: Optional[int] = None,
+    parallel: int = 0,
+    requests_per_minute: Optional[int] = None,
+    lookahead: int = 2,
+    push_ahead: int = 1,
+    questions_per_slide: int = 0,
+    interrupt_for_questions: bool = False,
+):
+    # 所有连接共用一个 TTS 和音频缓存
+    tts = CachedTTS(EdgeTTS(), TTSCache(tts_cache_path))
+    # 所有连接共用讲稿的准备过程，同时连接时只生成一次
+    preparations = LecturePreparations()
+    # 所有连接的LLM请求共用限流器；生成讲稿和回答实时问题时暂停后台的预先生成
+    limiter = llm_limiter(parallel, requests_per_minute)
+    gate = PriorityGate()
+
+    async def handler(
+        websocket,
+    ):
+        print("websocket connection opened")
 
-        await websocket_send(
-            websocket,
-            header={
-                "type": "audio",
-            },
-            data=audio_conclusion.export(format="mp3").read(),
+        preparation = preparations.get(
+            LecturePreparations.key(pptx_path, cache_path, context_window, parallel),
+            lambda on_slide: prepare_lectures(
+                pptx_path=pptx_path,
+                cache_path=cache_path,
+                context_window=context_window,
+                parallel=parallel,
+                gate=gate,
+                limiter=limiter,
+                on_slide=on_slide,
+            ),
+            lecture_index_builder(pptx_path),
+            answers_precomputer(tts, cache_path, questions_per_slide, gate, limiter),
         )
-        await websocket.recv()
+
+        text_lectures_questions = [[], ["什么是快速开发？"], []]
+
+        async with FramedWebSocket(websocket) as connection:
+            stream_ids = itertools.count()
+            # 已发送、还没有播放完的音频 [(消息 id, 页码)]
+            playing = collections.deque()
+            # 最近开始发送的一页的页码
+            sent_index: Optional[int] = None
+            # 按提问顺序排列的正在准备或已准备好、还没有发送的回答
+            answers: collections.deque = collections.deque()
+            # 打断播放发送的回答的消息 id
+            interruptions: List[int] = []
+
+            async def wait_played(
+                ahead: int = 0,
+            ):
+                """等待已发送的音频播放到只剩 ahead 段没有播放完"""
+                while len(playing) > ahead:
+                    # 收到回应后再移除，等待期间这一段仍算作正在播放
+                    await connection.played(playing[0][0])
+                    playing.popleft()
+
+            async def send_stream(
+                chunks: AsyncIterable[bytes],
+                index: Optional[int] = None,
+                interrupt: bool = False,
+            ):
+                """流式发送音频，边合成边发送，不等待播放"""
+                if not interrupt:
+                    await wait_played(push_ahead)
+                id = await connection.send_stream(
+                    header={
+                        "type": "audio_stream",
+                        "stream": next(stream_ids),
+                        "interrupt": interrupt,
+                    },
+                    chunks=chunks,
+                )
+                if interrupt:
+                    interruptions.append(id)
+                else:
+                    playing.append((id, index))
+
+            async def send_speech(
+                speech: Speech,
+                interrupt: bool = False,
+            ):
+                """发送一段准备好的讲解的音频，不等待播放；最多比客户端的播放进度提前 push_ahead 段
+
+                interrupt 时不排队，客户端暂停正在播放的音频，立即播放这一段后再继续。
+                """
+                if speech.stream is not None:
+                    await send_stream(speech.stream, speech.index, interrupt)
+                    return
+
+                if not interrupt:
+                    await wait_played(push_ahead)
+                # 口型包络和音频在同一条消息中发送，分片发送，不把音频复制到新的缓冲区
+                id = await connection.send(
+                    header={
+                        "type": "audio",
+                        "timeline": speech.timeline,
+                        "envelope": {
+                            "rate": 60,
+                            "dtype": "float16",
+                            "length": len(speech.envelope),
+                        },
+                        "interrupt": interrupt,
+                    },
+                    data=[speech.envelope, speech.audio.data],
+                )
+                if interrupt:
+                    interruptions.append(id)
+                else:
+                    playing.append((id, speech.index))
+
+            async def answer_speech(
+                text_question: str,
+                index: Optional[int],
+            ) -> Speech:
+                """准备问题的回答，同一页中相同或近似的问题只生成一次"""
+                if stream_audio:
+                    # 流式生成回答，每生成一句就开始合成，合成的音频先缓存，轮到时再发送
+                    async def answer_fragments():
+                        fragments = asyncio.Queue()
+
+                        async def create() -> Answer:
+                            async with gate.foreground():
+                                lecture_index = await preparation.index()
+                                fragments_answer = []
+                                async for fragment in async_llm_ssml_answer_stream(
+                                    contexts=lecture_index.contexts(text_question, slide=index),
+                                    question=text_question,
+                                    limiter=limiter,
+                                ):
+                                    fragments_answer.append(fragment)
+                                    fragments.put_nowait(fragment)
+                                return Answer(fragments_answer)
+
+                        # 由这个问题生成时边生成边产出；相同的问题已缓存或正在生成时，
+                        # create 不会被调用，等生成完后产出，各片段的音频已经在TTS缓存中
+                        answering = asyncio.ensure_future(preparation.answers.get_or_create(index, text_question, create))
+                        answering.add_done_callback(lambda _: fragments.put_nowait(None))
+                        count = 0
+                        while (fragment := await fragments.get()) is not None:
+                            count += 1
+                            yield fragment
+                        answer = await answering
+                        for fragment in answer.fragments[count:]:
+                            yield fragment
+                        print(f"answer: {ssml_answer_text(answer)}\n")
+
+                    return Speech(
+                        index=None,
+                        ssml="",
+                        text="",
+                        emotion={},
+                        stream=BufferedStream(tts.stream_ssml(answer_fragments())),
+                    )
+
+                answer = await preparation.answers.get_or_create(
+                    index,
+                    text_question,
+                    lambda: prepare_answer(tts, preparation, text_question, index, gate, limiter),
+                )
+                speech_answer = answer.speech
+                if speech_answer is None:
+                    speech_answer = await prepare_speech(tts, "".join(answer.fragments))
+                print(f"answer: {speech_answer.text}\n")
+                print(f"emotion: {str(speech_answer.emotion)}\n")
+                return speech_answer
+
+            def ask(
+                text_question: str,
+                index: Optional[int] = None,
+            ):
+                """收到问题后立即开始准备回答，与正在播放的讲解同时进行；index 为 None 时问题针对客户端正在播放的一页"""
+                if index is None:
+                    index = next((index for _, index in playing if index is not None), sent_index)
+                print(f"question (slide {index}): {text_question}\n")
+                task = asyncio.create_task(answer_speech(text_question, index))
+                if interrupt_for_questions:
+                    # 准备好后立即打断播放
+                    interrupt_tasks.append(asyncio.create_task(send_answer(task, interrupt=True)))
+                else:
+                    answers.append(task)
+
+            async def send_answer(
+                task: asyncio.Task,
+                interrupt: bool = False,
+            ):
+                try:
+                    await send_speech(await task, interrupt)
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    # 回答失败不影响讲解
+                    print(f"answer failed: {e!r}")
+
+            async def send_ready_answers(
+                wait: bool = False,
+            ):
+                """在两页之间按提问顺序发送已经准备好的回答，没有准备好的留到下一页之后；wait 时等待全部回答"""
+                while answers and (wait or answers[0].done()):
+                    await send_answer(answers.popleft())
+
+            async def receive_questions():
+                """客户端随时可以发送 {"type": "question", "text": "..."} 提问"""
+                while (message := await connection.inbox.get()) is not None:
+                    header, _ = message
+                    if header.get("type") == "question" and header.get("text"):
+                        ask(header["text"])
+
+            # 打断播放的回答的准备和发送
+            interrupt_tasks: List[asyncio.Task] = []
+            receiver = asyncio.create_task(receive_questions())
+            try:
+                # 讲解当前页时提前合成之后几页，连接关闭时取消
+                async with contextlib.aclosing(prefetch_speeches(tts, preparation, lookahead, stream_audio)) as speeches:
+                    async for speech in speeches:
+                        # 轮到发送这一段时，在上一页之后插入已经准备好的回答
+                        await wait_played(push_ahead)
+                        await send_ready_answers()
+
+                        # 课件总结
+                        if speech.index is None:
+                            print(f"conclusion: \n{speech.text}\n")
+                            print(f"emotion: \n{str(speech.emotion)}\n")
+
+                            await send_speech(speech)
+                            break
+
+                        # 课件主体内容
+                        print(f"lecture: \n{speech.text}\n")
+                        print(f"emotion: \n{str(speech.emotion)}\n")
+
+                        # 流式发送时整段发送完才加入 playing，发送期间问题也针对这一页
+                        sent_index = speech.index
+                        await send_speech(speech)
+
+                        # 演示用的问题，与这一页的播放同时准备回答
+                        if allow_questions and speech.index < len(text_lectures_questions):
+                            for text_question in text_lectures_questions[speech.index]:
+                                ask(text_question, speech.index)
+
+                # 讲完后回答剩下的问题
+                await send_ready_answers(wait=True)
+                await wait_played()
+                await asyncio.gather(*interrupt_tasks)
+                for id in interruptions:
+                    await connection.played(id)
+            finally:
+                receiver.cancel()
+                for task in [*answers, *interrupt_tasks]:
+                    task.cancel()
+                    # 停止没有发送的回答的流式合成
+                    if task.done() and not task.cancelled() and task.exception() is None:
+                        speech_answer = task.result()
+                        if isinstance(speech_answer, Speech) and speech_answer.stream is not None:
+                            speech_answer.stream.cancel()
 
     # 启动WebSocket服务器
     await WebSocketServer(
@@ -122,85 +526,137 @@ async def demo_remote(
 async def demo_local(
     pptx_path: str,
     cache_path: str,
+    tts_cache_path: str,
     allow_questions: bool = False,
+    context_window: Optional[int] = None,
+    parallel: int = 0,
+    requests_per_minute: Optional[int] = None,
+    lookahead: int = 2,
+    stream_audio: bool = False,
+    questions_per_slide: int = 0,
 ):
     with NonBlockingAudioQueuePlayer() as player:
 
-        if not os.path.exists(cache_path):
-            ssml_lectures, messages_lecture = llm_ssml_lectures_from_pptx(
+        tts = CachedTTS(EdgeTTS(), TTSCache(tts_cache_path))
+        limiter = llm_limiter(parallel, requests_per_minute)
+        gate = PriorityGate()
+        preparation = LecturePreparation(
+            lambda on_slide: prepare_lectures(
                 pptx_path=pptx_path,
-            )
-            ssml_conclusion, messages_conclusion = llm_ssml_conclusion(
-                messages=messages_lecture,
-            )
-            ssml_lectures, ssml_conclusion = pickle_dump(
-                data=(ssml_lectures, ssml_conclusion),
-                path=cache_path,
-            )
-        else:
-            ssml_lectures, ssml_conclusion = pickle_load(
-                path=cache_path,
-            )
+                cache_path=cache_path,
+                context_window=context_window,
+                parallel=parallel,
+                gate=gate,
+                limiter=limiter,
+                on_slide=on_slide,
+            ),
+            lecture_index_builder(pptx_path),
+            answers_precomputer(tts, cache_path, questions_per_slide, gate, limiter),
+        )
 
         text_lectures_questions = [[], ["什么是快速开发？"], []]
 
-        tts = EdgeTTS()
-
-        for ssml_lecture, text_lecture_questions in zip(ssml_lectures, text_lectures_questions):
-            # 课件主体内容
-            text_lecture = "\n".join(ssml_to_raw_texts(ssml_lecture))
-
-            print(f"lecture: \n{text_lecture}\n")
-            print(f"emotion: \n{str(emotion(text_lecture))}\n")
-
-            # 播放音频
-            audio_lecture = await tts.audio(ssml_lecture)
-            player.play(audio_lecture)
-
-            # 问题中断
-            if allow_questions:
-
-                for text_question in text_lecture_questions:
-
-                    ssml_answer, _ = llm_ssml_answer(
-                        contexts=text_lecture,
-                        question=text_question,
+        def play(
+            speech: Speech,
+        ) -> Future:
+            if speech.stream is not None:
+                return player.play_stream(speech.stream)
+            return player.play(speech.audio)
+
+        # 上一段还在播放时就把下一段加入播放队列，段与段之间没有间隙
+        playing: Optional[Future] = None
+
+        async def wait_played():
+            if playing is not None:
+                await asyncio.wrap_future(playing)
+
+        # 播放当前页时提前合成之后几页
+        async with contextlib.aclosing(prefetch_speeches(tts, preparation, lookahead, stream_audio)) as speeches:
+            async for speech in speeches:
+
+                # 课件总结
+                if speech.index is None:
+                    print(f"conclusion: \n{speech.text}\n")
+                    print(f"emotion: \n{str(speech.emotion)}\n")
+
+                    current = play(speech)
+                    await wait_played()
+                    playing = current
+                    break
+
+                # 课件主体内容
+                print(f"lecture: \n{speech.text}\n")
+                print(f"emotion: \n{str(speech.emotion)}\n")
+
+                # 播放音频，等上一段播放完后再准备下一段
+                current = play(speech)
+                await wait_played()
+                playing = current
+
+                # 问题中断
+                if not allow_questions or speech.index >= len(text_lectures_questions):
+                    continue
+
+                for text_question in text_lectures_questions[speech.index]:
+                    # 回答要在这一页播放完之后播放
+                    await wait_played()
+
+                    # 同一页中相同或近似的问题只生成一次
+                    answer = await preparation.answers.get_or_create(
+                        speech.index,
+                        text_question,
+                        lambda: prepare_answer(tts, preparation, text_question, speech.index, gate, limiter, stream_audio),
                     )
-
-                    text_answer = "\n".join(ssml_to_raw_texts(ssml_answer))
+                    speech_answer = answer.speech
+                    if speech_answer is None:
+                        # 流式合成时音频在第一次播放后已经在TTS缓存中
+                        speech_answer = await prepare_speech(tts, "".join(answer.fragments), stream_audio=stream_audio)
 
                     # 打印问题和答案
                     print(f"question: {text_question}\n")
-                    print(f"answer: {text_answer}\n")
-                    print(f"emotion: {str(emotion(text_answer))}\n")
+                    print(f"answer: {speech_answer.text}\n")
+                    print(f"emotion: {str(speech_answer.emotion)}\n")
 
                     # 播放音频
-                    audio_answer = await tts.audio(ssml_answer)
-                    player.play(audio_answer)
-
-        # 课件总结
-        text_conclusion = "\n".join(ssml_to_raw_texts(ssml_conclusion))
+                    playing = play(speech_answer)
 
-        print(f"conclusion: \n{text_conclusion}\n")
-        print(f"emotion: \n{str(emotion(text_conclusion))}\n")
-
-        audio_conclusion = await tts.audio(ssml_conclusion)
-        player.play(audio_conclusion)
+        await wait_played()
+        print(f"audio underruns: {player.underruns} ({player.underrun_ms:.0f} ms)")
 
 
 async def main(
     pptx_path: str,
     cache_path: str,
+    tts_cache_path: str,
+    context_window: Optional[int],
+    parallel: int,
+    requests_per_minute: Optional[int],
+    lookahead: int,
+    questions_per_slide: int,
 ):
     await demo_local(
         pptx_path=pptx_path,
         cache_path=cache_path,
+        tts_cache_path=tts_cache_path,
         allow_questions=True,
+        context_window=context_window,
+        parallel=parallel,
+        requests_per_minute=requests_per_minute,
+        lookahead=lookahead,
+        questions_per_slide=questions_per_slide,
     )
     # await demo_remote(
     #     pptx_path=pptx_path,
     #     cache_path=cache_path,
+    #     tts_cache_path=tts_cache_path,
     #     allow_questions=True,
+    #     stream_audio=False,
+    #     context_window=context_window,
+    #     parallel=parallel,
+    #     requests_per_minute=requests_per_minute,
+    #     lookahead=lookahead,
+    #     questions_per_slide=questions_per_slide,
+    #     interrupt_for_questions=False,
     # )
 
 
@@ -216,12 +672,54 @@ if __name__ == "__main__":
     parser.add_argument(
         "--cache_path",
         type=str,
-        help="Path to the cache pickle file.",
+        help="Path to the lecture cache JSON file.",
+    )
+    parser.add_argument(
+        "--tts_cache_path",
+        type=str,
+        default=None,
+        help="Path to the TTS audio cache directory. Defaults to a 'tts' directory next to the lecture cache file.",
+    )
+    parser.add_argument(
+        "--context_window",
+        type=int,
+        default=None,
+        help="Number of recent slides kept in the LLM context when generating lectures; older slides are summarized. Defaults to keeping all slides.",
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=0,
+        help="Generate lectures for this many slides concurrently, using a deck outline as shared context. 0 generates slides one by one.",
+    )
+    parser.add_argument(
+        "--requests_per_minute",
+        type=int,
+        default=None,
+        help="Maximum LLM requests per minute, shared by lecture generation, live answers and precomputed answers.",
+    )
+    parser.add_argument(
+        "--lookahead",
+        type=int,
+        default=2,
+        help="Number of upcoming slides whose audio is synthesized while the current slide plays.",
+    )
+    parser.add_argument(
+        "--precompute_questions",
+        type=int,
+        default=0,
+        help="Number of likely student questions per slide whose answers are generated and synthesized in the background after the lectures are prepared. 0 disables it.",
     )
     args = parser.parse_args()
     asyncio.run(
         main(
             pptx_path=args.pptx_path,
             cache_path=args.cache_path,
+            tts_cache_path=args.tts_cache_path or os.path.join(os.path.dirname(args.cache_path), "tts"),
+            context_window=args.context_window,
+            parallel=args.parallel,
+            requests_per_minute=args.requests_per_minute,
+            lookahead=args.lookahead,
+            questions_per_slide=args.precompute_questions,
         )
     )
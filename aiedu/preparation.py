@@ -0,0 +1,143 @@
+import asyncio
+import os
+import sys
+from typing import AsyncGenerator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from aiedu.answer_cache import AnswerCache
+from aiedu.retrieval import LectureIndex
+
+# 生成各页讲稿和总结的协程函数，参数为每生成一页时的回调 (页码, SSML)
+PrepareFunction = Callable[[Callable[[int, str], None]], Awaitable[Tuple[List[str], str]]]
+
+# 由各页讲稿和总结 (可能为 None) 建立检索索引的函数，在线程中执行
+IndexFunction = Callable[[List[str], Optional[str]], LectureIndex]
+
+
+class LecturePreparation:
+    """一份课件的讲稿准备过程，由多个连接共享
+
+    创建时立即开始生成；各连接可以按页顺序等待已生成的讲稿，不必等全部生成完。
+    生成完成后在后台建立回答问题用的检索索引，并可以在后台运行 precompute (例如预先生成可能的问题和回答)；
+    检索索引和问题回答的缓存由各连接共享。
+    """
+
+    def __init__(
+        self,
+        prepare: PrepareFunction,
+        build_index: IndexFunction = LectureIndex.from_lectures,
+        precompute: Optional[Callable[["LecturePreparation"], Awaitable[None]]] = None,
+    ):
+        # {页码: SSML}，并行生成时各页完成的顺序不定
+        self._lectures: Dict[int, str] = {}
+        self._changed = asyncio.Event()
+        self._build_index = build_index
+        self._index: Optional[asyncio.Task] = None
+        # 生成完成前的部分索引 (包含的页数, 建立索引的任务)，页数不变时复用
+        self._partial_index: Optional[Tuple[int, asyncio.Future]] = None
+        self.answers = AnswerCache()
+        self._precompute = precompute
+        self.precompute_task: Optional[asyncio.Task] = None
+        self.task = asyncio.create_task(prepare(self._on_slide))
+        self.task.add_done_callback(self._on_done)
+
+    def _on_slide(
+        self,
+        index: int,
+        ssml: str,
+    ):
+        self._lectures[index] = ssml
+        self._changed.set()
+
+    def _on_done(
+        self,
+        task: asyncio.Task,
+    ):
+        # 取出异常，没有连接在等待时也不会警告 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+        self._changed.set()
+        if not self.failed:
+            self._index = asyncio.create_task(asyncio.to_thread(self._build_index, *task.result()))
+            if self._precompute is not None:
+                self.precompute_task = asyncio.create_task(self._precompute(self))
+                self.precompute_task.add_done_callback(self._on_precompute_done)
+
+    def _on_precompute_done(
+        self,
+        task: asyncio.Task,
+    ):
+        # 后台任务没有等待者，出错时只打印
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[preparation] precompute failed: {task.exception()!r}", file=sys.stderr)
+
+    @property
+    def failed(self) -> bool:
+        return self.task.done() and (self.task.cancelled() or self.task.exception() is not None)
+
+    async def lectures(self) -> AsyncGenerator[str, None]:
+        """按页顺序产出讲稿，某一页生成后立即产出；生成失败时抛出异常"""
+        index = 0
+        while True:
+            if index in self._lectures:
+                yield self._lectures[index]
+                index += 1
+                continue
+            if self.task.done():
+                # 生成完成后以最终结果为准
+                ssml_lectures, _ = await asyncio.shield(self.task)
+                for ssml in ssml_lectures[index:]:
+                    yield ssml
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+    async def result(self) -> Tuple[List[str], str]:
+        """等待全部生成完成，返回 (各页讲稿, 总结)；单个等待者取消不会取消生成"""
+        return await asyncio.shield(self.task)
+
+    async def index(self) -> LectureIndex:
+        """回答问题用的检索索引；生成完成前只包含已经按顺序生成的页，按页数缓存，有新的页生成后才重建"""
+        if self._index is not None:
+            return await asyncio.shield(self._index)
+        lectures = []
+        while len(lectures) in self._lectures:
+            lectures.append(self._lectures[len(lectures)])
+        partial = self._partial_index
+        if partial is not None and partial[1].done() and (partial[1].cancelled() or partial[1].exception() is not None):
+            # 建立失败时下次重建
+            partial = None
+        if partial is None or partial[0] != len(lectures):
+            build = asyncio.ensure_future(asyncio.to_thread(self._build_index, lectures, None))
+            partial = self._partial_index = (len(lectures), build)
+        return await asyncio.shield(partial[1])
+
+
+class LecturePreparations:
+    """按课件登记进行中和已完成的讲稿准备，同一份课件同时只生成一次
+
+    键包含 PPTX 的修改时间和大小，文件变化后会重新准备；失败的准备不会被复用。
+    """
+
+    def __init__(self):
+        self._preparations: Dict[Hashable, LecturePreparation] = {}
+
+    @staticmethod
+    def key(
+        pptx_path: str,
+        *options: Hashable,
+    ) -> Hashable:
+        stat = os.stat(pptx_path)
+        return (os.path.abspath(pptx_path), stat.st_mtime_ns, stat.st_size, *options)
+
+    def get(
+        self,
+        key: Hashable,
+        prepare: PrepareFunction,
+        build_index: IndexFunction = LectureIndex.from_lectures,
+        precompute: Optional[Callable[[LecturePreparation], Awaitable[None]]] = None,
+    ) -> LecturePreparation:
+        preparation: Optional[LecturePreparation] = self._preparations.get(key)
+        if preparation is None or preparation.failed:
+            preparation = LecturePreparation(prepare, build_index, precompute)
+            self._preparations[key] = preparation
+        return preparation
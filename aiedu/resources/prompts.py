@@ -22,3 +22,14 @@ PROMPT_QUESTION_TO_SSMLS = """
 </speak>
 ```
 """
+
+PROMPT_LECTURE_TO_QUESTIONS = """
+你是一个AI教师，你刚才根据下面的讲稿向学生讲解了一页课件。请预测学生听完这一页后最可能提出的{count}个问题。
+问题要简短、口语化，像学生在课堂上直接提问一样，每个问题单独一行，不要编号，无需包含其他的任何内容。
+
+请注意，请务必使用 ```questions 和 ``` 来包裹问题，例如：
+```questions
+什么是信息隐藏？
+为什么要先做设计再写代码？
+```
+"""
@@ -0,0 +1,183 @@
+import json
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from aiedu.utils.ssml import SENTENCE_PATTERN, ssml_to_raw_texts
+
+# 检索时忽略的常见虚词和疑问词
+_STOPWORDS = frozenset(
+    "的 了 是 在 和 与 及 或 也 都 就 而 但 这 那 这个 那个 这些 那些 一个 一种 有 没有 吗 呢 吧 啊 呀 么 "
+    "什么 怎么 怎样 如何 为什么 哪些 哪个 多少 请问 请 老师 我 我们 你 你们 他 她 它 他们 可以 能 会 要 "
+    "对 把 被 从 到 给 让 之 其 中 上 下 还 又 再 很 更 最 如果 因为 所以 a an the of to in is are what how why".split()
+)
+
+_WORD_PATTERN = re.compile(r"\w")
+
+
+class LecturePassage(NamedTuple):
+    """检索的单位: 一页中的几个连续句子"""
+
+    slide: Optional[int]  # 页码，总结为 None
+    source: str  # "lecture": 讲稿, "slide": 页面文字, "table": 表格, "note": 注释, "conclusion": 总结
+    text: str
+
+
+def _tokenize(
+    text: str,
+) -> List[str]:
+    # jieba 导入时会加载分词模型 (~1s)，推迟到第一次使用
+    import jieba
+
+    tokens = []
+    for token in jieba.lcut_for_search(text.lower()):
+        token = token.strip()
+        if token and token not in _STOPWORDS and _WORD_PATTERN.search(token):
+            tokens.append(token)
+    return tokens
+
+
+def _chunks(
+    texts: Iterable[str],
+    chunk_chars: int,
+) -> List[str]:
+    """按句切分，连续的句子合并为不超过 chunk_chars 字的段落"""
+    chunks, current = [], ""
+    for text in texts:
+        for sentence in SENTENCE_PATTERN.findall(re.sub(r"\s+", " ", text).strip()):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if current and len(current) + len(sentence) > chunk_chars:
+                chunks.append(current)
+                current = ""
+            current += sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _table_texts(
+    table: str,
+) -> List[str]:
+    """表格 (json) 每行转为一句"""
+    return ["，".join(cell for cell in row if cell) + "。" for row in json.loads(table)]
+
+
+class LectureIndex:
+    """整份课件的 BM25 检索索引，回答问题时只把最相关的几段作为上下文发给LLM
+
+    段落来自各页讲稿、页面文字、表格、注释和总结，按句切分后用 jieba 分词；
+    上下文的大小与课件长度无关。
+    """
+
+    def __init__(
+        self,
+        passages: Sequence[LecturePassage],
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.passages = list(passages)
+        self.k1 = k1
+        self.b = b
+        # 倒排表 {词: [(段落序号, 词频)]}
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._lengths: List[int] = []
+        for i, passage in enumerate(self.passages):
+            counts = Counter(_tokenize(passage.text))
+            self._lengths.append(sum(counts.values()))
+            for token, count in counts.items():
+                self._postings[token].append((i, count))
+        self._average_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+
+    @classmethod
+    def from_lectures(
+        cls,
+        ssml_lectures: Sequence[str],
+        ssml_conclusion: Optional[str] = None,
+        slides: Optional[Sequence[Tuple[List[str], List[str], List[str], str]]] = None,
+        chunk_chars: int = 120,
+    ) -> "LectureIndex":
+        """
+        参数:
+            ssml_lectures (Sequence[str]): 各页讲稿的SSML。
+            ssml_conclusion (Optional[str]): 总结的SSML。
+            slides (Optional[Sequence[Tuple]]): pptx_slides 读取的各页内容，用于索引页面文字、表格和注释。
+            chunk_chars (int): 每个段落的最大字数。
+        """
+        passages = []
+        for index, ssml in enumerate(ssml_lectures):
+            passages += [LecturePassage(index, "lecture", text) for text in _chunks(ssml_to_raw_texts(ssml), chunk_chars)]
+        for index, (texts, _, tables, note) in enumerate(slides or []):
+            passages += [LecturePassage(index, "slide", text) for text in _chunks(texts, chunk_chars)]
+            for table in tables:
+                passages += [LecturePassage(index, "table", text) for text in _chunks(_table_texts(table), chunk_chars)]
+            passages += [LecturePassage(index, "note", text) for text in _chunks([note], chunk_chars)]
+        if ssml_conclusion:
+            passages += [LecturePassage(None, "conclusion", text) for text in _chunks(ssml_to_raw_texts(ssml_conclusion), chunk_chars)]
+        return cls(passages)
+
+    def search(
+        self,
+        question: str,
+        k: int = 5,
+        slide: Optional[int] = None,
+        slide_boost: float = 1.5,
+    ) -> List[Tuple[float, LecturePassage]]:
+        """
+        检索与问题最相关的 k 个段落。
+
+        参数:
+            question (str): 学生提出的问题。
+            k (int): 返回的段落数。
+            slide (Optional[int]): 正在讲解的页码，这一页的段落得分乘以 slide_boost。
+
+        返回:
+            List[Tuple[float, LecturePassage]]: [(得分, 段落)]，按得分从高到低，不包含得分为 0 的段落。
+        """
+        return [(score, self.passages[i]) for i, score in self._rank(question, k, slide, slide_boost)]
+
+    def _rank(
+        self,
+        question: str,
+        k: int,
+        slide: Optional[int],
+        slide_boost: float,
+    ) -> List[Tuple[int, float]]:
+        scores: Dict[int, float] = defaultdict(float)
+        n = len(self.passages)
+        for token in set(_tokenize(question)):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, count in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / self._average_length)
+                scores[i] += idf * count * (self.k1 + 1) / (count + norm)
+        if slide is not None:
+            for i in scores:
+                if self.passages[i].slide == slide:
+                    scores[i] *= slide_boost
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def contexts(
+        self,
+        question: str,
+        k: int = 5,
+        slide: Optional[int] = None,
+        slide_boost: float = 1.5,
+    ) -> List[str]:
+        """
+        检索回答问题用的上下文，可以直接作为 llm_ssml_answer 的 contexts。
+
+        段落的选取与 search 相同；按在课件中的顺序排列并标注页码，没有相关段落时使用正在讲解的页的讲稿。
+        """
+        indices = sorted(i for i, _ in self._rank(question, k, slide, slide_boost))
+        if not indices:
+            indices = [i for i, passage in enumerate(self.passages) if passage.slide == slide and passage.source == "lecture"][:k]
+        passages = [self.passages[i] for i in indices]
+        return [
+            "[{}] {}".format("总结" if passage.slide is None else f"第{passage.slide + 1}页", passage.text)
+            for passage in passages
+        ]
@@ -1,3 +1,42 @@
+import asyncio
+import io
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, AsyncIterable, List, Optional
+
+from pydub import AudioSegment
+
+
+@dataclass
+class TTSBoundary:
+    """TTS 返回的词边界，时间单位为毫秒"""
+
+    offset: float
+    duration: float
+    text: str
+
+
+@dataclass
+class TTSAudio:
+    """TTS 合成的音频
+
+    保留 TTS 返回的原始编码数据，可以直接发送给客户端；
+    只有在需要 PCM 时 (本地播放、计算口型包络等) 才解码，且只解码一次。
+    """
+
+    data: bytes
+    format: str = "mp3"
+    # None 表示没有词边界，例如缓存的流式合成结果
+    boundaries: Optional[List[TTSBoundary]] = field(default_factory=list)
+    _segment: Optional[AudioSegment] = field(default=None, init=False, repr=False)
+
+    @property
+    def segment(self) -> AudioSegment:
+        """解码后的音频"""
+        if self._segment is None:
+            self._segment = AudioSegment.from_file(io.BytesIO(self.data), format=self.format)
+        return self._segment
+
+
 class BaseTTS:
 
     def __init__(
@@ -5,8 +44,53 @@ class BaseTTS:
     ):
         pass
 
-    def audio(
+    async def audio(
         self,
         ssml: str,
-    ):
+    ) -> TTSAudio:
         pass
+
+    async def stream(
+        self,
+        ssml: str,
+    ) -> AsyncGenerator[bytes, None]:
+        """流式生成音频，合成出一块就产出一块编码数据。
+
+        默认合成完整的音频后一次产出，支持流式的 TTS 应覆盖此方法。
+        """
+        audio = await self.audio(ssml)
+        yield audio.data
+
+    async def stream_ssml(
+        self,
+        fragments: AsyncIterable[str],
+    ) -> AsyncGenerator[bytes, None]:
+        """边接收SSML片段 (例如LLM的流式输出) 边合成，按顺序产出每个片段的音频。
+
+        每个片段一到就开始合成，与后续片段的生成重叠。
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def produce():
+            try:
+                async for fragment in fragments:
+                    await queue.put(asyncio.ensure_future(self.audio(fragment)))
+            finally:
+                await queue.put(None)
+
+        producer = asyncio.ensure_future(produce())
+        tasks = []
+        try:
+            while (task := await queue.get()) is not None:
+                tasks.append(task)
+                yield (await task).data
+            # 生成片段时出错则抛出
+            await producer
+        finally:
+            producer.cancel()
+            for task in tasks:
+                task.cancel()
+            while not queue.empty():
+                task = queue.get_nowait()
+                if task is not None:
+                    task.cancel()
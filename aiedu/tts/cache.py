@@ -0,0 +1,331 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from typing import AsyncGenerator, Awaitable, Callable, Dict, List, Optional
+
+from aiedu.tts.base import BaseTTS, TTSAudio, TTSBoundary
+
+
+class TTSCache:
+    """按内容寻址的 TTS 音频缓存
+
+    键为 hash(ssml, voice, backend, format)，磁盘上每条缓存一个文件:
+    第一行为 JSON 元数据 (格式、词边界)，之后为编码后的音频数据。
+    文件先写入临时文件再 rename，多个进程同时读写也不会读到半个文件；
+    同一进程中对同一个键的并发请求只合成一次。
+
+    磁盘和内存都按字节数限制大小，超出时淘汰最久未使用的条目。
+    """
+
+    SUFFIX = ".tts"
+
+    def __init__(
+        self,
+        directory: str,
+        memory_bytes: int = 64 * 1024 * 1024,
+        disk_bytes: int = 1024 * 1024 * 1024,
+    ):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        # {key: (data, format, boundaries)}，按使用顺序排列
+        self._memory: OrderedDict = OrderedDict()
+        self._memory_size = 0
+        self._disk_size: Optional[int] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def key(
+        ssml: str,
+        voice: str,
+        backend: str,
+        format: str,
+    ) -> str:
+        return hashlib.sha256(json.dumps([ssml, voice, backend, format]).encode("utf-8")).hexdigest()
+
+    def _path(
+        self,
+        key: str,
+    ) -> str:
+        return os.path.join(self.directory, key[:2], key + TTSCache.SUFFIX)
+
+    def _memory_get(
+        self,
+        key: str,
+    ) -> Optional[TTSAudio]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        self._memory.move_to_end(key)
+        data, format, boundaries = entry
+        return TTSAudio(data=data, format=format, boundaries=list(boundaries))
+
+    def _memory_put(
+        self,
+        key: str,
+        audio: TTSAudio,
+    ):
+        if len(audio.data) > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key)[0])
+        self._memory[key] = (audio.data, audio.format, tuple(audio.boundaries))
+        self._memory_size += len(audio.data)
+        while self._memory_size > self.memory_bytes:
+            _, (data, _, _) = self._memory.popitem(last=False)
+            self._memory_size -= len(data)
+
+    def _disk_read(
+        self,
+        key: str,
+    ) -> Optional[TTSAudio]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                meta, data = f.read().split(b"\n", 1)
+            meta = json.loads(meta)
+            format = meta["format"]
+            boundaries = None if meta["boundaries"] is None else [TTSBoundary(*boundary) for boundary in meta["boundaries"]]
+            # 更新修改时间，作为最近使用的时间
+            os.utime(path)
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            # 不存在或损坏的条目视为未命中，重新合成后会被覆盖
+            return None
+        return TTSAudio(data=data, format=format, boundaries=boundaries)
+
+    def _disk_write(
+        self,
+        key: str,
+        audio: TTSAudio,
+    ):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        boundaries = None if audio.boundaries is None else [[b.offset, b.duration, b.text] for b in audio.boundaries]
+        meta = json.dumps({"format": audio.format, "boundaries": boundaries}, ensure_ascii=False).encode("utf-8")
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(meta)
+                f.write(b"\n")
+                f.write(audio.data)
+            # 覆盖已有的条目 (例如损坏的条目) 时减去旧文件的大小
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        if self._disk_size is None:
+            self._disk_size = sum(size for _, size, _ in self._disk_entries())
+        else:
+            self._disk_size += len(meta) + 1 + len(audio.data) - replaced
+        if self._disk_size > self.disk_bytes:
+            self._disk_evict()
+
+    def _disk_entries(self) -> list:
+        """[(修改时间, 大小, 路径)]"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                if not file.endswith(TTSCache.SUFFIX):
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _disk_evict(self):
+        """按修改时间从旧到新删除，直到不超过磁盘限额"""
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._disk_size = total
+
+    async def get(
+        self,
+        key: str,
+    ) -> Optional[TTSAudio]:
+        """先查内存，再查磁盘"""
+        audio = self._memory_get(key)
+        if audio is not None:
+            return audio
+        audio = await asyncio.to_thread(self._disk_read, key)
+        if audio is not None and audio.boundaries is not None:
+            self._memory_put(key, audio)
+        return audio
+
+    async def put(
+        self,
+        key: str,
+        audio: TTSAudio,
+    ):
+        if audio.boundaries is not None:
+            self._memory_put(key, audio)
+        await asyncio.to_thread(self._disk_write, key, audio)
+
+    async def get_or_create(
+        self,
+        key: str,
+        create: Callable[[], Awaitable[TTSAudio]],
+    ) -> TTSAudio:
+        """命中缓存直接返回，否则调用 create 合成并写入缓存；同一个键同时只合成一次"""
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            audio = await self.get(key)
+            if audio is None or audio.boundaries is None:
+                audio = await create()
+                await self.put(key, audio)
+            future.set_result(audio)
+            return audio
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+
+class _SharedStream:
+    """一次流式合成产出的音频块，可以被多个读者从头读取"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def append(
+        self,
+        chunk: bytes,
+    ):
+        self.chunks.append(chunk)
+        self._changed.set()
+
+    def close(
+        self,
+        error: Optional[BaseException] = None,
+    ):
+        self.done = True
+        self.error = error
+        self._changed.set()
+
+    async def follow(self) -> AsyncGenerator[bytes, None]:
+        index = 0
+        while True:
+            if index < len(self.chunks):
+                index += 1
+                yield self.chunks[index - 1]
+                continue
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+
+class CachedTTS(BaseTTS):
+    """在另一个 TTS 前加一层 TTSCache，命中时不再请求 TTS 服务"""
+
+    def __init__(
+        self,
+        tts: BaseTTS,
+        cache: TTSCache,
+        format: str = "mp3",
+    ):
+        super().__init__()
+        self.tts = tts
+        self.cache = cache
+        self.format = format
+        # {键: 进行中的流式合成}
+        self._streams: Dict[str, _SharedStream] = {}
+
+    def _key(
+        self,
+        ssml: str,
+    ) -> str:
+        return TTSCache.key(
+            ssml=ssml,
+            voice=getattr(self.tts, "voice", ""),
+            backend=type(self.tts).__name__,
+            format=self.format,
+        )
+
+    async def audio(
+        self,
+        ssml: str,
+    ) -> TTSAudio:
+        return await self.cache.get_or_create(self._key(ssml), lambda: self.tts.audio(ssml))
+
+    async def stream(
+        self,
+        ssml: str,
+    ) -> AsyncGenerator[bytes, None]:
+        """命中时一次产出缓存的音频；否则透传 TTS 的流，结束后写入缓存 (不含词边界)
+
+        同一个键同时只合成一次，后来的读者从头读取同一个流。合成在后台任务中进行，
+        读者提前退出不会中断合成，合成完成后仍会写入缓存。
+        """
+        key = self._key(ssml)
+        audio = await self.cache.get(key)
+        if audio is not None:
+            yield audio.data
+            return
+
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = _SharedStream()
+            self._streams[key] = shared
+            shared.task = asyncio.create_task(self._produce(key, ssml, shared))
+        async for chunk in shared.follow():
+            yield chunk
+
+    async def _produce(
+        self,
+        key: str,
+        ssml: str,
+        shared: _SharedStream,
+    ):
+        try:
+            try:
+                async for chunk in self.tts.stream(ssml):
+                    shared.append(chunk)
+            except BaseException as e:
+                # 异常交给读者处理
+                shared.close(e)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                return
+            shared.close()
+            await self.cache.put(key, TTSAudio(data=b"".join(shared.chunks), format=self.format, boundaries=None))
+        finally:
+            del self._streams[key]
@@ -1,9 +1,11 @@
-import io
-from aiedu.tts.base import BaseTTS
-from aiedu.utils.decorator import async_retry
-from aiedu.utils.ssml import ssml_to_raw_texts
+import asyncio
+from typing import AsyncGenerator
 
-from pydub import AudioSegment
+from aiedu.tts.base import BaseTTS, TTSAudio, TTSBoundary
+from aiedu.utils.audio import mp3_duration_ms, mp3_silence
+from aiedu.utils.decorator import async_generator_retry, async_retry
+from aiedu.utils.prefetch import BufferedStream
+from aiedu.utils.ssml import ssml_to_segments
 
 import edge_tts
 
@@ -12,23 +14,116 @@ class EdgeTTS(BaseTTS):
     def __init__(
         self,
         voice: str = "zh-CN-XiaoyiNeural",
+        concurrency: int = 4,
     ):
         super().__init__()
         self.voice = voice
+        # 同时进行的合成请求数
+        self.semaphore = asyncio.Semaphore(concurrency)
 
     @async_retry(max_retry=10)
+    async def _audio_text(
+        self,
+        text: str,
+    ) -> TTSAudio:
+        """合成一段原始文本"""
+        async with self.semaphore:
+            # 创建 Communicate 对象
+            communicate = edge_tts.Communicate(text=text, voice=self.voice, boundary="WordBoundary")
+            # 通过流式获取音频数据和词边界并存储
+            chunks = []
+            boundaries = []
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    chunks.append(chunk["data"])
+                elif chunk["type"] == "WordBoundary":
+                    # offset, duration 的单位为 100ns
+                    boundaries.append(TTSBoundary(chunk["offset"] / 10_000, chunk["duration"] / 10_000, chunk["text"]))
+            return TTSAudio(data=b"".join(chunks), format="mp3", boundaries=boundaries)
+
+    @async_generator_retry(max_retry=10)
+    async def _stream_text(
+        self,
+        text: str,
+    ) -> AsyncGenerator[bytes, None]:
+        """流式合成一段原始文本，收到一块音频就产出一块；已经产出后出错不再重试"""
+        async with self.semaphore:
+            communicate = edge_tts.Communicate(text=text, voice=self.voice)
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    yield chunk["data"]
+
+    def _audio_tasks(
+        self,
+        ssml: str,
+    ):
+        """按句子和 <break> 切分SSML，并发合成各段
+
+        返回:
+            [(合成任务 或 None, 之后停顿的毫秒数)]
+        """
+        return [
+            (asyncio.ensure_future(self._audio_text(text)) if text else None, pause)
+            for text, pause in ssml_to_segments(ssml)
+        ]
+
     async def audio(
         self,
         ssml: str,
-    ) -> AudioSegment:
-        """将SSML文本转换为原始文本并生成音频"""
-        # 将 SSML 文本转换为原始文本
-        text = "\n".join(ssml_to_raw_texts(ssml))
-        # 创建 Communicate 对象
-        communicate = edge_tts.Communicate(text=text, voice=self.voice)
-        # 通过流式获取音频数据并存储
-        audio = bytearray()
-        async for chunk in communicate.stream():
-            if chunk["type"] == "audio":
-                audio.extend(chunk["data"])
-        return AudioSegment.from_file(io.BytesIO(audio), format="mp3")
+    ) -> TTSAudio:
+        """将SSML按句子和 <break> 切分后并发生成音频，再按顺序拼接，<break> 处插入静音"""
+        tasks = self._audio_tasks(ssml)
+        try:
+            await asyncio.gather(*(task for task, _ in tasks if task is not None))
+        finally:
+            for task, _ in tasks:
+                if task is not None:
+                    task.cancel()
+
+        # 保留原始的 mp3 数据，直接拼接，需要时再解码
+        chunks = []
+        boundaries = []
+        offset = 0
+        for task, pause in tasks:
+            if task is not None:
+                audio = task.result()
+                chunks.append(audio.data)
+                boundaries.extend(TTSBoundary(b.offset + offset, b.duration, b.text) for b in audio.boundaries)
+                offset += mp3_duration_ms(audio.data)
+            if pause:
+                silence = mp3_silence(pause)
+                chunks.append(silence)
+                offset += mp3_duration_ms(silence)
+        return TTSAudio(data=b"".join(chunks), format="mp3", boundaries=boundaries)
+
+    async def stream(
+        self,
+        ssml: str,
+    ) -> AsyncGenerator[bytes, None]:
+        """第一段边合成边产出，尽快开始播放；之后的各段同时并发合成，按顺序每完成一段就产出一段"""
+        segments = ssml_to_segments(ssml)
+        first = next((i for i, (text, _) in enumerate(segments) if text), len(segments))
+        # 先在后台开始流式合成第一段，再创建之后各段的任务，第一段总能先得到并发名额
+        chunks = BufferedStream(self._stream_text(segments[first][0])) if first < len(segments) else None
+        tasks = [
+            (asyncio.ensure_future(self._audio_text(text)) if text else None, pause)
+            for text, pause in segments[first + 1 :]
+        ]
+        try:
+            for text, pause in segments[: first + 1]:
+                if text:
+                    async for chunk in chunks:
+                        yield chunk
+                if pause:
+                    yield mp3_silence(pause)
+            for task, pause in tasks:
+                if task is not None:
+                    yield (await task).data
+                if pause:
+                    yield mp3_silence(pause)
+        finally:
+            if chunks is not None:
+                chunks.cancel()
+            for task, _ in tasks:
+                if task is not None:
+                    task.cancel()
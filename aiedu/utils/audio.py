@@ -1,19 +1,230 @@
 import asyncio
 import queue
+import shutil
+import subprocess
 import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import AsyncIterable, Deque, Iterator, Tuple, Union
 
+import numpy as np
 from pydub import AudioSegment
 from pydub.playback import play
 
+from aiedu.tts.base import TTSAudio
+
+
+# 与 edge_tts 的输出格式 (audio-24khz-48kbitrate-mono-mp3) 一致的 MP3 静音帧:
+# MPEG-2 Layer III, 48kbps, 24kHz, 单声道, 无 CRC, 每帧 144 字节、576 个采样；
+# 边信息和主数据全为 0，解码后为静音。
+_MP3_SILENT_FRAME = bytes([0xFF, 0xF3, 0x64, 0xC0]) + bytes(140)
+_MP3_FRAME_MS = 576 / 24_000 * 1000
+
+
+class _PCMRingBuffer:
+    """线程安全的定长环形缓冲区，写满时写入方等待"""
+
+    def __init__(
+        self,
+        capacity: int,
+    ):
+        self._buffer = bytearray(capacity)
+        self._start = 0
+        self.size = 0
+        # 累计写入的字节数，在 condition 下更新
+        self.written = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def write(
+        self,
+        data: bytes,
+    ):
+        view = memoryview(data)
+        capacity = len(self._buffer)
+        with self.condition:
+            while view:
+                while self.size == capacity and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                end = (self._start + self.size) % capacity
+                n = min(len(view), capacity - self.size, capacity - end)
+                self._buffer[end : end + n] = view[:n]
+                self.size += n
+                self.written += n
+                view = view[n:]
+                self.condition.notify_all()
+
+    def read(
+        self,
+        n: int,
+    ) -> bytes:
+        """读取最多 n 字节，不等待"""
+        capacity = len(self._buffer)
+        with self.condition:
+            n = min(n, self.size)
+            first = min(n, capacity - self._start)
+            data = bytes(self._buffer[self._start : self._start + first]) + bytes(self._buffer[: n - first])
+            self._start = (self._start + n) % capacity
+            self.size -= n
+            self.condition.notify_all()
+            return data
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class _PyAudioOutput:
+    """通过 PyAudio 输出 PCM，write 按实时速度阻塞"""
+
+    def __init__(
+        self,
+        sample_rate: int,
+        channels: int,
+    ):
+        import pyaudio
+
+        self._pyaudio = pyaudio.PyAudio()
+        self._stream = self._pyaudio.open(format=pyaudio.paInt16, channels=channels, rate=sample_rate, output=True)
+
+    def write(
+        self,
+        data: bytes,
+    ):
+        self._stream.write(data)
+
+    def close(self):
+        self._stream.stop_stream()
+        self._stream.close()
+        self._pyaudio.terminate()
+
+
+class _FFplayOutput:
+    """通过一个长期运行的 ffplay 进程输出 PCM"""
+
+    def __init__(
+        self,
+        sample_rate: int,
+        channels: int,
+    ):
+        self._process = subprocess.Popen(
+            ["ffplay", "-nodisp", "-autoexit", "-loglevel", "error", "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0"],
+            stdin=subprocess.PIPE,
+        )
+
+    def write(
+        self,
+        data: bytes,
+    ):
+        self._process.stdin.write(data)
+        self._process.stdin.flush()
+
+    def close(self):
+        self._process.stdin.close()
+        self._process.wait()
+
+
+def _default_output(
+    sample_rate: int,
+    channels: int,
+):
+    """优先使用 PyAudio，没有安装时使用 ffplay"""
+    try:
+        return _PyAudioOutput(sample_rate, channels)
+    except ImportError:
+        pass
+    if shutil.which("ffplay"):
+        return _FFplayOutput(sample_rate, channels)
+    raise RuntimeError("No audio output available, install pyaudio or ffmpeg (ffplay)")
+
+
+class AudioStreamWriter:
+    """NonBlockingAudioQueuePlayer.open_stream 返回的写入端，write 不阻塞"""
+
+    def __init__(
+        self,
+        format: str,
+    ):
+        self.format = format
+        self.future = Future()
+        self._chunks: queue.Queue = queue.Queue()
+
+    def write(
+        self,
+        chunk: bytes,
+    ):
+        self._chunks.put(chunk)
+
+    def close(self):
+        self._chunks.put(None)
+
+    def chunks(self) -> Iterator[bytes]:
+        while (chunk := self._chunks.get()) is not None:
+            yield chunk
+
 
 class NonBlockingAudioQueuePlayer:
-    def __init__(self):
+    """按顺序无间隙地播放音频
+
+    所有音频解码为同一格式的 PCM，写入一个有界的环形缓冲区，由一个长期打开的输出流连续播放；
+    编码的音频 (TTSAudio 或流式合成的数据块) 轮到时才边解码边写入，不会整段解码后留在内存中。
+    当前一段解码完成时立即开始解码下一段，因此段与段之间没有间隙。
+
+    正在解码的音频来不及写入缓冲区时输出静音并计入 underruns / underrun_ms，可以据此调整提前量。
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 24_000,
+        channels: int = 1,
+        buffer_ms: int = 2000,
+        period_ms: int = 20,
+        output=None,
+    ):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self._frame_bytes = 2 * channels
+        self._period = self._ms_to_bytes(period_ms)
+        self._ring = _PCMRingBuffer(self._ms_to_bytes(buffer_ms))
         self._queue = queue.Queue()
-        self._th = threading.Thread(target=self._worker)
+        self._output = output
+        # [(这一段在 PCM 流中的结束位置, Future)]
+        self._ends: Deque[Tuple[int, Future]] = deque()
+        # 正在解码或排队等待解码的音频数
+        self._feeding = 0
+        self._feeding_lock = threading.Lock()
+        self._feeder = threading.Thread(target=self._feed, name="audio-feeder")
+        self._player = threading.Thread(target=self._play, name="audio-player")
+        self.underruns = 0
+        self.underrun_ms = 0.0
+
+    def _ms_to_bytes(
+        self,
+        ms: float,
+    ) -> int:
+        return int(self.sample_rate * ms / 1000) * self._frame_bytes
+
+    def _bytes_to_ms(
+        self,
+        n: int,
+    ) -> float:
+        return n / self._frame_bytes / self.sample_rate * 1000
+
+    @property
+    def buffered_ms(self) -> float:
+        """缓冲区中还没有播放的时长"""
+        return self._bytes_to_ms(self._ring.size)
 
     def __enter__(self):
-        """当进入 with 块时初始化和启动播放线程"""
-        self._th.start()
+        """当进入 with 块时打开输出流并启动解码和播放线程"""
+        if self._output is None:
+            self._output = _default_output(self.sample_rate, self.channels)
+        self._feeder.start()
+        self._player.start()
         return self
 
     def __exit__(
@@ -22,35 +233,226 @@ class NonBlockingAudioQueuePlayer:
         exc_val,
         exc_tb,
     ):
-        """当退出 with 块时，清理资源和停止播放线程"""
-        self._queue.put(None)  # 向队列发送 None 以停止播放线程
-        self._th.join()
+        """当退出 with 块时，播放完队列中的音频后停止线程并关闭输出流"""
+        self._queue.put(None)
+        self._feeder.join()
+        self._player.join()
+        self._output.close()
+        print("Audio playback thread stopped.")
 
-    def _worker(self):
-        """从队列中获取音频并播放"""
-        while True:
-            audio = self._queue.get()
-            self._queue.task_done()
+    def _enqueue(
+        self,
+        item: Tuple,
+    ):
+        with self._feeding_lock:
+            self._feeding += 1
+        self._queue.put(item)
+
+    def play(
+        self,
+        audio: Union[AudioSegment, TTSAudio],
+    ) -> Future:
+        """加入播放队列，返回的 Future 在这段音频播放结束时完成"""
+        future = Future()
+        if isinstance(audio, TTSAudio) and audio._segment is None:
+            # 还没有解码的音频轮到时再边解码边播放
+            self._enqueue(("encoded", audio.format, iter((audio.data,)), future))
+        else:
+            if isinstance(audio, TTSAudio):
+                audio = audio.segment
+            audio = audio.set_frame_rate(self.sample_rate).set_channels(self.channels).set_sample_width(2)
+            self._enqueue(("pcm", audio.raw_data, future))
+        return future
+
+    def open_stream(
+        self,
+        format: str = "mp3",
+    ) -> AudioStreamWriter:
+        """加入一段流式的编码音频，之后用返回值逐块 write，最后 close；收到数据后即开始播放"""
+        writer = AudioStreamWriter(format)
+        self._enqueue(("encoded", format, writer.chunks(), writer.future))
+        return writer
+
+    def play_stream(
+        self,
+        chunks: AsyncIterable[bytes],
+        format: str = "mp3",
+    ) -> Future:
+        """open_stream 的异步版本: 在后台任务中把 chunks 写入播放队列，返回的 Future 在播放结束时完成"""
+        writer = self.open_stream(format)
+
+        async def feed():
+            try:
+                async for chunk in chunks:
+                    writer.write(chunk)
+            finally:
+                writer.close()
+
+        task = asyncio.get_running_loop().create_task(feed())
+        # 保持任务的引用直到播放结束
+        writer.future.add_done_callback(lambda _: task)
+        return writer.future
+
+    def _decode(
+        self,
+        format: str,
+        chunks: Iterator[bytes],
+    ):
+        """用 ffmpeg 边输入边解码，PCM 写入环形缓冲区"""
+        process = subprocess.Popen(
+            [
+                AudioSegment.converter,
+                "-loglevel", "error",
+                # 尽量少探测，收到第一帧就开始输出
+                "-probesize", "32", "-analyzeduration", "0", "-fflags", "nobuffer",
+                "-f", format, "-i", "pipe:0",
+                "-f", "s16le", "-acodec", "pcm_s16le", "-ar", str(self.sample_rate), "-ac", str(self.channels), "pipe:1",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+        def pump():
+            try:
+                for chunk in chunks:
+                    process.stdin.write(chunk)
+                    process.stdin.flush()
+            except BrokenPipeError:
+                pass
+            finally:
+                process.stdin.close()
+
+        pumper = threading.Thread(target=pump, name="audio-decoder-input")
+        pumper.start()
+        # 保证写入的都是完整的采样帧
+        remainder = b""
+        while data := process.stdout.read1(self._period):
+            data = remainder + data
+            cut = len(data) - len(data) % self._frame_bytes
+            self._ring.write(data[:cut])
+            remainder = data[cut:]
+        pumper.join()
+        process.wait()
 
-            if audio is None:  # 如果队列中是 None，表示退出播放线程
+    def _feed(self):
+        """按顺序把每段音频解码写入环形缓冲区"""
+        while True:
+            item = self._queue.get()
+            if item is None:
                 break
+            kind, *args, future = item
+            try:
+                if kind == "pcm":
+                    self._ring.write(args[0])
+                else:
+                    self._decode(*args)
+            except Exception as e:
+                print(f"Error decoding audio: {e}")
+            finally:
+                with self._ring.condition:
+                    self._ends.append((self._ring.written, future))
+                with self._feeding_lock:
+                    self._feeding -= 1
+        self._ring.close()
+
+    def _play(self):
+        """从环形缓冲区连续读取 PCM 写入输出流，按实时速度进行"""
+        played = 0
+        clock_start, clock_ms = time.monotonic(), 0.0
+        period_ms = self._bytes_to_ms(self._period)
+        while True:
+            data = self._ring.read(self._period)
+            # 按实际从缓冲区读出的字节数计算播放进度，不包括补足的静音
+            played += len(data)
+            if len(data) < self._period and self._feeding > 0:
+                # 正在解码的音频来不及写入，用静音补足
+                self.underruns += 1
+                self.underrun_ms += self._bytes_to_ms(self._period - len(data))
+                data += bytes(self._period - len(data))
+            elif not data:
+                self._finish(played)
+                with self._ring.condition:
+                    if self._ring.closed and self._ring.size == 0 and not self._ends:
+                        break
+                    self._ring.condition.wait(timeout=period_ms / 1000)
+                # 空闲后重新计时
+                clock_start, clock_ms = time.monotonic(), 0.0
+                continue
 
             try:
-                play(audio)  # 播放音频
-            except KeyboardInterrupt:
-                raise
+                self._output.write(data)
             except Exception as e:
                 print(f"Error playing audio: {e}")
+            self._finish(played)
 
-        print("Audio playback thread stopped.")
+            # 最多比实际播放提前几个周期，使 Future 的完成时间接近实际播放结束的时间
+            clock_ms += self._bytes_to_ms(len(data))
+            ahead = clock_ms - (time.monotonic() - clock_start) * 1000
+            if ahead > 3 * period_ms:
+                time.sleep((ahead - 3 * period_ms) / 1000)
 
-    def play(
+    def _finish(
         self,
-        audio: AudioSegment,
+        played: int,
     ):
-        self._queue.put(audio)
+        """完成已经播放完的各段的 Future"""
+        with self._ring.condition:
+            while self._ends and self._ends[0][0] <= played:
+                _, future = self._ends.popleft()
+                future.set_result(None)
 
 
 def async_play_audio(audio: AudioSegment):
     """异步播放音频"""
     asyncio.to_thread(play, (audio,))
+
+
+def audio_envelope(
+    audio: AudioSegment,
+    rate: int = 60,
+) -> np.ndarray:
+    """计算音频的嘴巴张开程度包络，供客户端直接驱动 Live2D 的 ParamMouthOpenY
+
+    :param audio: 音频
+    :param rate: 每秒的帧数
+    :return: 小端 float16 数组，每帧一个 [0, 1] 的值
+    """
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    # 多声道取平均，并归一化到 [-1, 1]
+    samples = samples.reshape(-1, audio.channels).mean(axis=1) / (1 << (8 * audio.sample_width - 1))
+
+    # 每帧的 RMS
+    frame_size = max(1, audio.frame_rate // rate)
+    frames = -(-len(samples) // frame_size)
+    if frames == 0:
+        return np.zeros(0, dtype="<f2")
+    samples = np.pad(samples, (0, frames * frame_size - len(samples)))
+    rms = np.sqrt(np.mean(np.square(samples.reshape(frames, frame_size)), axis=1))
+
+    # 以响亮的帧为满开口，与音量大小无关
+    loud = np.percentile(rms, 95)
+    mouth = np.clip(rms / loud, 0, 1) if loud > 0 else np.zeros_like(rms)
+
+    # 平滑，避免嘴巴抖动；不足 3 帧时 mode="same" 的输出长度为 3，不平滑
+    if frames >= 3:
+        mouth = np.convolve(mouth, np.ones(3) / 3, mode="same")
+    return mouth.astype("<f2")
+
+
+def mp3_silence(
+    duration_ms: float,
+) -> bytes:
+    """生成一段 MP3 静音，可以直接拼接在 edge_tts 的音频数据之间，无需解码和重新编码
+
+    :param duration_ms: 时长，按 24ms 一帧取整
+    :return: MP3 数据
+    """
+    return _MP3_SILENT_FRAME * round(duration_ms / _MP3_FRAME_MS)
+
+
+def mp3_duration_ms(
+    data: bytes,
+    bitrate: int = 48_000,
+) -> float:
+    """CBR MP3 数据的时长 (毫秒)"""
+    return len(data) * 8 / bitrate * 1000
@@ -1,3 +1,5 @@
+import functools
+
 from rich import print
 
 
@@ -5,6 +7,7 @@ def retry(
     max_retry: int,
 ):
     def decorator(func):
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
             for i in range(max_retry):
                 try:
@@ -24,6 +27,7 @@ def async_retry(
     max_retry: int,
 ):
     def decorator(func):
+        @functools.wraps(func)
         async def wrapper(*args, **kwargs):
             for i in range(max_retry):
                 try:
@@ -36,3 +40,30 @@ def async_retry(
         return wrapper
 
     return decorator
+
+
+def async_generator_retry(
+    max_retry: int,
+):
+    """重试异步生成器，已经产出数据后出错则不再重试"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            for i in range(max_retry):
+                started = False
+                try:
+                    async for item in func(*args, **kwargs):
+                        started = True
+                        yield item
+                    return
+                except Exception as e:
+                    if started:
+                        raise
+                    error = e
+                print(f"Retrying {func.__name__} ... ({i + 1}/{max_retry})\n")
+            raise error
+
+        return wrapper
+
+    return decorator
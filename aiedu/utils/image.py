@@ -3,21 +3,24 @@ import io
 from PIL import Image
 
 
-def image_compress(
-    image: Image.Image,
-    quality: int = 50,
-) -> Image.Image:
-    image_bytes = io.BytesIO()
-    image.save(image_bytes, format=image.format, quality=quality)
-    image_bytes.seek(0)
-    return Image.open(image_bytes)
-
-
-def image_to_base64_url(
-    image: Image.Image,
+def image_blob_to_base64_url(
+    blob: bytes,
+    max_size: int = 1024,
+    quality: int = 75,
 ) -> str:
-    image_bytes = io.BytesIO()
-    if image.mode != "RGB":
+    """把图片文件的原始数据缩小到最长边不超过 max_size，只编码一次 JPEG 并转为 base64 URL"""
+    image = Image.open(io.BytesIO(blob))
+    # JPEG 可以在解码时直接缩小，省去解码整张大图
+    image.draft("RGB", (max_size, max_size))
+    image.thumbnail((max_size, max_size))
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        # 透明部分以白色为背景
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
         image = image.convert("RGB")
-    image.save(image_bytes, format="JPEG")
+    image_bytes = io.BytesIO()
+    image.save(image_bytes, format="JPEG", quality=quality)
     return f"data:image/jpeg;base64,{base64.b64encode(image_bytes.getvalue()).decode()}"
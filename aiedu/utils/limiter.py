@@ -0,0 +1,95 @@
+import asyncio
+import contextlib
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Optional
+
+
+class AsyncRateLimiter:
+    """限制同时进行的请求数和每个时间窗口内的请求数
+
+    用法:
+        limiter = AsyncRateLimiter(max_in_flight=8, max_per_period=60, period=60)
+        async with limiter:
+            ...
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        max_per_period: Optional[int] = None,
+        period: float = 60.0,
+    ):
+        self.max_per_period = max_per_period
+        self.period = period
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        # 时间窗口内各请求的开始时间
+        self._starts: Deque[float] = deque()
+        self._lock = asyncio.Lock()
+
+    async def _wait_for_budget(self):
+        """等到时间窗口内还有剩余的请求数"""
+        if self.max_per_period is None:
+            return
+        # 加锁使等待的请求按顺序获得额度
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._starts and now - self._starts[0] >= self.period:
+                    self._starts.popleft()
+                if len(self._starts) < self.max_per_period:
+                    self._starts.append(now)
+                    return
+                await asyncio.sleep(self._starts[0] + self.period - now)
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        try:
+            await self._wait_for_budget()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(
+        self,
+        *exc_info,
+    ):
+        self._semaphore.release()
+
+
+class PriorityGate:
+    """前台任务进行时让后台任务等待，后台任务不与前台任务争抢LLM和TTS
+
+    用法:
+        gate = PriorityGate()
+        async with gate.foreground():  # 例如生成讲稿、回答实时问题
+            ...
+        await gate.idle()  # 后台任务的每一步之前
+    """
+
+    def __init__(self):
+        self._active = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def busy(self) -> bool:
+        """是否有正在进行的前台任务"""
+        return self._active > 0
+
+    @contextlib.asynccontextmanager
+    async def foreground(self) -> AsyncIterator[None]:
+        self._active += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._active -= 1
+            if self._active == 0:
+                self._idle.set()
+
+    async def idle(self):
+        """等到没有正在进行的前台任务"""
+        while self._active:
+            await self._idle.wait()
@@ -1,47 +1,371 @@
-import io
+import hashlib
 import json
-from typing import Generator
-from PIL import Image
-from pptx import Presentation
-from pptx.enum.shapes import MSO_SHAPE_TYPE
+import os
+import posixpath
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Deque, Dict, Generator, List, Optional, Set, Tuple
+from xml.etree import ElementTree
 
-from aiedu.utils.image import image_compress, image_to_base64_url
+from aiedu.utils.image import image_blob_to_base64_url
+
+_NAMESPACES = {
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "p": "http://schemas.openxmlformats.org/presentationml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+    "dc": "http://purl.org/dc/elements/1.1/",
+}
+_R_ID = "{%s}id" % _NAMESPACES["r"]
+_R_EMBED = "{%s}embed" % _NAMESPACES["r"]
+# 与 python-pptx 相同，只把这些 spTree 的子元素视为形状
+_SHAPE_TAGS = {"{%s}%s" % (_NAMESPACES["p"], tag) for tag in ("sp", "grpSp", "graphicFrame", "cxnSp", "pic", "contentPart")}
+
+
+@dataclass
+class PPTXSlideInfo:
+    """不解析图片就能得到的一页的信息"""
+
+    index: int
+    part_name: str
+    title: Optional[str]
+
+
+class PPTXReader:
+    """直接从 PPTX 的 zip 中按需读取各页，不加载整个文件
+
+    打开时只读取 presentation.xml 和它的关系文件，得到页数和每页的路径；
+    每页的 XML、注释和图片在读取这一页时才从 zip 中解压。
+    """
+
+    def __init__(
+        self,
+        pptx_path: str,
+    ):
+        self.pptx_path = pptx_path
+        self.zip = zipfile.ZipFile(pptx_path)
+        presentation_part = self._relationships("", type_suffix="/officeDocument")[0]
+        presentation = self._xml(presentation_part)
+        targets = {id: target for id, _, target in self._relationship_targets(presentation_part)}
+        # 按 sldIdLst 的顺序排列各页
+        self.slide_parts: List[str] = [
+            targets[slide_id.get(_R_ID)] for slide_id in presentation.iterfind("p:sldIdLst/p:sldId", _NAMESPACES)
+        ]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(
+        self,
+        *exc_info,
+    ):
+        self.close()
+
+    def close(self):
+        self.zip.close()
+
+    def __len__(self) -> int:
+        return len(self.slide_parts)
+
+    def read(
+        self,
+        part_name: str,
+    ) -> bytes:
+        return self.zip.read(part_name)
+
+    def _xml(
+        self,
+        part_name: str,
+    ) -> ElementTree.Element:
+        return ElementTree.fromstring(self.zip.read(part_name))
+
+    @staticmethod
+    def _rels_name(
+        part_name: str,
+    ) -> str:
+        directory, name = posixpath.split(part_name)
+        return posixpath.join(directory, "_rels", name + ".rels")
+
+    def _relationship_targets(
+        self,
+        part_name: str,
+    ) -> List[Tuple[str, str, str]]:
+        """[(rId, 关系类型, 目标部件路径)]，忽略外部链接"""
+        try:
+            rels = self._xml(PPTXReader._rels_name(part_name))
+        except KeyError:
+            return []
+        directory = posixpath.dirname(part_name)
+        return [
+            (rel.get("Id"), rel.get("Type", ""), posixpath.normpath(posixpath.join(directory, rel.get("Target"))).lstrip("/"))
+            for rel in rels.iterfind("rel:Relationship", _NAMESPACES)
+            if rel.get("TargetMode") != "External"
+        ]
+
+    def _relationships(
+        self,
+        part_name: str,
+        type_suffix: str,
+    ) -> List[str]:
+        """指定类型的关系的目标部件路径"""
+        return [target for _, type, target in self._relationship_targets(part_name) if type.endswith(type_suffix)]
+
+    @staticmethod
+    def _text(
+        element: ElementTree.Element,
+    ) -> str:
+        """与 python-pptx 的 text_frame.text 相同: 段落以换行连接，段内换行为 \\v"""
+        txBody = element.find("p:txBody", _NAMESPACES)
+        if txBody is None:
+            txBody = element.find("a:txBody", _NAMESPACES)
+        if txBody is None:
+            return ""
+        paragraphs = []
+        for paragraph in txBody.iterfind("a:p", _NAMESPACES):
+            parts = []
+            for child in paragraph:
+                tag = child.tag.rsplit("}", 1)[-1]
+                if tag in ("r", "fld"):
+                    parts.append(child.findtext("a:t", "", _NAMESPACES))
+                elif tag == "br":
+                    parts.append("\v")
+            paragraphs.append("".join(parts))
+        return "\n".join(paragraphs)
+
+    @staticmethod
+    def _placeholder_type(
+        shape: ElementTree.Element,
+    ) -> Optional[str]:
+        ph = shape.find("*/p:nvPr/p:ph", _NAMESPACES)
+        return None if ph is None else ph.get("type", "obj")
+
+    def info(
+        self,
+        index: int,
+    ) -> PPTXSlideInfo:
+        """只解析这一页的 XML，得到标题等信息"""
+        part_name = self.slide_parts[index]
+        title = None
+        for shape in self._xml(part_name).iterfind("p:cSld/p:spTree/p:sp", _NAMESPACES):
+            if PPTXReader._placeholder_type(shape) in ("title", "ctrTitle"):
+                title = PPTXReader._text(shape)
+                break
+        return PPTXSlideInfo(index=index, part_name=part_name, title=title)
+
+    def title(self) -> Optional[str]:
+        """文档属性中的标题"""
+        try:
+            core = self._xml("docProps/core.xml")
+        except KeyError:
+            return None
+        return core.findtext("dc:title", None, _NAMESPACES)
+
+    def slide(
+        self,
+        index: int,
+    ) -> Tuple[List[str], List[str], List[str], str]:
+        """
+        读取一页的文本、图片、表格和注释
+
+        返回:
+            Tuple[List[str], List[str], List[str], str]: 文本、图片的部件路径、表格 (json)、注释
+        """
+        part_name = self.slide_parts[index]
+        targets = {id: target for id, _, target in self._relationship_targets(part_name)}
+        texts, images, tables = [], [], []
+        for shape in self._xml(part_name).iterfind("p:cSld/p:spTree/*", _NAMESPACES):
+            if shape.tag not in _SHAPE_TAGS:
+                continue
+            tag = shape.tag.rsplit("}", 1)[-1]
+            # 获取文本
+            if tag == "sp":
+                texts.append(PPTXReader._text(shape))
+            # 获取图片
+            elif tag == "pic":
+                blip = shape.find("p:blipFill/a:blip", _NAMESPACES)
+                if blip is not None and blip.get(_R_EMBED) in targets:
+                    images.append(targets[blip.get(_R_EMBED)])
+            # 获取表格
+            elif tag == "graphicFrame":
+                for tbl in shape.iterfind("a:graphic/a:graphicData/a:tbl", _NAMESPACES):
+                    table = []
+                    for row in tbl.iterfind("a:tr", _NAMESPACES):
+                        table.append([PPTXReader._text(cell) for cell in row.iterfind("a:tc", _NAMESPACES)])
+                    tables.append(json.dumps(table))
+
+        # 获取注释
+        note = ""
+        for notes_part in self._relationships(part_name, type_suffix="/notesSlide"):
+            for shape in self._xml(notes_part).iterfind("p:cSld/p:spTree/p:sp", _NAMESPACES):
+                if PPTXReader._placeholder_type(shape) == "body":
+                    note = PPTXReader._text(shape).strip()
+                    break
+        return texts, images, tables, note
+
+
+def pptx_slides(
+    pptx_path: str,
+) -> List[Tuple[List[str], List[str], List[str], str]]:
+    """读取所有页的文本、图片的部件路径、表格和注释，不解码图片，用于生成大纲等"""
+    with PPTXReader(pptx_path) as reader:
+        return [reader.slide(index) for index in range(len(reader))]
+
+
+class _InlineExecutor(Executor):
+    """在调用 result() 时才在当前线程中执行，用于不值得开线程池的情况"""
+
+    class _Future(Future):
+        def __init__(
+            self,
+            fn,
+            args,
+        ):
+            super().__init__()
+            self._fn, self._args = fn, args
+
+        def result(
+            self,
+            timeout=None,
+        ):
+            if not self.done():
+                try:
+                    self.set_result(self._fn(*self._args))
+                except BaseException as e:
+                    self.set_exception(e)
+                # 执行后不再持有参数 (图片数据)
+                self._fn = self._args = None
+            return super().result(timeout)
+
+    def submit(
+        self,
+        fn,
+        *args,
+    ) -> Future:
+        return _InlineExecutor._Future(fn, args)
+
+
+class _ImageCache:
+    """按图片数据的哈希缓存处理结果，按字节数限制大小，超出时淘汰最久未使用的"""
+
+    def __init__(
+        self,
+        max_bytes: int,
+    ):
+        self.max_bytes = max_bytes
+        # {sha1: Future}
+        self._futures: OrderedDict = OrderedDict()
+        # 已计入大小的哈希
+        self._counted: Set[str] = set()
+        self._size = 0
+
+    def get(
+        self,
+        sha1: str,
+    ) -> Optional[Future]:
+        future = self._futures.get(sha1)
+        if future is not None:
+            self._futures.move_to_end(sha1)
+        return future
+
+    def put(
+        self,
+        sha1: str,
+        future: Future,
+    ):
+        self._futures[sha1] = future
+
+    def done(
+        self,
+        sha1: str,
+        url: str,
+    ):
+        """一张图片处理完成后计入大小"""
+        if sha1 not in self._futures or sha1 in self._counted:
+            return
+        self._counted.add(sha1)
+        self._size += len(url)
+        while self._size > self.max_bytes and len(self._futures) > 1:
+            evicted, future = self._futures.popitem(last=False)
+            if evicted in self._counted:
+                self._counted.remove(evicted)
+                self._size -= len(future.result())
 
 
 def pptx_content_generator(
     pptx_path: str,
-) -> Generator[tuple[list[str], list[Image.Image]], None, None]:
+    max_image_size: int = 1024,
+    workers: Optional[int] = None,
+    prefetch: Optional[int] = None,
+    image_cache_bytes: int = 32 * 1024 * 1024,
+) -> Generator[Tuple[List[str], List[str], List[str], str], None, None]:
     """
     读取PPTX文件，获取文本、图片、表格和注释内容
-    
+
+    逐页从 zip 中读取，不加载整个文件；图片缩小到最长边不超过 max_image_size 后只编码一次 JPEG。
+    图片在线程池中并行处理 (Pillow 解码、缩放和编码时释放 GIL)，最多提前处理 prefetch 页；相同的图片 (例如每页的 logo 和背景) 按哈希只处理一次。
+    图片数据在编码后即释放，只保留有限大小的编码结果用于去重。
+
     参数:
         pptx_path (str): PPTX文件路径
-    
+        max_image_size (int): 图片最长边的像素数上限
+        workers (Optional[int]): 处理图片的线程数，默认为 CPU 核数，不超过页数，为 1 时在当前线程中处理
+        prefetch (Optional[int]): 提前处理图片的页数，默认为线程数的 2 倍
+        image_cache_bytes (int): 用于去重的图片编码结果的总字节数上限
+
     返回:
-        Generator[tuple[list[str], list[Image.Image]], None, None]: 生成器，返回文本、图片、表格和注释内容
+        Generator[Tuple[List[str], List[str], List[str], str], None, None]: 生成器，返回文本、图片 (base64 URL)、表格和注释内容
     """
-    # 获取PPTX文件
-    presentation = Presentation(pptx_path)
-    # 获取幻灯片
-    for slide in presentation.slides:
-        texts, images, tables, note = [], [], [], None
-        for shape in slide.shapes:
-            # 获取文本
-            if hasattr(shape, "text"):
-                texts.append(shape.text)
-            # 获取图片
-            if hasattr(shape, "image"):
-                image = Image.open(io.BytesIO(shape.image.blob))
-                image = image_compress(image)
-                images.append(image_to_base64_url(image))
-            # 获取表格
-            if shape.shape_type == MSO_SHAPE_TYPE.TABLE:
-                table = []
-                for row in shape.table.rows:
-                    table.append([cell.text for cell in row.cells])
-                tables.append(json.dumps(table))
-        # 获取注释
-        if slide.notes_slide and slide.notes_slide.notes_text_frame:
-            note = slide.notes_slide.notes_text_frame.text.strip()
-        # 生成器返回文本、图片、表格和注释
-        yield texts, images, tables, note
+    images_cache = _ImageCache(image_cache_bytes)
+    # 同一份图片部件在各页中的哈希
+    part_hashes: Dict[str, str] = {}
+
+    def submit(
+        part_name: str,
+    ) -> Tuple[str, Future]:
+        sha1 = part_hashes.get(part_name)
+        future = images_cache.get(sha1) if sha1 is not None else None
+        if future is not None:
+            return sha1, future
+        blob = reader.read(part_name)
+        sha1 = part_hashes[part_name] = hashlib.sha1(blob).hexdigest()
+        future = images_cache.get(sha1)
+        if future is None:
+            future = executor.submit(image_blob_to_base64_url, blob, max_image_size)
+            images_cache.put(sha1, future)
+        return sha1, future
+
+    # 已读取、图片正在处理的页 [(文本, [(sha1, Future)], 表格, 注释)]
+    pending: Deque[Tuple] = deque()
+
+    executor: Executor = _InlineExecutor()
+    try:
+        with PPTXReader(pptx_path) as reader:
+            workers = min(workers or os.cpu_count() or 1, len(reader))
+            prefetch = prefetch or workers * 2
+            if workers > 1:
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pptx-image")
+            for index in range(len(reader)):
+                texts, image_parts, tables, note = reader.slide(index)
+                pending.append((texts, [submit(part) for part in image_parts], tables, note))
+                if len(pending) <= prefetch:
+                    continue
+                yield _resolve(pending.popleft(), images_cache)
+            while pending:
+                yield _resolve(pending.popleft(), images_cache)
+    finally:
+        # 生成器提前关闭时不再处理剩下的图片
+        executor.shutdown(cancel_futures=True)
+
+
+def _resolve(
+    slide: Tuple,
+    images_cache: _ImageCache,
+) -> Tuple[List[str], List[str], List[str], str]:
+    texts, futures, tables, note = slide
+    images = []
+    for sha1, future in futures:
+        images.append(future.result())
+        images_cache.done(sha1, images[-1])
+    return texts, images, tables, note
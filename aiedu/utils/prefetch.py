@@ -0,0 +1,98 @@
+import asyncio
+from typing import AsyncGenerator, AsyncIterable, AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_END = object()
+
+
+async def async_prefetch(
+    items: AsyncIterable[T],
+    prepare: Callable[[T], Awaitable[R]],
+    lookahead: int = 2,
+    discard: Optional[Callable[[R], None]] = None,
+) -> AsyncGenerator[R, None]:
+    """按顺序产出 prepare(item) 的结果，在使用当前结果的同时提前准备之后的 lookahead 项
+
+    例如播放第 N 页时合成第 N+1..N+lookahead 页的音频。生成器关闭 (包括使用者出错退出) 时
+    取消所有进行中的准备，已准备好但没有产出的结果交给 discard 释放；
+    应配合 contextlib.aclosing 使用以确保及时关闭。
+    """
+    # 当前项和提前准备的项共 lookahead + 1 个
+    slots = asyncio.Semaphore(lookahead + 1)
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for item in items:
+                await slots.acquire()
+                queue.put_nowait(asyncio.ensure_future(prepare(item)))
+        except Exception as e:
+            queue.put_nowait(e)
+        queue.put_nowait(_END)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            task = await queue.get()
+            if task is _END:
+                return
+            if isinstance(task, Exception):
+                raise task
+            result = await task
+            try:
+                yield result
+            finally:
+                # 使用者处理完这一项后，才开始准备下一项
+                slots.release()
+    finally:
+        producer.cancel()
+        while not queue.empty():
+            task = queue.get_nowait()
+            if not isinstance(task, asyncio.Future):
+                continue
+            if not task.done():
+                task.cancel()
+            elif discard is not None and not task.cancelled() and task.exception() is None:
+                discard(task.result())
+
+
+class BufferedStream:
+    """立即开始在后台读取一个异步迭代器并缓存，之后再从头读取
+
+    用于提前开始流式合成之后要播放的音频。
+    """
+
+    def __init__(
+        self,
+        chunks: AsyncIterable[T],
+    ):
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._pump(chunks))
+
+    async def _pump(
+        self,
+        chunks: AsyncIterable[T],
+    ):
+        try:
+            async for chunk in chunks:
+                self._queue.put_nowait(chunk)
+        except Exception as e:
+            self._queue.put_nowait(e)
+        self._queue.put_nowait(_END)
+
+    async def __aiter__(self) -> AsyncIterator[T]:
+        try:
+            while True:
+                chunk = await self._queue.get()
+                if chunk is _END:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            self.cancel()
+
+    def cancel(self):
+        self._task.cancel()
@@ -1,5 +1,24 @@
 import re
-from typing import List
+from typing import List, Optional, Tuple
+
+
+# <break strength="..."/> 对应的停顿毫秒数，没有 time 和 strength 时为 medium
+_BREAK_STRENGTHS = {
+    "none": 0,
+    "x-weak": 250,
+    "weak": 500,
+    "medium": 750,
+    "strong": 1000,
+    "x-strong": 1250,
+}
+
+# 句末标点
+SENTENCE_END_PATTERN = re.compile(r"[。！？!?；;…]")
+# 句末标点之后的后引号和后括号，属于前一句
+SENTENCE_CLOSING_PATTERN = re.compile(r"[”’」』）)》\]\"']")
+SENTENCE_PATTERN = re.compile(r"[^。！？!?；;…]+[。！？!?；;…]*[”’」』）)》\]\"']*")
+# 有可以朗读的内容
+_SPEAKABLE_PATTERN = re.compile(r"\w")
 
 
 def ssml_to_raw_texts(
@@ -9,3 +28,160 @@ def ssml_to_raw_texts(
     texts = [re.sub(r"\s+", "", t).strip() for t in texts]
     texts = [t for t in texts if t]
     return texts
+
+
+def ssml_break_ms(
+    tag: str,
+) -> int:
+    """解析 <break> 标签的停顿毫秒数"""
+    time = re.search(r"""time\s*=\s*["']\s*([\d.]+)\s*(ms|s)\s*["']""", tag)
+    if time:
+        value, unit = float(time.group(1)), time.group(2)
+        return round(value * 1000 if unit == "s" else value)
+    strength = re.search(r"""strength\s*=\s*["']\s*([\w-]+)\s*["']""", tag)
+    if strength:
+        return _BREAK_STRENGTHS.get(strength.group(1), _BREAK_STRENGTHS["medium"])
+    return _BREAK_STRENGTHS["medium"]
+
+
+def ssml_to_segments(
+    sslm_text: str,
+) -> List[Tuple[str, int]]:
+    """
+    按句子和 <break> 切分SSML
+
+    只有句末标点和 <break> 切分片段；<emphasis>、<prosody> 等行内标签不切分，只保留其中的文字
+    (edge_tts 只接受纯文本)，同一句话作为一个请求合成，语调连贯。
+
+    返回:
+        List[Tuple[str, int]]: [(原始文本, 之后停顿的毫秒数)]，文本可能为空 (开头的停顿)
+    """
+    segments = []
+    # 上一个 <break> 之后、还没有切分的文字
+    texts = []
+
+    def flush():
+        for sentence in SENTENCE_PATTERN.findall("".join(texts)):
+            # 只有标点的片段合成不出音频
+            if _SPEAKABLE_PATTERN.search(sentence):
+                segments.append((sentence, 0))
+        texts.clear()
+
+    for token in re.split(r"(<[\s\S]*?>)", sslm_text):
+        if not token.startswith("<"):
+            texts.append(re.sub(r"\s+", "", token))
+        elif re.match(r"<\s*break\b", token):
+            flush()
+            if segments:
+                text, pause = segments[-1]
+                segments[-1] = (text, pause + ssml_break_ms(token))
+            else:
+                segments.append(("", ssml_break_ms(token)))
+    flush()
+    return segments
+
+
+class SSMLFragmenter:
+    """从LLM的流式输出中增量地切出 ```ssml 代码块里的SSML片段
+
+    每个片段以句末标点或 <break> 结尾，句末标点后紧跟的 <break> 归入同一片段，
+    可以直接交给TTS合成。
+
+        fragmenter = SSMLFragmenter()
+        for delta in deltas:
+            for fragment in fragmenter.feed(delta):
+                ...
+        for fragment in fragmenter.close():
+            ...
+    """
+
+    FENCE_BEGIN = "```ssml"
+    FENCE_END = "```"
+
+    def __init__(self):
+        self.buffer = ""
+        # before: 还没遇到 ```ssml; inside: 在代码块中; after: 代码块已结束
+        self.state = "before"
+
+    def feed(
+        self,
+        delta: str,
+    ) -> List[str]:
+        """输入一段增量文本，返回已经完整的片段"""
+        if self.state == "after":
+            return []
+        self.buffer += delta
+
+        if self.state == "before":
+            begin = self.buffer.find(SSMLFragmenter.FENCE_BEGIN)
+            if begin < 0:
+                # 保留结尾，开头的标记可能被拆在两段增量中
+                self.buffer = self.buffer[-len(SSMLFragmenter.FENCE_BEGIN) :]
+                return []
+            self.buffer = self.buffer[begin + len(SSMLFragmenter.FENCE_BEGIN) :]
+            self.state = "inside"
+
+        end = self.buffer.find(SSMLFragmenter.FENCE_END)
+        if end >= 0:
+            self.buffer = self.buffer[:end]
+            self.state = "after"
+            return self._split(final=True)
+        return self._split(final=False)
+
+    def close(self) -> List[str]:
+        """输出结束，返回剩余的片段"""
+        if self.state == "before":
+            raise ValueError("No ```ssml block in LLM response")
+        if self.state == "inside":
+            self.state = "after"
+            return self._split(final=True)
+        return []
+
+    def _split(
+        self,
+        final: bool,
+    ) -> List[str]:
+        fragments = []
+        while (cut := self._find_cut()) is not None:
+            fragments.append(self.buffer[:cut])
+            self.buffer = self.buffer[cut:]
+        if final:
+            fragments.append(self.buffer)
+            self.buffer = ""
+        # 丢掉没有内容的片段，例如只有 </speak>
+        return [f.strip() for f in fragments if ssml_to_raw_texts(f) or re.search(r"<\s*break\b", f)]
+
+    def _find_cut(self) -> Optional[int]:
+        """找到第一个片段的结尾，片段还不完整时返回 None"""
+        buffer = self.buffer
+        i = 0
+        while i < len(buffer):
+            if buffer[i] == "<":
+                end = buffer.find(">", i)
+                if end < 0:
+                    return None
+                if re.match(r"<\s*break\b", buffer[i:end]):
+                    return end + 1
+                i = end + 1
+            elif SENTENCE_END_PATTERN.match(buffer[i]):
+                # 句末标点之后: 跳过连续的标点、后引号和空白，若紧跟 <break> 则一并包含
+                j = i
+                while j < len(buffer) and SENTENCE_END_PATTERN.match(buffer[j]):
+                    j += 1
+                while j < len(buffer) and SENTENCE_CLOSING_PATTERN.match(buffer[j]):
+                    j += 1
+                k = j
+                while k < len(buffer) and buffer[k].isspace():
+                    k += 1
+                if k == len(buffer):
+                    return None
+                if buffer[k] == "<":
+                    end = buffer.find(">", k)
+                    if end < 0:
+                        return None
+                    if re.match(r"<\s*break\b", buffer[k:end]):
+                        return end + 1
+                return j
+            else:
+                i += 1
+        return None
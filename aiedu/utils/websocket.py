@@ -1,5 +1,9 @@
+import asyncio
+import itertools
 import json
-from typing import Any, Callable, Dict
+import struct
+import sys
+from typing import Any, AsyncIterable, Callable, Dict, List, Optional, Sequence, Tuple, Union
 import websockets
 
 
@@ -22,11 +26,229 @@ class WebSocketServer:
         await self.server.wait_closed()
 
 
-async def websocket_send(
-    websocket: Any,
+# 帧头长度的格式: 4 字节大端无符号整数
+_HEADER_LENGTH = struct.Struct(">I")
+
+
+def websocket_frame_parts(
+    header: Dict,
+    data: Union[bytes, Sequence[bytes]] = b"",
+) -> List[bytes]:
+    """websocket_frame 的各个部分 [消息头长度 + JSON 消息头, 数据...]，数据可以是多块，不拼接"""
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = [data]
+    return [_HEADER_LENGTH.pack(len(header_bytes)) + header_bytes, *(part for part in data if len(part))]
+
+
+def websocket_frame(
     header: Dict,
-    data: Any,
+    data: Union[bytes, Sequence[bytes]] = b"",
+) -> bytes:
+    """把消息头和数据打包为一个二进制帧: [消息头长度][JSON 消息头][数据]"""
+    return b"".join(websocket_frame_parts(header, data))
+
+
+def websocket_unframe(
+    frame: bytes,
+) -> Tuple[Dict, bytes]:
+    """websocket_frame 的逆过程"""
+    (length,) = _HEADER_LENGTH.unpack_from(frame)
+    end = _HEADER_LENGTH.size + length
+    if end > len(frame):
+        raise ValueError(f"truncated frame: header length {length}, frame size {len(frame)}")
+    return json.loads(frame[_HEADER_LENGTH.size : end].decode("utf-8")), frame[end:]
+
+
+def _is_int(
+    value: Any,
+) -> bool:
+    # JSON 的 true/false 解析为 bool，bool 是 int 的子类
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _drop(
+    message: Any,
+    reason: Any,
 ):
-    """发送数据"""
-    await websocket.send(json.dumps(header))
-    await websocket.send(data)
+    print(f"[websocket] dropping invalid message ({reason}): {str(message)[:200]}", file=sys.stderr)
+
+
+class FramedWebSocket:
+    """基于信用的帧协议连接
+
+    服务端发送的每条消息都是一个二进制帧 (见 websocket_frame)，消息头中带有递增的 id。
+    每发送一条消息消耗一个信用，信用用完时发送会等待；客户端处理完消息后用
+    {"type": "credit", "credits": n} 归还信用，从而限制客户端缓冲的消息数，
+    而不必每条消息都等待客户端回应。
+
+    客户端的消息由单独的接收任务处理:
+        {"type": "credit", "credits": n}  增加信用
+        {"type": "played", "id": id}      id 对应的音频播放完成，见 played()
+        其他消息                           放入 inbox，例如提问
+    客户端消息可以是 JSON 文本帧，也可以是同样格式的二进制帧。
+    格式错误的消息 (无法解析、消息头不是对象、信用不是正整数、played 的 id 不是已发送的消息) 只打印并丢弃，不会断开连接。
+
+    用法:
+        async with FramedWebSocket(websocket) as connection:
+            id = await connection.send({"type": "audio"}, data)
+            await connection.played(id)
+    """
+
+    # 最多保存的还没有调用 played() 等待的播放完成回应，超出时丢弃最早的
+    max_unclaimed_played = 64
+
+    def __init__(
+        self,
+        websocket: Any,
+        credits: int = 16,
+    ):
+        self.websocket = websocket
+        self.credits = credits
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self._ids = itertools.count()
+        # 已发送的消息数，id 小于它的消息才可能被回应 played
+        self._sent = 0
+        self._credit_changed = asyncio.Event()
+        # {id: Future}，按加入的顺序排列
+        self._played: Dict[int, asyncio.Future] = {}
+        self._closed: Optional[BaseException] = None
+        self._receiver: Optional[asyncio.Task] = None
+
+    async def __aenter__(self):
+        self._receiver = asyncio.create_task(self._receive())
+        return self
+
+    async def __aexit__(
+        self,
+        *exc_info,
+    ):
+        self._receiver.cancel()
+        try:
+            await self._receiver
+        except asyncio.CancelledError:
+            pass
+
+    async def _receive(self):
+        try:
+            async for message in self.websocket:
+                try:
+                    if isinstance(message, (bytes, bytearray, memoryview)):
+                        header, data = websocket_unframe(bytes(message))
+                    else:
+                        header, data = json.loads(message), b""
+                except (ValueError, struct.error) as e:
+                    # json.JSONDecodeError 和 UnicodeDecodeError 都是 ValueError
+                    _drop(message, e)
+                    continue
+                if not isinstance(header, dict):
+                    _drop(message, "header is not an object")
+                    continue
+                self._dispatch(header, data)
+            self._close(ConnectionError("websocket closed"))
+        except asyncio.CancelledError:
+            self._close(ConnectionError("websocket connection finished"))
+            raise
+        except Exception as e:
+            self._close(e)
+
+    def _dispatch(
+        self,
+        header: Dict,
+        data: bytes,
+    ):
+        type = header.get("type")
+        if type == "credit":
+            credits = header.get("credits", 1)
+            if not _is_int(credits) or credits <= 0:
+                _drop(header, "credits must be a positive integer")
+                return
+            self.credits += credits
+            self._credit_changed.set()
+        elif type == "played":
+            id = header.get("id")
+            if not _is_int(id) or not 0 <= id < self._sent:
+                _drop(header, "unknown id")
+                return
+            future = self._played.get(id)
+            if future is None:
+                # 回应可能早于 played() 调用，先保存；没有人等待的回应只保留最近的一些
+                unclaimed = [key for key, future in self._played.items() if future.done()]
+                for key in unclaimed[: max(0, len(unclaimed) + 1 - self.max_unclaimed_played)]:
+                    del self._played[key]
+                future = self._played[id] = asyncio.get_running_loop().create_future()
+            if not future.done():
+                future.set_result(header)
+        else:
+            self.inbox.put_nowait((header, data))
+
+    def _close(
+        self,
+        error: BaseException,
+    ):
+        """连接关闭后，所有等待信用和播放完成的调用都抛出 error"""
+        self._closed = error
+        self._credit_changed.set()
+        for future in self._played.values():
+            if not future.done():
+                future.set_exception(error)
+                # 没有等待者时避免 "exception was never retrieved" 警告
+                future.exception()
+        self.inbox.put_nowait(None)
+
+    async def send(
+        self,
+        header: Dict,
+        data: Union[bytes, Sequence[bytes]] = b"",
+    ) -> int:
+        """等到有信用时发送一条消息，返回消息 id
+
+        data 可以是多块数据 (例如口型包络和音频)，作为分片消息依次发送，不拼接；客户端收到的仍是一条完整的消息。
+        """
+        while self.credits <= 0:
+            if self._closed is not None:
+                raise self._closed
+            self._credit_changed.clear()
+            await self._credit_changed.wait()
+        if self._closed is not None:
+            raise self._closed
+        self.credits -= 1
+        id = next(self._ids)
+        self._sent = id + 1
+        parts = websocket_frame_parts({**header, "id": id}, data)
+        await self.websocket.send(parts[0] if len(parts) == 1 else parts)
+        return id
+
+    async def send_stream(
+        self,
+        header: Dict,
+        chunks: AsyncIterable[bytes],
+    ) -> int:
+        """流式发送数据
+
+        每一块数据作为一条消息发送，header 中附加从 0 开始的序号 seq 和 end: false；
+        最后发送一个 end: true 且 data 为空的消息表示结束。
+
+        返回:
+            int: 结束消息的 id，客户端播放完整个流后以此 id 回应 played
+        """
+        seq = 0
+        async for chunk in chunks:
+            await self.send({**header, "seq": seq, "end": False}, chunk)
+            seq += 1
+        return await self.send({**header, "seq": seq, "end": True})
+
+    async def played(
+        self,
+        id: int,
+    ) -> Dict:
+        """等待客户端回应 id 对应的音频播放完成"""
+        future = self._played.get(id)
+        if future is None:
+            if self._closed is not None:
+                raise self._closed
+            future = self._played[id] = asyncio.get_running_loop().create_future()
+        try:
+            return await future
+        finally:
+            self._played.pop(id, None)
@@ -0,0 +1,174 @@
+"""emotext 性能对比
+
+用 example 中缓存的讲稿 SSML 作为真实文本，对比旧的线性查找与新的索引查找下 emotion_count 的耗时；
+以及旧的 pickle 词表与 mmap 词典文件的加载耗时和内存占用；
+以及 jieba 关键词与全文扫描两种方式的耗时；
+以及 200 页课件逐个 emotion() 与不同进程数的 emotion_batch() 的耗时。
+
+    python -m benchmarks.emotext --cache_path ./example/output/ssml/example.json
+"""
+
+import argparse
+import os
+import pickle
+import time
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from aiedu.emotext import EmotionMode, emotion, emotion_batch, _get_emotext, _Lexicon, _Word
+from aiedu.lecture_cache import LectureCache
+from aiedu.utils.ssml import ssml_to_raw_texts
+
+
+def _find_word_linear(
+    words: Dict[str, List[_Word]],
+    w: str,
+) -> List[_Word]:
+    """旧的实现: 逐个情感列表线性查找"""
+    result = []
+    for emotion, words_of_emotion in words.items():
+        ws = list(map(lambda x: x.word, words_of_emotion))
+        if w in ws:
+            result.append(words_of_emotion[ws.index(w)])
+    return result
+
+
+def _measure(
+    func: Callable,
+) -> Tuple[float, int]:
+    """返回 func 的耗时和其返回值常驻的内存"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, current
+
+
+def lecture_texts(
+    cache_path: str,
+) -> List[str]:
+    # 缓存中的各页讲稿和总结
+    ssmls = LectureCache(cache_path).entries.values()
+    return ["\n".join(ssml_to_raw_texts(ssml)) for ssml in ssmls]
+
+
+def bench(
+    texts: List[str],
+    number: int,
+    mode: EmotionMode = "keywords",
+) -> float:
+    emotext = _get_emotext()
+    return timeit.timeit(lambda: [emotext.emotion_count(text, mode=mode) for text in texts], number=number) / number
+
+
+def bench_lookup(
+    texts: List[str],
+    number: int,
+):
+    emotext = _get_emotext()
+
+    # 预热 jieba
+    for text in texts:
+        emotext.emotion_count(text)
+
+    indexed = bench(texts, number)
+
+    # 结果须与旧实现一致
+    words = emotext._words_from_dict()
+    results_indexed = [emotext.emotion_count(text).emotions for text in texts]
+    emotext._find_word = lambda w: _find_word_linear(words, w)
+    try:
+        results_linear = [emotext.emotion_count(text).emotions for text in texts]
+        linear = bench(texts, number)
+    finally:
+        del emotext._find_word
+    assert results_indexed == results_linear, "indexed lookup differs from linear lookup"
+
+    print(f"texts: {len(texts)}, chars: {sum(map(len, texts))}")
+    print(f"linear:  {linear * 1000:.2f} ms / run")
+    print(f"indexed: {indexed * 1000:.2f} ms / run")
+    print(f"speedup: {linear / indexed:.1f}x")
+
+
+def bench_load():
+    emotext = _get_emotext()
+    words_pkl = pickle.dumps(emotext._words_from_dict())
+
+    pkl_time, pkl_memory = _measure(lambda: pickle.loads(words_pkl))
+    lexicon_time, lexicon_memory = _measure(lambda: _Lexicon.load(emotext.lexicon_path))
+
+    print(f"pickle load:  {pkl_time * 1000:.2f} ms, {pkl_memory / 1024 / 1024:.2f} MiB")
+    print(f"lexicon load: {lexicon_time * 1000:.2f} ms, {lexicon_memory / 1024 / 1024:.2f} MiB")
+
+
+def bench_scan(
+    texts: List[str],
+    number: int,
+):
+    # 多段讲稿拼成一篇长文本
+    texts = ["\n".join(texts)]
+
+    # 预热 jieba 和自动机
+    for mode in ("keywords", "scan"):
+        bench(texts, 1, mode=mode)
+
+    keywords = bench(texts, number, mode="keywords")
+    scan = bench(texts, number, mode="scan")
+
+    print(f"keywords: {keywords * 1000:.2f} ms / run")
+    print(f"scan:     {scan * 1000:.2f} ms / run")
+    print(f"speedup:  {keywords / scan:.1f}x")
+
+
+def bench_batch(
+    texts: List[str],
+    slides: int = 200,
+):
+    texts = [texts[i % len(texts)] for i in range(slides)]
+
+    serial = timeit.timeit(lambda: [emotion(text) for text in texts], number=1)
+    print(f"serial:       {serial * 1000:.2f} ms / {slides} slides")
+
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        batch = timeit.timeit(lambda: emotion_batch(texts, workers=workers), number=1)
+        print(f"batch({workers:>2}):    {batch * 1000:.2f} ms / {slides} slides, speedup: {serial / batch:.1f}x")
+        workers *= 2
+
+
+def main(
+    cache_path: str,
+    number: int,
+):
+    texts = lecture_texts(cache_path)
+    bench_lookup(texts, number)
+    bench_load()
+    bench_scan(texts, number)
+    bench_batch(texts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="emotext benchmark",
+    )
+    parser.add_argument(
+        "--cache_path",
+        type=str,
+        default="./example/output/ssml/example.json",
+        help="Path to the lecture cache JSON file.",
+    )
+    parser.add_argument(
+        "--number",
+        type=int,
+        default=10,
+        help="Number of runs.",
+    )
+    args = parser.parse_args()
+    main(
+        cache_path=args.cache_path,
+        number=args.number,
+    )
@@ -2,4 +2,4 @@ cd ../
 
 python -m aiedu.main \
     --pptx_path "./example/input/pptx/example.pptx" \
-    --cache_path "./example/output/ssml/example.pkl"
\ No newline at end of file
+    --cache_path "./example/output/ssml/example.json"
\ No newline at end of file
@@ -0,0 +1,50 @@
+import time
+from typing import Dict, Iterator, List
+
+
+class _Object:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeLLMClient:
+    """离线测试用的假LLM客户端，接口与 aisuite.Client 的 chat.completions.create 一致。
+
+    按顺序返回给定的回复；stream=True 时按 chunk_size 个字符一块、每块间隔 delay 秒流式返回。
+    回复为异常时抛出该异常。
+    """
+
+    def __init__(
+        self,
+        responses: List,
+        chunk_size: int = 4,
+        delay: float = 0.0,
+    ):
+        self.responses = responses
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.calls = 0
+        self.chat = _Object(completions=_Object(create=self._create))
+
+    def _create(
+        self,
+        model: str,
+        messages: List[Dict],
+        stream: bool = False,
+        **kwargs,
+    ):
+        response = self.responses[self.calls % len(self.responses)]
+        self.calls += 1
+        if isinstance(response, Exception):
+            raise response
+        if stream:
+            return self._stream(response)
+        return _Object(choices=[_Object(message=_Object(content=response))])
+
+    def _stream(
+        self,
+        response: str,
+    ) -> Iterator:
+        for i in range(0, len(response), self.chunk_size):
+            time.sleep(self.delay)
+            yield _Object(choices=[_Object(delta=_Object(content=response[i : i + self.chunk_size]))])
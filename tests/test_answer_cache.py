@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+import aiedu.answer_cache
+from aiedu.answer_cache import AnswerCache, question_key, question_similarity
+
+
+def _similar(
+    a: str,
+    b: str,
+    threshold: float = 0.65,
+) -> bool:
+    return question_similarity(question_key(a), question_key(b)) >= threshold
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("老师，什么是快速开发呢？", "快速开发是什么"),
+        ("快速开发有什么优点", "快速开发的优势"),
+        ("快速开发和敏捷开发有什么区别", "敏捷开发和快速开发的区别是什么"),
+        ("有没有必要做需求分析", "需求分析有必要吗"),
+        ("快速开发能不能用于大项目", "快速开发可以用于大项目吗"),
+    ],
+)
+def test_similar_questions(a, b):
+    assert _similar(a, b)
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("快速开发有什么优点", "快速开发的缺点"),
+        ("什么是瀑布模型", "什么是螺旋模型"),
+        ("需求分析和设计的区别", "需求分析和测试的区别"),
+    ],
+)
+def test_different_questions(a, b):
+    assert not _similar(a, b)
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("为什么要用快速开发", "为什么不用快速开发"),
+        ("快速开发能用于大项目", "快速开发不能用于大项目"),
+        ("怎么做需求分析", "为什么做需求分析"),
+        ("快速开发能用于大项目", "快速开发能用于大项目吗"),
+    ],
+)
+def test_negation_and_question_words_must_match(a, b):
+    # 内容词相同，只有否定词或疑问词不同
+    assert question_similarity(question_key(a), question_key(b)) == 0
+
+
+def test_threshold_is_configurable():
+    async def run():
+        strict = AnswerCache(threshold=1.0)
+        loose = AnswerCache()
+        for cache in (strict, loose):
+            await cache.put(0, "快速开发有什么优点", "answer")
+        return await strict.get(0, "快速开发的优势"), await loose.get(0, "快速开发的优势")
+
+    assert asyncio.run(run()) == (None, "answer")
+
+
+def test_lookup_is_per_slide_and_skips_empty_questions():
+    async def run():
+        cache = AnswerCache()
+        await cache.put(0, "什么是快速开发", "answer")
+        await cache.put(0, "？？", "punctuation")
+        return await cache.get(0, "快速开发是什么"), await cache.get(1, "快速开发是什么"), await cache.get(0, "！")
+
+    assert asyncio.run(run()) == ("answer", None, None)
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(aiedu.answer_cache.time, "monotonic", lambda: now[0])
+
+    async def run():
+        cache = AnswerCache(ttl=10)
+        await cache.put(0, "什么是快速开发", "short")
+        await cache.put(0, "什么是瀑布模型", "forever", ttl=float("inf"))
+        now[0] += 11
+        return await cache.get(0, "什么是快速开发"), await cache.get(0, "什么是瀑布模型")
+
+    assert asyncio.run(run()) == (None, "forever")
+
+
+def test_lru_eviction():
+    async def run():
+        cache = AnswerCache(max_entries=2)
+        await cache.put(0, "什么是快速开发", "a")
+        await cache.put(0, "什么是瀑布模型", "b")
+        # 使用过的条目不会被淘汰
+        await cache.get(0, "快速开发是什么")
+        await cache.put(0, "什么是螺旋模型", "c")
+        return [await cache.get(0, q) for q in ("什么是快速开发", "什么是瀑布模型", "什么是螺旋模型")]
+
+    assert asyncio.run(run()) == ["a", None, "c"]
+
+
+def test_get_or_create_single_flight_for_similar_questions():
+    calls = []
+
+    async def create():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        cache = AnswerCache()
+        questions = ["快速开发有什么优点", "快速开发的优势", "老师，快速开发有什么优点？", "快速开发的缺点"]
+        answers = await asyncio.gather(*[cache.get_or_create(0, q, create) for q in questions])
+        again = await cache.get_or_create(0, "快速开发的优势是什么", create)
+        return answers, again
+
+    answers, again = asyncio.run(run())
+    assert answers == ["answer"] * 4 and again == "answer"
+    # 优点和缺点各生成一次
+    assert len(calls) == 2
+
+
+def test_failed_create_is_not_cached():
+    async def run():
+        cache = AnswerCache()
+
+        async def fail():
+            raise RuntimeError("llm failed")
+
+        with pytest.raises(RuntimeError):
+            await cache.get_or_create(0, "什么是快速开发", fail)
+        return await cache.get(0, "什么是快速开发")
+
+    assert asyncio.run(run()) is None
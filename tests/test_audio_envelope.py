@@ -0,0 +1,19 @@
+import pytest
+from pydub import AudioSegment
+from pydub.generators import Sine
+
+from aiedu.utils.audio import audio_envelope
+
+
+@pytest.mark.parametrize("duration_ms, frames", [(0, 0), (10, 1), (20, 2), (40, 3), (1000, 60)])
+def test_envelope_length(duration_ms, frames):
+    envelope = audio_envelope(AudioSegment.silent(duration=duration_ms, frame_rate=24000), rate=60)
+    assert envelope.dtype == "<f2"
+    assert len(envelope) == frames
+
+
+def test_envelope_follows_loudness():
+    audio = AudioSegment.silent(duration=500, frame_rate=24000) + Sine(440, sample_rate=24000).to_audio_segment(duration=500)
+    envelope = audio_envelope(audio, rate=60)
+    assert envelope[:25].max() == 0
+    assert envelope[35:-1].min() > 0.9
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+from aiedu.utils.audio import NonBlockingAudioQueuePlayer, _PCMRingBuffer, mp3_silence
+
+
+def test_ring_buffer_wraparound():
+    ring = _PCMRingBuffer(10)
+    ring.write(b"abcdefg")
+    assert ring.read(5) == b"abcde"
+    # 写入跨过缓冲区末尾
+    ring.write(b"hijklm")
+    assert (ring.size, ring.written) == (8, 13)
+    assert ring.read(3) == b"fgh"
+    # 读取跨过缓冲区末尾
+    assert ring.read(100) == b"ijklm"
+    assert ring.size == 0 and ring.read(4) == b""
+
+
+def test_ring_buffer_blocks_writer_until_read():
+    ring = _PCMRingBuffer(64)
+    data = os.urandom(10_000)
+    writer = threading.Thread(target=ring.write, args=(data,))
+    writer.start()
+    received = bytearray()
+    while len(received) < len(data):
+        assert ring.size <= 64
+        received += ring.read(37)
+    writer.join(timeout=1)
+    assert bytes(received) == data and ring.written == len(data)
+
+
+def test_ring_buffer_close_releases_blocked_writer():
+    ring = _PCMRingBuffer(4)
+    writer = threading.Thread(target=ring.write, args=(b"123456",))
+    writer.start()
+    time.sleep(0.05)
+    assert writer.is_alive()
+    ring.close()
+    writer.join(timeout=1)
+    assert not writer.is_alive() and ring.read(10) == b"1234"
+
+
+class FakeOutput:
+    def __init__(self):
+        self.data = bytearray()
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    def close(self):
+        self.closed = True
+
+
+def _segment(value, ms):
+    samples = np.full(24 * ms, value, dtype="<i2")
+    return AudioSegment(samples.tobytes(), frame_rate=24_000, sample_width=2, channels=1)
+
+
+def test_segments_play_back_to_back():
+    output = FakeOutput()
+    first, second = _segment(1000, 300), _segment(-1000, 200)
+    with NonBlockingAudioQueuePlayer(output=output) as player:
+        futures = [player.play(first), player.play(second)]
+        futures[1].result(timeout=5)
+        assert futures[0].done()
+    expected = first.raw_data + second.raw_data
+    # 播放线程可能在第一段写入缓冲区前读取，开头补足的静音计入 underruns
+    period = player._ms_to_bytes(20)
+    padding = len(output.data) - len(expected)
+    assert bytes(output.data).lstrip(b"\0") == expected
+    assert padding == player.underruns * period
+    assert player.underrun_ms == pytest.approx(player._bytes_to_ms(padding))
+    assert output.closed
+
+
+def test_slow_stream_counts_underruns():
+    output = FakeOutput()
+    with NonBlockingAudioQueuePlayer(output=output) as player:
+        writer = player.open_stream("mp3")
+        writer.write(mp3_silence(100))
+        # 下一块来不及送到，播放线程输出静音
+        time.sleep(0.4)
+        writer.write(mp3_silence(100))
+        writer.close()
+        writer.future.result(timeout=5)
+    # 至少缺少两块之间的 300ms (还包括 ffmpeg 启动的时间)，每次最多补足一个周期
+    assert player.underrun_ms >= 200
+    assert player.underrun_ms <= player.underruns * 20
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+import aiedu.tts.edge_tts
+from aiedu.tts.base import TTSBoundary
+from aiedu.tts.edge_tts import EdgeTTS
+from aiedu.utils.audio import mp3_duration_ms, mp3_silence
+
+# 每个字 240ms (10 帧)
+_CHAR_MS = 240
+
+
+class FakeCommunicate:
+    """按文本长度产出静音音频，分两块产出，词边界为整段；gates 中的文本产出第一块后等待"""
+
+    requests = []
+    gates = {}
+
+    def __init__(self, text, voice, boundary=None):
+        self.text = text
+        FakeCommunicate.requests.append(text)
+
+    async def stream(self):
+        data = mp3_silence(len(self.text) * _CHAR_MS)
+        half = len(data) // 2
+        yield {"type": "audio", "data": data[:half]}
+        if self.text in FakeCommunicate.gates:
+            await FakeCommunicate.gates[self.text].wait()
+        yield {"type": "audio", "data": data[half:]}
+        # offset, duration 的单位为 100ns
+        yield {"type": "WordBoundary", "offset": 0, "duration": len(self.text) * _CHAR_MS * 10_000, "text": self.text}
+
+
+@pytest.fixture(autouse=True)
+def fake_communicate(monkeypatch):
+    FakeCommunicate.requests = []
+    FakeCommunicate.gates = {}
+    monkeypatch.setattr(aiedu.tts.edge_tts.edge_tts, "Communicate", FakeCommunicate)
+
+
+SSML = '<speak><break time="480ms"/>我们<emphasis>很</emphasis>高兴。<break time="960ms"/>再见</speak>'
+
+
+def test_audio_stitches_segments_and_pauses():
+    audio = asyncio.run(EdgeTTS().audio(SSML))
+
+    assert FakeCommunicate.requests == ["我们很高兴。", "再见"]
+    assert mp3_duration_ms(audio.data) == pytest.approx(480 + 6 * _CHAR_MS + 960 + 2 * _CHAR_MS)
+    assert audio.boundaries == [
+        TTSBoundary(pytest.approx(480), 6 * _CHAR_MS, "我们很高兴。"),
+        TTSBoundary(pytest.approx(480 + 6 * _CHAR_MS + 960), 2 * _CHAR_MS, "再见"),
+    ]
+
+
+def test_stream_matches_audio():
+    async def run():
+        tts = EdgeTTS()
+        return b"".join([chunk async for chunk in tts.stream(SSML)]), (await tts.audio(SSML)).data
+
+    streamed, audio = asyncio.run(run())
+    assert streamed == audio
+
+
+def test_stream_forwards_first_segment_chunks_as_they_arrive():
+    async def run():
+        gate = FakeCommunicate.gates["我们很高兴。"] = asyncio.Event()
+        stream = EdgeTTS(concurrency=1).stream(SSML)
+        chunks = [await asyncio.wait_for(stream.__anext__(), 1) for _ in range(2)]
+        # 第一段还没有合成完，已经产出开头的静音和第一段的第一块
+        assert not gate.is_set()
+        gate.set()
+        chunks += [chunk async for chunk in stream]
+        return chunks
+
+    chunks = asyncio.run(run())
+    assert chunks[0] == mp3_silence(480)
+    assert len(chunks[1]) == len(mp3_silence(6 * _CHAR_MS)) // 2
+    # 并发数为 1 时第一段仍然先合成
+    assert FakeCommunicate.requests == ["我们很高兴。", "再见"]
+
+
+def test_stream_close_cancels_synthesis():
+    async def run():
+        FakeCommunicate.gates["我们很高兴。"] = asyncio.Event()
+        stream = EdgeTTS().stream(SSML)
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0.01)
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    assert asyncio.run(run()) == []
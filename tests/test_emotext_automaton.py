@@ -0,0 +1,79 @@
+import random
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+from aiedu.emotext import _Automaton, _get_emotext
+
+
+def _automaton(
+    *words: str,
+) -> _Automaton:
+    return _Automaton(SimpleNamespace(words=list(words)))
+
+
+def _matches(
+    automaton: _Automaton,
+    text: str,
+):
+    return [(start, automaton.words[i]) for start, i in automaton.matches(text)]
+
+
+def _brute_force(
+    words,
+    text: str,
+) -> Counter:
+    """逐个位置取从这里开始的最长的词，匹配后跳过这个词"""
+    words = set(word for word in words if word)
+    longest = max(map(len, words))
+    counts: Counter = Counter()
+    start = 0
+    while start < len(text):
+        for length in range(min(longest, len(text) - start), 0, -1):
+            if text[start : start + length] in words:
+                counts[text[start : start + length]] += 1
+                start += length
+                break
+        else:
+            start += 1
+    return counts
+
+
+@pytest.mark.parametrize(
+    "words, text, expected",
+    [
+        # 结束位置相同的匹配中只保留最长的会丢掉 CD
+        (["AB", "BCD", "CD"], "ABCD", [(0, "AB"), (2, "CD")]),
+        (["高兴", "兴"], "很高兴", [(1, "高兴")]),
+        (["A", "AB", "ABC"], "ABCAB", [(0, "ABC"), (3, "AB")]),
+        (["he", "she", "his", "hers"], "ushers", [(1, "she")]),
+        (["B", "ABCDE"], "ABCDX", [(1, "B")]),
+        (["AA"], "AAAAA", [(0, "AA"), (2, "AA")]),
+        (["", "X"], "YXY", [(1, "X")]),
+        (["A"], "", []),
+    ],
+)
+def test_leftmost_longest_matches(words, text, expected):
+    assert _matches(_automaton(*words), text) == expected
+
+
+def test_random_lexicon_matches_brute_force():
+    rng = random.Random(0)
+    for _ in range(200):
+        words = ["".join(rng.choice("ABC") for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 8))]
+        text = "".join(rng.choice("ABCD") for _ in range(rng.randint(0, 30)))
+        assert Counter(_automaton(*words).count(text)) == _brute_force(words, text), (words, text)
+
+
+def test_scan_counts_match_brute_force_on_lexicon():
+    automaton = _get_emotext()._get_automaton()
+    words = [word for word in automaton.words if word]
+    rng = random.Random(0)
+    # 词典中的词首尾相接，并夹杂词典中的词的片段，造出大量重叠的候选
+    parts = []
+    for _ in range(2000):
+        word = rng.choice(words)
+        parts.append(word if rng.random() < 0.7 else word[rng.randrange(len(word)) :])
+    text = "".join(parts)
+    assert Counter(automaton.count(text)) == _brute_force(words, text)
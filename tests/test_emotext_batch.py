@@ -0,0 +1,56 @@
+import random
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from aiedu.emotext import _EmotionCountResult, _emotions, emotion, emotion_batch, emotion_timeline, emotions_va_batch
+
+
+def _random_emotions(
+    rng: random.Random,
+) -> list:
+    # 大多数情感为 0，强度有相同的值，覆盖排序稳定性和 50% 边界
+    return [rng.choice([0, 0, 0, 1, 2, 3, 4.5]) if rng.random() < 0.4 else 0 for _ in _emotions]
+
+
+def test_emotions_va_batch_matches_scalar():
+    rng = random.Random(0)
+    rows = [_random_emotions(rng) for _ in range(500)] + [[0] * len(_emotions), [1] * len(_emotions)]
+    expected = []
+    for row in rows:
+        result = _EmotionCountResult()
+        result.emotions.update(zip(_emotions, row))
+        expected.append(result.emotions_va())
+    np.testing.assert_allclose(emotions_va_batch(np.array(rows)), expected, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_emotion_batch_matches_emotion(workers):
+    texts = ["我们今天非常高兴，大家都很开心。", "这个结果让人失望和难过。", "测试保证软件质量。"]
+    assert emotion_batch(texts, workers=workers, mode="scan") == [emotion(text, mode="scan") for text in texts]
+
+
+def test_emotion_timeline_aligns_with_word_boundaries():
+    first, second = "我们今天非常高兴。", "这个结果让人失望！"
+    words = [
+        ("我们", 0, 300),
+        ("今天", 300, 300),
+        ("非常", 600, 300),
+        ("高兴", 900, 400),
+        ("这个", 1800, 300),
+        ("结果", 2100, 300),
+        ("让人", 2400, 300),
+        ("失望", 2700, 500),
+    ]
+    # 任何有 offset、duration、text 属性的词边界都可以，不依赖 TTS 模块；不在文本中的词跳过
+    boundaries = [SimpleNamespace(offset=offset, duration=duration, text=text) for text, offset, duration in words]
+    boundaries.insert(4, SimpleNamespace(offset=1500, duration=100, text="不存在"))
+
+    timeline = emotion_timeline(first + second, boundaries)
+
+    assert [[start, end] for start, end, *_ in timeline] == [[0, 1300], [1800, 3200]]
+    for (_, _, valence, arousal, dominant), sentence in zip(timeline, [first, second]):
+        expected = emotion(sentence, mode="scan")
+        assert [valence, arousal] == [round(expected["va"]["valence"], 3), round(expected["va"]["arousal"], 3)]
+        assert dominant == max(expected["emotions"], key=expected["emotions"].get)
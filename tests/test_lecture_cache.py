@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import pytest
+
+import aiedu.llm
+from aiedu.lecture_cache import LectureCache
+from aiedu.llm import async_llm_ssml_lectures_from_pptx, async_llm_ssml_lectures_from_pptx_parallel
+from fake_llm import FakeLLMClient
+
+
+class RecordingLLMClient(FakeLLMClient):
+    """记录每次请求的页的文本 (并行生成时请求中还有整个PPT的大纲)；请求 fail 中的页时失败"""
+
+    def __init__(self, deck_texts, fail=()):
+        super().__init__(["```ssml<speak>讲稿</speak>```"])
+        self.deck_texts = deck_texts
+        self.requests = []
+        self.fail = fail
+
+    def _create(self, model, messages, stream=False, **kwargs):
+        request = json.dumps(messages[-1], ensure_ascii=False)
+        texts = [text for text in self.deck_texts if json.dumps(f"文本内容 ###\n\n{text}\n\n", ensure_ascii=False)[1:-1] in request]
+        self.requests.extend(texts)
+        if set(texts) & set(self.fail):
+            raise RuntimeError("llm failed")
+        return super()._create(model, messages, stream, **kwargs)
+
+
+def _deck(*texts):
+    return [([text], [], [], "") for text in texts]
+
+
+@pytest.fixture
+def lectures(monkeypatch, tmp_path):
+    """按给定的各页内容生成讲稿，每次都从文件重新加载缓存，返回请求过的页"""
+
+    def run(generate, deck, fail=()):
+        client = RecordingLLMClient([text for (text,), *_ in deck], fail)
+        monkeypatch.setattr(aiedu.llm, "llm_client", lambda: client)
+        monkeypatch.setattr(aiedu.llm, "pptx_content_generator", lambda path: (content for content in deck))
+        monkeypatch.setattr(aiedu.llm, "pptx_slides", lambda path: deck)
+        cache = LectureCache(str(tmp_path / "lectures.json"))
+        asyncio.run(generate("deck.pptx", cache=cache))
+        # 并行生成时请求的顺序不定
+        return [text for text in client.deck_texts if text in client.requests]
+
+    return run
+
+
+@pytest.mark.parametrize("generate", [async_llm_ssml_lectures_from_pptx, async_llm_ssml_lectures_from_pptx_parallel])
+def test_changed_slide_is_the_only_one_regenerated(lectures, generate):
+    assert lectures(generate, _deck("第一页", "第二页", "第三页")) == ["第一页", "第二页", "第三页"]
+    assert lectures(generate, _deck("第一页", "修改后的第二页", "第三页")) == ["修改后的第二页"]
+    assert lectures(generate, _deck("第一页", "修改后的第二页", "第三页")) == []
+
+
+@pytest.mark.parametrize("generate", [async_llm_ssml_lectures_from_pptx, async_llm_ssml_lectures_from_pptx_parallel])
+def test_generated_slides_are_saved_before_the_deck_finishes(lectures, generate):
+    deck = _deck("第一页", "第二页", "第三页")
+    with pytest.raises(RuntimeError):
+        lectures(generate, deck, fail=["第三页"])
+    # 中途失败时已生成的页已经保存
+    assert lectures(generate, deck) == ["第三页"]
+
+
+def test_async_save_writes_latest_entries(tmp_path):
+    path = str(tmp_path / "lectures.json")
+
+    async def run():
+        cache = LectureCache(path)
+        saves = []
+        for i in range(5):
+            cache.put(str(i), f"<speak>{i}</speak>")
+            saves.append(asyncio.ensure_future(cache.async_save()))
+        await asyncio.gather(*saves)
+
+    asyncio.run(run())
+    assert LectureCache(path).entries == {str(i): f"<speak>{i}</speak>" for i in range(5)}
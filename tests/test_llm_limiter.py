@@ -0,0 +1,32 @@
+import asyncio
+
+from aiedu.llm import async_llm_ssml
+from aiedu.utils.limiter import AsyncRateLimiter
+from fake_llm import FakeLLMClient
+
+
+class CountingLimiter(AsyncRateLimiter):
+    def __init__(self):
+        super().__init__(max_in_flight=1)
+        self.acquired = 0
+
+    async def __aenter__(self):
+        self.acquired += 1
+        return await super().__aenter__()
+
+
+def test_limiter_counts_every_attempt():
+    # 前两次请求失败，第三次回复中没有 ```ssml 代码块，外层重试后第四次成功
+    client = FakeLLMClient(
+        [
+            RuntimeError("rate limited"),
+            RuntimeError("rate limited"),
+            "没有代码块",
+            "```ssml<speak>你好。</speak>```",
+        ]
+    )
+    limiter = CountingLimiter()
+    ssml = asyncio.run(async_llm_ssml(messages=[], client=client, limiter=limiter))
+    assert ssml == "<speak>你好。</speak>"
+    assert client.calls == 4
+    assert limiter.acquired == 4
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from aiedu.llm import async_llm_ssml_stream
+from aiedu.utils.ssml import SSMLFragmenter
+from fake_llm import FakeLLMClient
+
+RESPONSE = (
+    "好的，下面是讲稿：\n"
+    "```ssml\n"
+    '<speak><prosody rate="+10%">什么是“快速开发？”</prosody>'
+    '快速开发是一种方法。<break time="500ms"/>'
+    "它强调迭代！！接下来<break time=\"300ms\"/>我们看例子；"
+    "最后一句没有标点</speak>\n"
+    "```\n"
+    "以上。"
+)
+
+EXPECTED = [
+    '<speak><prosody rate="+10%">什么是“快速开发？”',
+    '</prosody>快速开发是一种方法。<break time="500ms"/>',
+    "它强调迭代！！",
+    '接下来<break time="300ms"/>',
+    "我们看例子；",
+    "最后一句没有标点</speak>",
+]
+
+
+def _fragments(
+    chunks,
+):
+    fragmenter = SSMLFragmenter()
+    fragments = []
+    for chunk in chunks:
+        fragments += fragmenter.feed(chunk)
+    return fragments + fragmenter.close()
+
+
+def _split(
+    text,
+    size,
+):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+def test_fragmenter_whole_response():
+    assert _fragments([RESPONSE]) == EXPECTED
+
+
+@pytest.mark.parametrize("size", list(range(1, 12)) + [13, 17, 31, 64])
+def test_fragmenter_chunk_sizes(size):
+    # 分块会拆开 ```ssml、标签和后引号，结果应与一次输入相同
+    assert _fragments(_split(RESPONSE, size)) == EXPECTED
+
+
+def test_fragmenter_fence_split_across_chunks():
+    chunks = ["前言``", "`ss", "ml\n<speak>你好。", "</sp", "eak>`", "``后记"]
+    assert _fragments(chunks) == ["<speak>你好。"]
+
+
+def test_fragmenter_without_closing_fence():
+    assert _fragments(["```ssml\n<speak>第一句。第二", "句</speak>"]) == ["<speak>第一句。", "第二句</speak>"]
+
+
+def test_fragmenter_without_ssml_block():
+    fragmenter = SSMLFragmenter()
+    assert fragmenter.feed("没有代码块的回复。") == []
+    with pytest.raises(ValueError):
+        fragmenter.close()
+
+
+def _collect(
+    client,
+):
+    async def collect():
+        return [fragment async for fragment in async_llm_ssml_stream(messages=[], client=client)]
+
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 8, 1000])
+def test_ssml_stream_chunk_sizes(chunk_size):
+    client = FakeLLMClient([RESPONSE], chunk_size=chunk_size)
+    assert _collect(client) == EXPECTED
+    assert client.calls == 1
+
+
+def test_ssml_stream_retries_before_first_fragment():
+    client = FakeLLMClient([RuntimeError("connection reset"), RESPONSE], chunk_size=7)
+    assert _collect(client) == EXPECTED
+    assert client.calls == 2
@@ -0,0 +1,155 @@
+import base64
+import io
+import json
+import zipfile
+
+import pytest
+from PIL import Image
+
+from aiedu.utils.pptx import PPTXReader, pptx_content_generator, pptx_slides
+
+_NS = (
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+)
+_RELS_NS = 'xmlns="http://schemas.openxmlformats.org/package/2006/relationships"'
+_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+
+def _rels(*relationships):
+    return f"<Relationships {_RELS_NS}>" + "".join(relationships) + "</Relationships>"
+
+
+def _rel(id, type, target, external=False):
+    mode = ' TargetMode="External"' if external else ""
+    return f'<Relationship Id="{id}" Type="{_REL_TYPE}/{type}" Target="{target}"{mode}/>'
+
+
+def _sp(paragraphs, placeholder=None):
+    ph = f'<p:ph type="{placeholder}"/>' if placeholder else ""
+    return (
+        f"<p:sp><p:nvSpPr><p:cNvPr id=\"1\" name=\"\"/><p:cNvSpPr/><p:nvPr>{ph}</p:nvPr></p:nvSpPr>"
+        "<p:txBody><a:bodyPr/>" + "".join(f"<a:p>{p}</a:p>" for p in paragraphs) + "</p:txBody></p:sp>"
+    )
+
+
+def _slide(*shapes):
+    # nvGrpSpPr 和 grpSpPr 也是 spTree 的子元素，但不是形状
+    return (
+        f"<p:sld {_NS}><p:cSld><p:spTree><p:nvGrpSpPr/><p:grpSpPr/>"
+        + "".join(shapes)
+        + "</p:spTree></p:cSld></p:sld>"
+    )
+
+
+_PIC = '<p:pic><p:blipFill><a:blip r:embed="rImage"/></p:blipFill></p:pic>'
+_TABLE = (
+    "<p:graphicFrame><a:graphic><a:graphicData><a:tbl>"
+    "<a:tr><a:tc><a:txBody><a:p><a:r><a:t>阶段</a:t></a:r></a:p></a:txBody></a:tc>"
+    "<a:tc><a:txBody><a:p><a:r><a:t>时长</a:t></a:r></a:p></a:txBody></a:tc></a:tr>"
+    "<a:tr><a:tc><a:txBody><a:p><a:r><a:t>原型</a:t></a:r></a:p></a:txBody></a:tc>"
+    "<a:tc><a:txBody><a:p><a:r><a:t>2周</a:t></a:r></a:p></a:txBody></a:tc></a:tr>"
+    "</a:tbl></a:graphicData></a:graphic></p:graphicFrame>"
+)
+
+
+def _png(color):
+    image = io.BytesIO()
+    Image.new("RGB", (64, 32), color).save(image, format="PNG")
+    return image.getvalue()
+
+
+@pytest.fixture
+def deck(tmp_path):
+    """两页的课件，sldIdLst 中 slide2.xml 排在第一页"""
+    path = tmp_path / "deck.pptx"
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("_rels/.rels", _rels(_rel("rId1", "officeDocument", "ppt/presentation.xml")))
+        z.writestr(
+            "docProps/core.xml",
+            '<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+            'xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>软件工程</dc:title></cp:coreProperties>',
+        )
+        z.writestr(
+            "ppt/presentation.xml",
+            f'<p:presentation {_NS}><p:sldIdLst><p:sldId id="256" r:id="rId3"/><p:sldId id="257" r:id="rId2"/></p:sldIdLst></p:presentation>',
+        )
+        z.writestr(
+            "ppt/_rels/presentation.xml.rels",
+            _rels(_rel("rId2", "slide", "slides/slide1.xml"), _rel("rId3", "slide", "slides/slide2.xml")),
+        )
+        # 第一页: 标题、两段文本 (段内换行)、图片、表格和注释
+        z.writestr(
+            "ppt/slides/slide2.xml",
+            _slide(
+                _sp(["<a:r><a:t>快速开发</a:t></a:r>"], placeholder="title"),
+                _sp(["<a:r><a:t>迭代</a:t></a:r><a:br/><a:r><a:t>原型</a:t></a:r>", "<a:r><a:t>客户参与</a:t></a:r>"]),
+                _PIC,
+                _TABLE,
+            ),
+        )
+        z.writestr(
+            "ppt/slides/_rels/slide2.xml.rels",
+            _rels(
+                _rel("rImage", "image", "../media/image1.png"),
+                _rel("rNotes", "notesSlide", "../notesSlides/notesSlide1.xml"),
+                _rel("rLink", "hyperlink", "https://example.com", external=True),
+            ),
+        )
+        z.writestr(
+            "ppt/notesSlides/notesSlide1.xml",
+            _slide(
+                _sp(["<a:r><a:t>幻灯片图像</a:t></a:r>"], placeholder="sldImg"),
+                _sp(["<a:r><a:t>  讲到原型时举例  </a:t></a:r>"], placeholder="body"),
+            ),
+        )
+        # 第二页: 同一张图片，没有注释
+        z.writestr("ppt/slides/slide1.xml", _slide(_sp(["<a:r><a:t>总结</a:t></a:r>"], placeholder="ctrTitle"), _PIC))
+        z.writestr("ppt/slides/_rels/slide1.xml.rels", _rels(_rel("rImage", "image", "../media/image1.png")))
+        z.writestr("ppt/media/image1.png", _png("red"))
+    return str(path)
+
+
+FIRST = (
+    ["快速开发", "迭代\v原型\n客户参与"],
+    ["ppt/media/image1.png"],
+    [json.dumps([["阶段", "时长"], ["原型", "2周"]])],
+    "讲到原型时举例",
+)
+SECOND = (["总结"], ["ppt/media/image1.png"], [], "")
+
+
+def test_reader_text_tables_and_notes(deck):
+    with PPTXReader(deck) as reader:
+        assert len(reader) == 2
+        assert reader.slide_parts == ["ppt/slides/slide2.xml", "ppt/slides/slide1.xml"]
+        assert reader.slide(0) == FIRST
+        assert reader.slide(1) == SECOND
+        assert [reader.info(i).title for i in range(2)] == ["快速开发", "总结"]
+        assert reader.title() == "软件工程"
+        assert reader.read("ppt/media/image1.png") == _png("red")
+    assert pptx_slides(deck) == [FIRST, SECOND]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_content_generator_encodes_images(deck, workers):
+    contents = list(pptx_content_generator(deck, max_image_size=16, workers=workers))
+    assert [(texts, tables, note) for texts, _, tables, note in contents] == [
+        (FIRST[0], FIRST[2], FIRST[3]),
+        (SECOND[0], SECOND[2], SECOND[3]),
+    ]
+    (first,), (second,) = [images for _, images, _, _ in contents]
+    # 相同的图片只处理一次，各页得到同样的结果
+    assert first == second
+    prefix = "data:image/jpeg;base64,"
+    assert first.startswith(prefix)
+    image = Image.open(io.BytesIO(base64.b64decode(first[len(prefix) :])))
+    # 最长边缩小到 max_image_size
+    assert (image.format, image.size) == ("JPEG", (16, 8))
+
+
+def test_content_generator_close_early(deck):
+    contents = pptx_content_generator(deck, workers=2)
+    assert next(contents)[0] == FIRST[0]
+    contents.close()
@@ -0,0 +1,124 @@
+import asyncio
+import os
+
+import aiedu.llm
+from aiedu.main import answers_precomputer
+from aiedu.preparation import LecturePreparation
+from aiedu.retrieval import LectureIndex
+from aiedu.utils.limiter import AsyncRateLimiter, PriorityGate
+from fake_llm import FakeLLMClient
+
+
+def test_idle_waits_for_every_foreground_task():
+    async def run():
+        gate = PriorityGate()
+        await asyncio.wait_for(gate.idle(), 0.1)
+        log = []
+
+        async def foreground(name, seconds, error=None):
+            async with gate.foreground():
+                log.append(f"{name} start")
+                await asyncio.sleep(seconds)
+                log.append(f"{name} end")
+                if error is not None:
+                    raise error
+
+        tasks = [
+            asyncio.create_task(foreground("a", 0.02)),
+            asyncio.create_task(foreground("b", 0.05, RuntimeError("answer failed"))),
+        ]
+        await asyncio.sleep(0)
+        assert gate.busy
+        await gate.idle()
+        log.append("idle")
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return gate.busy, log
+
+    busy, log = asyncio.run(run())
+    # 前台任务出错时也会结束
+    assert not busy
+    assert log == ["a start", "b start", "a end", "b end", "idle"]
+
+
+class RecordingLLMClient(FakeLLMClient):
+    def __init__(self, log):
+        super().__init__(
+            [
+                "```questions\n1. 什么是快速开发？\n2. 为什么要做设计？\n```",
+                "```ssml<speak>回答一。</speak>```",
+                "```ssml<speak>回答二。</speak>```",
+            ]
+        )
+        self.log = log
+
+    def _create(self, model, messages, stream=False, **kwargs):
+        self.log.append("llm")
+        return super()._create(model, messages, stream, **kwargs)
+
+
+class ForegroundOnFirstAudioTTS:
+    """合成第一个回答时开始一个前台任务 (例如学生提问)，持续 seconds 秒"""
+
+    def __init__(self, gate, log, seconds=0.1):
+        self.gate = gate
+        self.log = log
+        self.seconds = seconds
+        self.calls = 0
+        self.foreground = None
+
+    async def audio(self, ssml):
+        self.log.append("tts")
+        self.calls += 1
+        if self.calls == 1:
+            # 在这一步结束前进入前台，下一步之前一定能看到
+            context = self.gate.foreground()
+            await context.__aenter__()
+            self.log.append("foreground start")
+
+            async def finish():
+                await asyncio.sleep(self.seconds)
+                self.log.append("foreground end")
+                await context.__aexit__(None, None, None)
+
+            self.foreground = asyncio.create_task(finish())
+
+
+def test_precompute_yields_to_foreground(monkeypatch, tmp_path):
+    log = []
+    client = RecordingLLMClient(log)
+    monkeypatch.setattr(aiedu.llm, "llm_client", lambda: client)
+
+    async def prepare(on_slide):
+        return ["<speak>快速开发。</speak>", "<speak>设计。</speak>"], "<speak>总结。</speak>"
+
+    async def run():
+        gate = PriorityGate()
+        tts = ForegroundOnFirstAudioTTS(gate, log)
+
+        async def lecture():
+            # 讲稿生成后还在进行的前台任务
+            async with gate.foreground():
+                log.append("lecture start")
+                await asyncio.sleep(0.1)
+                log.append("lecture end")
+
+        foreground = asyncio.create_task(lecture())
+        await asyncio.sleep(0)
+        precompute = answers_precomputer(tts, str(tmp_path / "deck.json"), 2, gate, AsyncRateLimiter(max_in_flight=4))
+        preparation = LecturePreparation(prepare, LectureIndex.from_lectures, precompute)
+        await preparation.result()
+        await asyncio.wait_for(preparation.precompute_task, 5)
+        await foreground
+        return preparation, tts
+
+    preparation, tts = asyncio.run(run())
+
+    # 前台任务期间后台没有发出任何请求
+    for start, end in [("lecture start", "lecture end"), ("foreground start", "foreground end")]:
+        assert log[log.index(start) + 1] == end
+    assert log.index("lecture end") < log.index("llm")
+    # 两页各两个问题都合成了回答 (相同的请求命中回答的缓存，不再请求LLM)
+    assert tts.calls == 4
+    assert os.path.exists(tmp_path / "deck.answers.json")
+    answer = asyncio.run(preparation.answers.get(0, "老师，什么是快速开发呢"))
+    assert answer.fragments == ["<speak>回答一。</speak>"]
@@ -0,0 +1,156 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from aiedu.utils.prefetch import BufferedStream, async_prefetch
+
+
+async def _items(n, log=None):
+    for i in range(n):
+        if log is not None:
+            log.append(("item", i))
+        yield i
+
+
+def test_prefetch_keeps_order_when_preparation_finishes_out_of_order():
+    async def prepare(i):
+        # 后面的项先准备好
+        await asyncio.sleep(0.01 * (5 - i))
+        return i * 10
+
+    async def run():
+        return [result async for result in async_prefetch(_items(5), prepare, lookahead=4)]
+
+    assert asyncio.run(run()) == [0, 10, 20, 30, 40]
+
+
+def test_prefetch_prepares_at_most_lookahead_ahead():
+    started = []
+
+    async def prepare(i):
+        started.append(i)
+        return i
+
+    async def run():
+        seen = []
+        async with contextlib.aclosing(async_prefetch(_items(10), prepare, lookahead=2)) as results:
+            async for result in results:
+                await asyncio.sleep(0.01)
+                # 使用第 result 项时，最多已经开始准备到 result + lookahead
+                seen.append((result, max(started)))
+        return seen
+
+    assert all(latest <= result + 2 for result, latest in asyncio.run(run()))
+
+
+def test_prefetch_close_cancels_pending_and_discards_prepared():
+    cancelled, discarded = [], []
+
+    async def prepare(i):
+        try:
+            # 第 1 项很快准备好，第 2 项还在准备
+            await asyncio.sleep(0 if i < 2 else 10)
+        except asyncio.CancelledError:
+            cancelled.append(i)
+            raise
+        return i
+
+    async def run():
+        results = async_prefetch(_items(10), prepare, lookahead=2, discard=discarded.append)
+        first = await results.__anext__()
+        await asyncio.sleep(0.01)
+        await results.aclose()
+        await asyncio.sleep(0)
+        return first
+
+    assert asyncio.run(run()) == 0
+    assert discarded == [1]
+    assert cancelled == [2]
+
+
+def test_prefetch_propagates_errors():
+    async def failing_items():
+        yield 0
+        raise RuntimeError("read failed")
+
+    async def prepare(i):
+        if i == 3:
+            raise ValueError("prepare failed")
+        return i
+
+    async def collect(items):
+        results = []
+        async for result in async_prefetch(items, prepare):
+            results.append(result)
+        return results
+
+    results = []
+
+    async def run_failing_items():
+        async for result in async_prefetch(failing_items(), prepare):
+            results.append(result)
+
+    with pytest.raises(RuntimeError, match="read failed"):
+        asyncio.run(run_failing_items())
+    # 出错前的结果都已产出
+    assert results == [0]
+    with pytest.raises(ValueError, match="prepare failed"):
+        asyncio.run(collect(_items(5)))
+
+
+def test_buffered_stream_reads_ahead_in_order():
+    log = []
+
+    async def run():
+        stream = BufferedStream(_items(5, log))
+        # 还没有开始读取时已经在后台缓存
+        await asyncio.sleep(0.01)
+        buffered = len(log)
+        return buffered, [chunk async for chunk in stream]
+
+    buffered, chunks = asyncio.run(run())
+    assert buffered == 5
+    assert chunks == [0, 1, 2, 3, 4]
+
+
+def test_buffered_stream_propagates_errors_after_buffered_chunks():
+    async def chunks():
+        yield b"a"
+        yield b"b"
+        raise ConnectionError("tts failed")
+
+    async def run():
+        received = []
+        with pytest.raises(ConnectionError):
+            async for chunk in BufferedStream(chunks()):
+                received.append(chunk)
+        return received
+
+    assert asyncio.run(run()) == [b"a", b"b"]
+
+
+def test_buffered_stream_cancel_stops_reading():
+    log = []
+
+    async def slow_chunks():
+        try:
+            for i in range(100):
+                log.append(i)
+                await asyncio.sleep(0.01)
+                yield i
+        except asyncio.CancelledError:
+            log.append("cancelled")
+            raise
+
+    async def run():
+        stream = BufferedStream(slow_chunks())
+        async for chunk in stream:
+            if chunk == 2:
+                break
+        # 使用者提前退出时停止后台读取
+        stream.cancel()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert log[-1] == "cancelled" and len(log) < 10
@@ -0,0 +1,126 @@
+import asyncio
+import os
+
+import pytest
+
+from aiedu.preparation import LecturePreparations
+from aiedu.retrieval import LectureIndex
+
+
+def _prepare(calls, lectures=("<speak>第一页。</speak>", "<speak>第二页。</speak>"), delay=0.01, error=None):
+    async def prepare(on_slide):
+        calls.append(1)
+        for index, ssml in enumerate(lectures):
+            await asyncio.sleep(delay)
+            on_slide(index, ssml)
+        if error is not None:
+            raise error
+        return list(lectures), "<speak>总结。</speak>"
+
+    return prepare
+
+
+def _build_index(lectures, conclusion):
+    return LectureIndex.from_lectures(lectures, conclusion)
+
+
+@pytest.fixture
+def deck(tmp_path):
+    path = tmp_path / "deck.pptx"
+    path.write_bytes(b"slides")
+    return str(path)
+
+
+def test_concurrent_connections_share_one_preparation(deck):
+    calls = []
+
+    async def run():
+        preparations = LecturePreparations()
+
+        async def connection():
+            preparation = preparations.get(LecturePreparations.key(deck, 8), _prepare(calls), _build_index)
+            return preparation, [ssml async for ssml in preparation.lectures()], await preparation.result()
+
+        return await asyncio.gather(*[connection() for _ in range(3)])
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert len({id(preparation) for preparation, _, _ in results}) == 1
+    for _, lectures, (ssml_lectures, conclusion) in results:
+        assert lectures == ssml_lectures == ["<speak>第一页。</speak>", "<speak>第二页。</speak>"]
+        assert conclusion == "<speak>总结。</speak>"
+
+
+def test_key_changes_with_mtime_size_and_options(deck, tmp_path):
+    key = LecturePreparations.key(deck, 8)
+    # 相对路径和绝对路径是同一份课件
+    assert LecturePreparations.key(os.path.relpath(deck), 8) == key
+    assert LecturePreparations.key(deck, 4) != key
+
+    stat = os.stat(deck)
+    os.utime(deck, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    touched = LecturePreparations.key(deck, 8)
+    assert touched != key
+
+    # 大小变化，即使修改时间恢复原样
+    with open(deck, "ab") as f:
+        f.write(b"more")
+    os.utime(deck, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert LecturePreparations.key(deck, 8) not in (key, touched)
+
+
+def test_changed_file_is_prepared_again(deck):
+    calls = []
+
+    async def run():
+        preparations = LecturePreparations()
+        first = preparations.get(LecturePreparations.key(deck), _prepare(calls), _build_index)
+        await first.result()
+        assert preparations.get(LecturePreparations.key(deck), _prepare(calls), _build_index) is first
+        with open(deck, "ab") as f:
+            f.write(b"more")
+        second = preparations.get(LecturePreparations.key(deck), _prepare(calls), _build_index)
+        await second.result()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is not second
+    assert len(calls) == 2
+
+
+def test_failed_preparation_is_not_reused(deck):
+    calls = []
+
+    async def run():
+        preparations = LecturePreparations()
+        key = LecturePreparations.key(deck)
+        failed = preparations.get(key, _prepare(calls, error=RuntimeError("llm failed")), _build_index)
+        with pytest.raises(RuntimeError):
+            await failed.result()
+        # 等待中的连接也收到异常
+        with pytest.raises(RuntimeError):
+            async for _ in failed.lectures():
+                pass
+        retried = preparations.get(key, _prepare(calls), _build_index)
+        return failed, retried, await retried.result()
+
+    failed, retried, (lectures, _) = asyncio.run(run())
+    assert retried is not failed and failed.failed
+    assert len(calls) == 2 and len(lectures) == 2
+
+
+def test_cancelled_waiter_does_not_cancel_preparation(deck):
+    calls = []
+
+    async def run():
+        preparations = LecturePreparations()
+        key = LecturePreparations.key(deck)
+        preparation = preparations.get(key, _prepare(calls, delay=0.05), _build_index)
+        waiter = asyncio.ensure_future(preparation.result())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        lectures, _ = await preparations.get(key, _prepare(calls), _build_index).result()
+        return lectures
+
+    assert len(asyncio.run(run())) == 2
+    assert len(calls) == 1
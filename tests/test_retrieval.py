@@ -0,0 +1,18 @@
+from aiedu.retrieval import LectureIndex, LecturePassage
+
+PASSAGES = [
+    LecturePassage(0, "lecture", "快速开发强调迭代和快速开发原型。"),
+    LecturePassage(1, "lecture", "快速开发需要客户参与。"),
+    LecturePassage(2, "lecture", "测试保证软件质量。"),
+]
+
+
+def test_contexts_slide_boost():
+    index = LectureIndex(PASSAGES)
+    assert index.contexts("什么是快速开发", k=1, slide=1, slide_boost=1.0) == ["[第1页] 快速开发强调迭代和快速开发原型。"]
+    assert index.contexts("什么是快速开发", k=1, slide=1, slide_boost=10.0) == ["[第2页] 快速开发需要客户参与。"]
+
+
+def test_contexts_fall_back_to_current_slide():
+    index = LectureIndex(PASSAGES)
+    assert index.contexts("完全无关", k=2, slide=2) == ["[第3页] 测试保证软件质量。"]
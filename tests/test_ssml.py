@@ -0,0 +1,36 @@
+import pytest
+
+from aiedu.utils.audio import _MP3_FRAME_MS, mp3_duration_ms, mp3_silence
+from aiedu.utils.ssml import ssml_to_segments
+
+
+@pytest.mark.parametrize(
+    "ssml, expected",
+    [
+        # 行内标签不切分句子
+        ("<speak>我们今天<emphasis>非常</emphasis>高兴。</speak>", [("我们今天非常高兴。", 0)]),
+        (
+            '<speak><prosody rate="+10%">先说</prosody>第一点；<say-as interpret-as="cardinal">2</say-as>是第二点。</speak>',
+            [("先说第一点；", 0), ("2是第二点。", 0)],
+        ),
+        # <break> 切分，停顿归前一段，连续的停顿累加
+        (
+            '<speak>第一句<break time="500ms"/>第二句<break time="1s"/><break time="200ms"/>第三句</speak>',
+            [("第一句", 500), ("第二句", 1200), ("第三句", 0)],
+        ),
+        # 开头的停顿
+        ('<speak><break time="300ms"/>你好！</speak>', [("", 300), ("你好！", 0)]),
+        # 句末的引号和括号留在句子中，只有标点的片段跳过
+        ("<speak>他说：“很好。”然后呢？……</speak>", [("他说：“很好。”", 0), ("然后呢？……", 0)]),
+        ("<speak>  </speak>", []),
+    ],
+)
+def test_ssml_to_segments(ssml, expected):
+    assert ssml_to_segments(ssml) == expected
+
+
+@pytest.mark.parametrize("duration_ms", [0, 24, 100, 500, 1000])
+def test_mp3_silence_duration(duration_ms):
+    # 按 24ms 一帧取整
+    assert mp3_duration_ms(mp3_silence(duration_ms)) == pytest.approx(round(duration_ms / _MP3_FRAME_MS) * _MP3_FRAME_MS)
+
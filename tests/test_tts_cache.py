@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from aiedu.tts.base import TTSAudio, TTSBoundary
+from aiedu.tts.cache import TTSCache
+
+
+def _audio(
+    data: bytes,
+) -> TTSAudio:
+    return TTSAudio(data=data, format="mp3", boundaries=[TTSBoundary(0, 100, "你好")])
+
+
+@pytest.mark.parametrize("meta", [b"not json", b"[]", b'{"format": "mp3"}', b'{"format": "mp3", "boundaries": [1]}'])
+def test_corrupt_entry_is_a_miss(tmp_path, meta):
+    cache = TTSCache(str(tmp_path), memory_bytes=0)
+    key = TTSCache.key("<speak>你好</speak>", "voice", "backend", "mp3")
+    path = cache._path(key)
+    cache._disk_write(key, _audio(b"old"))
+    with open(path, "wb") as f:
+        f.write(meta + b"\n" + b"audio")
+
+    async def create():
+        return _audio(b"new")
+
+    async def run():
+        assert await cache.get(key) is None
+        return await cache.get_or_create(key, create)
+
+    assert asyncio.run(run()).data == b"new"
+    assert cache._disk_read(key).data == b"new"
+
+
+def test_overwrite_does_not_double_count_disk_size(tmp_path):
+    cache = TTSCache(str(tmp_path))
+    key = TTSCache.key("<speak>你好</speak>", "voice", "backend", "mp3")
+    cache._disk_write(TTSCache.key("other", "voice", "backend", "mp3"), _audio(b"x" * 10))
+    for size in (100, 1000, 10):
+        cache._disk_write(key, _audio(b"x" * size))
+    assert cache._disk_size == sum(size for _, size, _ in cache._disk_entries())
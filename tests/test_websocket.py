@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+from aiedu.utils.websocket import FramedWebSocket, websocket_frame, websocket_frame_parts, websocket_unframe
+
+
+class FakeWebSocket:
+    """按顺序产出客户端消息，记录发送的帧"""
+
+    def __init__(self):
+        self.messages: asyncio.Queue = asyncio.Queue()
+        self.sent = []
+        self.raw = []
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.messages.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    async def send(self, frame):
+        # 多块时为分片消息
+        self.raw.append(frame)
+        self.sent.append(websocket_unframe(frame if isinstance(frame, bytes) else b"".join(frame)))
+
+
+def test_frame_roundtrip():
+    assert websocket_unframe(websocket_frame({"type": "audio", "text": "你好"}, b"\x00\x01")) == (
+        {"type": "audio", "text": "你好"},
+        b"\x00\x01",
+    )
+
+
+def test_send_data_parts_without_joining():
+    envelope, audio = b"\x01\x02", b"\xff\xfb" * 1000
+
+    async def run():
+        websocket = FakeWebSocket()
+        async with FramedWebSocket(websocket) as connection:
+            await connection.send({"type": "audio"}, [envelope, audio])
+            await connection.send({"type": "end"}, [b""])
+        return websocket
+
+    websocket = asyncio.run(run())
+    assert websocket.sent == [({"type": "audio", "id": 0}, envelope + audio), ({"type": "end", "id": 1}, b"")]
+    # 音频原样作为一个分片发送，没有复制
+    assert websocket.raw[0][2] is audio
+    assert websocket.raw[1] == websocket_frame_parts({"type": "end", "id": 1})[0]
+
+
+def test_invalid_messages_are_dropped(capsys):
+    async def run():
+        websocket = FakeWebSocket()
+        async with FramedWebSocket(websocket, credits=1) as connection:
+            await connection.send({"type": "audio"})
+            for message in [
+                "not json",
+                "[1, 2]",
+                b"\x00\x00\x00\x10{}",
+                b"\x00\x00",
+                json.dumps({"type": "played"}),
+                json.dumps({"type": "played", "id": "0"}),
+                json.dumps({"type": "credit", "credits": "many"}),
+                json.dumps({"type": "credit", "credits": -5}),
+                json.dumps({"type": "credit", "credits": True}),
+                json.dumps({"type": "question", "text": "什么是快速开发"}),
+                json.dumps({"type": "credit", "credits": 1}),
+                json.dumps({"type": "played", "id": 0}),
+            ]:
+                websocket.messages.put_nowait(message)
+            # 连接仍然可用: 消息进入 inbox，信用和播放完成正常处理
+            question = await asyncio.wait_for(connection.inbox.get(), 1)
+            await asyncio.wait_for(connection.played(0), 1)
+            await asyncio.wait_for(connection.send({"type": "audio"}), 1)
+            return question, connection.credits
+
+    question, credits = asyncio.run(run())
+    assert question == ({"type": "question", "text": "什么是快速开发"}, b"")
+    assert credits == 0
+    assert capsys.readouterr().err.count("[websocket] dropping invalid message") == 9
+
+
+def test_unsolicited_played_is_bounded(capsys):
+    async def run():
+        websocket = FakeWebSocket()
+        async with FramedWebSocket(websocket, credits=200) as connection:
+            connection.max_unclaimed_played = 4
+            for _ in range(100):
+                await connection.send({"type": "audio"})
+            waiting = asyncio.ensure_future(connection.played(0))
+            await asyncio.sleep(0)
+            # 未发送的 id 直接丢弃
+            websocket.messages.put_nowait(json.dumps({"type": "played", "id": 100}))
+            for id in range(99, 0, -1):
+                websocket.messages.put_nowait(json.dumps({"type": "played", "id": id}))
+            websocket.messages.put_nowait(json.dumps({"type": "played", "id": 0}))
+            await asyncio.wait_for(waiting, 1)
+            # 先回应后等待的 id 仍然可以取到
+            await asyncio.wait_for(connection.played(1), 1)
+            return sorted(connection._played)
+
+    assert asyncio.run(run()) == [2, 3, 4]
+    assert "unknown id" in capsys.readouterr().err